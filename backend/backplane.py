@@ -0,0 +1,421 @@
+import asyncio
+import json
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from urllib.parse import urlparse
+
+
+# Callback invoked with (room_id, message) for every message delivered to a room
+MessageHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+# Callback invoked after messages may have been lost, e.g. on reconnecting
+ReconnectHandler = Callable[[], Awaitable[None]]
+
+# Callback invoked with every message sent directly to this worker
+DirectHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class Backplane(ABC):
+    """
+    Pub/sub channel between the workers serving collaboration rooms.
+
+    Every message for a room is published once and delivered, in publish
+    order, to every worker subscribed to that room, including the worker
+    that published it. Messages can also be sent to a single worker by its
+    worker_id, e.g. to answer a request it published; they are delivered
+    to on_direct. Subclasses implement publish, send, subscribe and
+    unsubscribe.
+    """
+
+    # Whether other workers may share rooms with this one
+    distributed = False
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self._handler: Optional[MessageHandler] = None
+        self._on_reconnect: Optional[ReconnectHandler] = None
+        # Called with each message sent to this worker with send
+        self.on_direct: Optional[DirectHandler] = None
+
+    async def start(self, handler: MessageHandler, on_reconnect: Optional[ReconnectHandler] = None):
+        """
+        Start delivering messages.
+
+        Args:
+            handler: Coroutine called with (room_id, message) for each message
+            on_reconnect: Coroutine called once delivery resumes after an
+                outage during which messages may have been lost
+        """
+        self._handler = handler
+        self._on_reconnect = on_reconnect
+
+    @abstractmethod
+    async def publish(self, room_id: str, message: Dict[str, Any]):
+        """
+        Publish a message to every worker subscribed to a room.
+
+        Args:
+            room_id: The room to publish to
+            message: The JSON-serializable message
+        """
+
+    @abstractmethod
+    async def send(self, worker_id: str, message: Dict[str, Any]):
+        """
+        Send a message to one worker.
+
+        Args:
+            worker_id: The worker_id of the recipient
+            message: The JSON-serializable message
+        """
+
+    @abstractmethod
+    async def subscribe(self, room_id: str):
+        """
+        Start receiving the messages of a room.
+
+        Args:
+            room_id: The room to subscribe to
+        """
+
+    @abstractmethod
+    async def unsubscribe(self, room_id: str):
+        """
+        Stop receiving the messages of a room.
+
+        Args:
+            room_id: The room to unsubscribe from
+        """
+
+    async def close(self):
+        """
+        Release any connections held by the backplane.
+        """
+
+
+class InProcessBackplane(Backplane):
+    """
+    Backplane for a single worker: published messages are handled directly.
+    """
+
+    async def publish(self, room_id: str, message: Dict[str, Any]):
+        if self._handler is not None:
+            await self._handler(room_id, message)
+
+    async def send(self, worker_id: str, message: Dict[str, Any]):
+        # There are no other workers
+        if worker_id == self.worker_id and self.on_direct is not None:
+            await self.on_direct(message)
+
+    async def subscribe(self, room_id: str):
+        # Every room is delivered to the only worker
+        pass
+
+    async def unsubscribe(self, room_id: str):
+        pass
+
+
+class RedisProtocolError(Exception):
+    """
+    Raised when the Redis server replies with an error or an unexpected reply.
+    """
+
+
+class _RedisConnection:
+    """
+    Minimal Redis (RESP2) client connection, enough for AUTH, PUBLISH and
+    SUBSCRIBE. Works with Redis and with any server speaking the protocol.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int, password: Optional[str], username: Optional[str]) -> "_RedisConnection":
+        reader, writer = await asyncio.open_connection(host, port)
+        connection = cls(reader, writer)
+        if password:
+            if username:
+                await connection.execute("AUTH", username, password)
+            else:
+                await connection.execute("AUTH", password)
+        return connection
+
+    def send(self, *args: Any):
+        """
+        Write a command without waiting for its reply.
+        """
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(f"${len(data)}\r\n".encode())
+            parts.append(data + b"\r\n")
+        self.writer.write(b"".join(parts))
+
+    async def execute(self, *args: Any) -> Any:
+        """
+        Send a command and wait for its reply.
+        """
+        self.send(*args)
+        await self.writer.drain()
+        return await self.read_reply()
+
+    async def read_reply(self) -> Any:
+        """
+        Read one RESP reply.
+
+        Raises:
+            RedisProtocolError: On an error reply or malformed data
+            ConnectionError: If the server closed the connection
+        """
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode("utf-8")
+        if prefix == b"-":
+            raise RedisProtocolError(body.decode("utf-8"))
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length == -1:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(body)
+            if length == -1:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise RedisProtocolError(f"Unexpected reply from Redis: {line!r}")
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+class RedisBackplane(Backplane):
+    """
+    Backplane over Redis pub/sub, one channel per room.
+
+    Uses one connection for publishing and one for subscriptions. Redis
+    delivers the messages of a channel to every subscriber in publish
+    order, which keeps every worker's view of a room consistent. If the
+    subscription connection drops, it is re-established and every room is
+    re-subscribed. Messages published in the meantime are lost, as usual
+    with Redis pub/sub, so on_reconnect is then called to let the worker
+    catch up.
+    """
+
+    distributed = True
+
+    # Delay before reconnecting after the subscription connection fails
+    RECONNECT_DELAY = 1.0
+
+    # How long to wait for Redis to confirm a subscription
+    SUBSCRIBE_TIMEOUT = 5.0
+
+    def __init__(self, url: str, channel_prefix: str = "smartslides:"):
+        super().__init__()
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported backplane URL {url!r}. Expected redis://host:port")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.username = parsed.username or None
+        self.password = parsed.password or None
+        self.channel_prefix = channel_prefix
+        self._rooms: Set[str] = set()
+        self._publisher: Optional[_RedisConnection] = None
+        self._publish_lock = asyncio.Lock()
+        self._subscriber: Optional[_RedisConnection] = None
+        self._reader_task: Optional["asyncio.Task"] = None
+        self._connected = asyncio.Event()
+        self._pending_subscriptions: Dict[str, "asyncio.Future"] = {}
+        # Channels re-subscribed after a reconnect and not confirmed yet
+        self._resubscribing: Set[str] = set()
+
+    def _channel(self, room_id: str) -> str:
+        return f"{self.channel_prefix}room:{room_id}"
+
+    def _worker_channel(self, worker_id: str) -> str:
+        return f"{self.channel_prefix}worker:{worker_id}"
+
+    async def start(self, handler: MessageHandler, on_reconnect: Optional[ReconnectHandler] = None):
+        await super().start(handler, on_reconnect)
+        self._subscriber = await self._connect()
+        # Every worker listens on its own channel for direct messages
+        await self._subscriber.execute("SUBSCRIBE", self._worker_channel(self.worker_id))
+        self._connected.set()
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def _connect(self) -> _RedisConnection:
+        return await _RedisConnection.open(self.host, self.port, self.password, self.username)
+
+    async def publish(self, room_id: str, message: Dict[str, Any]):
+        await self._publish(self._channel(room_id), message)
+
+    async def send(self, worker_id: str, message: Dict[str, Any]):
+        await self._publish(self._worker_channel(worker_id), message)
+
+    async def _publish(self, channel: str, message: Dict[str, Any]):
+        data = json.dumps(message)
+        async with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = await self._connect()
+                    await self._publisher.execute("PUBLISH", channel, data)
+                    return
+                except (ConnectionError, OSError):
+                    # Reconnect once, then give up
+                    self._publisher = None
+                    if attempt:
+                        raise
+
+    async def subscribe(self, room_id: str):
+        if room_id in self._rooms:
+            return
+        self._rooms.add(room_id)
+        if self._subscriber is not None and self._connected.is_set():
+            channel = self._channel(room_id)
+            confirmed = asyncio.get_running_loop().create_future()
+            self._pending_subscriptions[channel] = confirmed
+            self._subscriber.send("SUBSCRIBE", channel)
+            await self._subscriber.writer.drain()
+            # Wait until Redis confirms, so messages published from now on
+            # (including our own) are delivered to us
+            try:
+                await asyncio.wait_for(confirmed, self.SUBSCRIBE_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._pending_subscriptions.pop(channel, None)
+
+    async def unsubscribe(self, room_id: str):
+        if room_id not in self._rooms:
+            return
+        self._rooms.discard(room_id)
+        if self._subscriber is not None and self._connected.is_set():
+            self._subscriber.send("UNSUBSCRIBE", self._channel(room_id))
+            await self._subscriber.writer.drain()
+
+    async def _read_loop(self):
+        """
+        Read pushed messages and hand them to the handler, reconnecting on failure.
+        """
+        prefix = f"{self.channel_prefix}room:"
+        worker_channel = self._worker_channel(self.worker_id)
+        while True:
+            try:
+                reply = await self._subscriber.read_reply()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._connected.clear()
+                await self._reconnect()
+                continue
+
+            if not isinstance(reply, list) or len(reply) != 3:
+                continue
+
+            if reply[0] == b"subscribe":
+                channel = reply[1].decode("utf-8")
+                confirmed = self._pending_subscriptions.get(channel)
+                if confirmed is not None and not confirmed.done():
+                    confirmed.set_result(None)
+                if channel in self._resubscribing:
+                    self._resubscribing.discard(channel)
+                    if not self._resubscribing:
+                        # Every room is delivered again
+                        self._notify_reconnect()
+                continue
+
+            if reply[0] != b"message":
+                # Unsubscribe confirmations
+                continue
+
+            channel = reply[1].decode("utf-8")
+            if channel != worker_channel and not channel.startswith(prefix):
+                continue
+            try:
+                message = json.loads(reply[2])
+            except (ValueError, TypeError):
+                continue
+
+            try:
+                if channel == worker_channel:
+                    if self.on_direct is not None:
+                        await self.on_direct(message)
+                else:
+                    await self._handler(channel[len(prefix):], message)
+            except Exception:
+                # A bad message must not stop delivery for every room
+                continue
+
+    async def _reconnect(self):
+        """
+        Re-establish the subscription connection and re-subscribe every room.
+        """
+        if self._subscriber is not None:
+            await self._subscriber.close()
+        while True:
+            await asyncio.sleep(self.RECONNECT_DELAY)
+            try:
+                self._subscriber = await self._connect()
+                channels = [self._worker_channel(self.worker_id)]
+                channels += [self._channel(room_id) for room_id in self._rooms]
+                self._resubscribing = set(channels)
+                self._subscriber.send("SUBSCRIBE", *channels)
+                await self._subscriber.writer.drain()
+                self._connected.set()
+                return
+            except (ConnectionError, OSError):
+                continue
+
+    def _notify_reconnect(self):
+        """
+        Let the worker catch up on the messages lost while disconnected.
+        """
+        if self._on_reconnect is not None:
+            asyncio.ensure_future(self._on_reconnect())
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        for connection in (self._subscriber, self._publisher):
+            if connection is not None:
+                await connection.close()
+        self._subscriber = None
+        self._publisher = None
+
+
+def create_backplane(url: Optional[str], channel_prefix: str = "smartslides:") -> Backplane:
+    """
+    Create the backplane configured by BACKPLANE_URL.
+
+    Args:
+        url: A redis:// URL, or None for a single-process backplane
+        channel_prefix: Prefix for the pub/sub channel names
+
+    Returns:
+        The backplane instance
+
+    Raises:
+        ValueError: If the URL scheme is not supported
+    """
+    if not url:
+        return InProcessBackplane()
+    return RedisBackplane(url, channel_prefix)
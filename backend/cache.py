@@ -0,0 +1,469 @@
+import asyncio
+import copy
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from backend.semantic_cache import SemanticIndex
+from backend import metrics
+
+
+# Cache lookup outcomes reported to callers
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_COALESCED = "coalesced"
+CACHE_BYPASS = "bypass"
+CACHE_SEMANTIC = "semantic"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a prompt so trivially different spellings share a cache entry.
+
+    Lowercases the prompt, collapses runs of whitespace and drops trailing
+    punctuation, so "Create a presentation about AI." and
+    "create a  presentation about ai" map to the same key.
+
+    Args:
+        prompt: The raw user prompt
+
+    Returns:
+        The normalized prompt
+    """
+    normalized = re.sub(r"\s+", " ", prompt.strip().lower())
+    return normalized.rstrip(" .!?;,")
+
+
+def make_cache_key(prompt: str, model: str, temperature: float, system_prompt: str) -> str:
+    """
+    Build the cache key for a generation request.
+
+    Args:
+        prompt: The user prompt (normalized before hashing)
+        model: The model name used for generation
+        temperature: The sampling temperature used for generation
+        system_prompt: The system prompt sent with the request
+
+    Returns:
+        A hex digest identifying the request
+    """
+    key_material = json.dumps(
+        [normalize_prompt(prompt), model, temperature, system_prompt],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+class LRUTTLCache:
+    """
+    In-memory cache with least-recently-used and time-to-live eviction.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a value, refreshing its recency.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            The cached value, or None if it is missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        """
+        Store a value, evicting the least recently used entry if full.
+
+        Args:
+            key: The cache key
+            value: The value to store
+        """
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheStore:
+    """
+    On-disk cache tier backed by SQLite so cached decks survive restarts.
+
+    Calls are blocking; PromptCache runs them in the default executor.
+    """
+
+    # Prune expired rows once every this many writes
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS prompt_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._connection.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a value stored on disk.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            The decoded value, or None if it is missing or expired
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM prompt_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        value, created_at = row
+        if created_at + self.ttl_seconds <= time.time():
+            return None
+
+        return json.loads(value)
+
+    def set(self, key: str, value: Any):
+        """
+        Store a JSON-serializable value on disk.
+
+        Args:
+            key: The cache key
+            value: The value to store
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO prompt_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_INTERVAL == 0:
+                self._connection.execute(
+                    "DELETE FROM prompt_cache WHERE created_at <= ?",
+                    (now - self.ttl_seconds,),
+                )
+            self._connection.commit()
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+
+class PromptCache:
+    """
+    Result cache for slide generation with single-flight deduplication.
+
+    Lookups go to the in-memory LRU first, then to the optional SQLite
+    tier, then to the optional semantic tier, which serves the deck of an
+    earlier prompt worded differently but similar enough. Concurrent misses for
+    the same key share one upstream call, which is cancelled if every
+    request waiting on it is cancelled.
+
+    Results come with the similarity between the prompt and the one the
+    deck was generated for: 1.0 for exact hits, the score for semantic
+    hits and None when the deck was not served from the cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        db_path: Optional[str] = None,
+        semantic: Optional[SemanticIndex] = None,
+    ):
+        self.memory = LRUTTLCache(max_entries, ttl_seconds)
+        self.disk = SQLiteCacheStore(db_path, ttl_seconds) if db_path else None
+        self.semantic = semantic
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+        self._waiters: Dict["asyncio.Future", int] = {}
+        self.stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "semantic_hits": 0,
+            "bypassed": 0,
+            "errors": 0,
+            "abandoned": 0,
+        }
+
+    async def get_or_generate(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[dict]],
+        bypass: bool = False,
+        prompt: Optional[str] = None,
+    ) -> Tuple[dict, str, Optional[float]]:
+        """
+        Return the cached result for a key, generating it on a miss.
+
+        Args:
+            key: The cache key (see make_cache_key)
+            generate: Coroutine factory producing a fresh result
+            bypass: Skip the lookup and force a fresh generation; the result
+                still refreshes the cache
+            prompt: The prompt the key was built from, to look up and index
+                in the semantic tier; without it only exact keys match
+
+        Returns:
+            A tuple of (result, outcome, similarity) where outcome is one of
+            CACHE_HIT, CACHE_SEMANTIC, CACHE_MISS, CACHE_COALESCED or
+            CACHE_BYPASS
+
+        Raises:
+            Exception: Whatever the generate call raised; errors are not cached
+        """
+        if bypass:
+            self.stats["bypassed"] += 1
+            result = await generate()
+            await self._store(key, result, prompt)
+            return copy.deepcopy(result), CACHE_BYPASS, None
+
+        cached = self.memory.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            self.stats["memory_hits"] += 1
+            return copy.deepcopy(cached), CACHE_HIT, 1.0
+
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.stats["coalesced"] += 1
+                loaded = await self._wait(key, inflight)
+                if loaded is None:
+                    # Every other request waiting on the load was cancelled
+                    # before this one joined it; start a fresh load
+                    continue
+                result, _, _ = loaded
+                return copy.deepcopy(result), CACHE_COALESCED, None
+
+            # Run the load as its own task so that a cancelled leader request
+            # does not cancel the followers waiting on the same key
+            task = asyncio.ensure_future(self._load(key, generate, prompt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+            loaded = await self._wait(key, task)
+            if loaded is not None:
+                result, outcome, similarity = loaded
+                return copy.deepcopy(result), outcome, similarity
+
+    async def _wait(self, key: str, task: "asyncio.Future") -> Optional[Tuple[dict, str, Optional[float]]]:
+        """
+        Wait for a shared load. When the last waiter is cancelled (e.g. its
+        job was abandoned), the load is cancelled too so that nobody keeps
+        paying for an upstream call whose result would only be cached.
+
+        Returns:
+            The load's result, or None if the load was cancelled while this
+            request was still waiting on it
+        """
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        cancelled = False
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                # The load was cancelled, not this request
+                return None
+            cancelled = True
+            raise
+        finally:
+            remaining = self._waiters.pop(task) - 1
+            if remaining:
+                self._waiters[task] = remaining
+            elif cancelled and not task.done():
+                self.stats["abandoned"] += 1
+                task.cancel()
+                # The load only finishes cancelling on a later turn of the
+                # event loop; requests arriving meanwhile must not join it
+                self._forget(key, task)
+
+    def _forget(self, key: str, task: "asyncio.Future"):
+        """
+        Stop sharing a load with new requests, unless a newer load of the
+        same key has replaced it.
+        """
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def lookup(self, key: str, prompt: Optional[str] = None) -> Optional[Tuple[dict, str, float]]:
+        """
+        Look up a key in every tier without generating on a miss.
+
+        Args:
+            key: The cache key
+            prompt: The prompt the key was built from, to look up in the
+                semantic tier
+
+        Returns:
+            A tuple of (copy of the cached result, CACHE_HIT or CACHE_SEMANTIC,
+            similarity), or None on a miss
+        """
+        cached = self.memory.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            self.stats["memory_hits"] += 1
+            return copy.deepcopy(cached), CACHE_HIT, 1.0
+
+        if self.disk is not None:
+            loop = asyncio.get_running_loop()
+            cached = await loop.run_in_executor(None, self.disk.get, key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                self.memory.set(key, cached)
+                return copy.deepcopy(cached), CACHE_HIT, 1.0
+
+        similar = self._lookup_similar(key, prompt)
+        if similar is not None:
+            result, outcome, similarity = similar
+            return copy.deepcopy(result), outcome, similarity
+
+        self.stats["misses"] += 1
+        return None
+
+    async def store(self, key: str, result: dict, prompt: Optional[str] = None):
+        """
+        Store a result produced outside get_or_generate (e.g. a streamed deck).
+
+        Args:
+            key: The cache key
+            result: The validated slides dictionary
+            prompt: The prompt the key was built from, to index in the semantic tier
+        """
+        await self._store(key, result, prompt)
+
+    def _lookup_similar(self, key: str, prompt: Optional[str]) -> Optional[Tuple[dict, str, float]]:
+        """
+        Look for the deck of a similar prompt in the semantic tier.
+
+        Returns:
+            A tuple of (result, outcome, similarity), or None if no indexed
+            prompt reaches the similarity threshold
+        """
+        if self.semantic is None or prompt is None:
+            return None
+
+        match = self.semantic.lookup(prompt)
+        if match is None:
+            return None
+
+        matched_key, result, similarity = match
+        metrics.SEMANTIC_CACHE_SIMILARITY.observe(similarity)
+        if not self.semantic.is_match(similarity):
+            return None
+
+        if matched_key == key:
+            # The same prompt, evicted from the exact tier but still indexed
+            self.stats["hits"] += 1
+            self.memory.set(key, result)
+            return result, CACHE_HIT, 1.0
+
+        self.stats["semantic_hits"] += 1
+        return result, CACHE_SEMANTIC, similarity
+
+    async def _load(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[dict]],
+        prompt: Optional[str],
+    ) -> Tuple[dict, str, Optional[float]]:
+        """
+        Load a missing key from the disk tier, the deck of a similar prompt
+        or by generating it. The exact key is looked up on disk first so
+        that a prompt answered before a restart gets its own deck back.
+        """
+        if self.disk is not None:
+            loop = asyncio.get_running_loop()
+            cached = await loop.run_in_executor(None, self.disk.get, key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                self.memory.set(key, cached)
+                return cached, CACHE_HIT, 1.0
+
+        similar = self._lookup_similar(key, prompt)
+        if similar is not None:
+            return similar
+
+        self.stats["misses"] += 1
+        try:
+            result = await generate()
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+
+        await self._store(key, result, prompt)
+        return result, CACHE_MISS, None
+
+    async def _store(self, key: str, result: dict, prompt: Optional[str] = None):
+        """
+        Write a result to every cache tier.
+        """
+        self.memory.set(key, copy.deepcopy(result))
+        if self.semantic is not None and prompt is not None:
+            self.semantic.add(key, prompt, copy.deepcopy(result))
+        if self.disk is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.disk.set, key, result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters.
+
+        Returns:
+            A dictionary of hit/miss/coalesced counters plus current sizes
+        """
+        return {
+            **self.stats,
+            "inflight": len(self._inflight),
+            "memory_entries": len(self.memory),
+            "semantic_enabled": self.semantic is not None,
+            "semantic_entries": len(self.semantic) if self.semantic is not None else 0,
+            "disk_enabled": self.disk is not None,
+        }
+
+    def close(self):
+        """
+        Release the disk tier, if any.
+        """
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,527 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from fastapi import WebSocket
+from backend.backplane import Backplane
+from backend.connection_manager import ConnectionManager
+from backend.deck_state import DeckState, DeckStore
+
+
+class _RoomSync:
+    """
+    State of a worker catching up on a room that other workers already serve.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        # Whether our own snapshot_request has come back through the backplane;
+        # ops before it are covered by the snapshot we asked for
+        self.request_seen = False
+        self.buffered: List[Dict[str, Any]] = []
+        self.timeout_handle: Optional[asyncio.TimerHandle] = None
+        # Set once the sync has finished or was abandoned
+        self.done = asyncio.Event()
+
+
+class CollaborationHub:
+    """
+    Routes collaboration messages between local connections and the backplane.
+
+    Every chat message, relay and deck op is published once per room on the
+    backplane, and each worker delivers it to its own connections. Deck ops
+    are applied when they come back from the backplane rather than when they
+    are received, so every worker applies the same ops in the same order and
+    agrees on the deck and its version numbers.
+
+    A worker that starts serving a room other workers already hold asks for
+    a snapshot over the backplane, buffering ops until it arrives. A worker
+    stops following a room when its last local connection leaves; the deck
+    stays in the store until evicted, flagged as stale, and is brought up to
+    date by the snapshot when the room is followed again.
+    """
+
+    # How long to wait for a peer's snapshot before assuming the room is new
+    SNAPSHOT_TIMEOUT = 1.0
+
+    # How long to wait for server-made edits to come back from the backplane
+    EDIT_CONFIRM_TIMEOUT = 5.0
+
+    def __init__(self, manager: ConnectionManager, decks: DeckStore, backplane: Backplane):
+        self.manager = manager
+        self.decks = decks
+        self.backplane = backplane
+        self.manager.on_room_empty = self.on_room_empty
+        # Decks of rooms in use (local connections or HTTP requests) are never evicted
+        self.decks.is_pinned = self._in_use
+        self._subscribed: Set[str] = set()
+        # Number of HTTP requests using each room (see use_room)
+        self._holds: Dict[str, int] = {}
+        # Unsubscriptions in progress, by room id
+        self._releasing: Dict[str, "asyncio.Task"] = {}
+        self._syncing: Dict[str, _RoomSync] = {}
+        # Server-made edits waiting to be applied, by edit id
+        self._pending_edits: Dict[str, "asyncio.Future"] = {}
+
+    async def start(self):
+        """
+        Start receiving backplane messages.
+        """
+        await self.backplane.start(self.handle_message, self.resync)
+
+    async def close(self):
+        """
+        Stop the backplane.
+        """
+        for sync in self._syncing.values():
+            if sync.timeout_handle is not None:
+                sync.timeout_handle.cancel()
+            sync.done.set()
+        self._syncing.clear()
+        await self.backplane.close()
+
+    async def resync(self):
+        """
+        Catch up on every followed room after the backplane lost messages
+        (e.g. while reconnecting to Redis), the same way a joining worker
+        does: ask the peers for a snapshot and buffer ops until it arrives.
+        Without this the copies of a room on different workers would
+        diverge and stamp later ops with conflicting versions.
+        """
+        for room_id in list(self._subscribed):
+            if room_id in self._syncing:
+                continue
+            deck = self.decks.peek(room_id)
+            if deck is not None:
+                deck.stale = True
+            sync = _RoomSync(uuid.uuid4().hex)
+            self._syncing[room_id] = sync
+            await self._request_snapshot(room_id, sync)
+
+    async def join(self, websocket: WebSocket, room_id: str, since: Optional[int] = None):
+        """
+        Make sure this worker follows the room, then send the new connection
+        the deck state it needs. While the worker is still catching up on the
+        room, the deck is sent once the snapshot arrives instead.
+
+        Args:
+            websocket: The newly connected WebSocket (already registered with the manager)
+            room_id: The room it joined
+            since: The last deck version the client has seen, if reconnecting
+        """
+        await self._follow(room_id)
+
+        if room_id in self._syncing:
+            # The snapshot is sent to every local client once the sync ends
+            return
+        self.manager.send_json(websocket, self.decks.get(room_id).sync_message(since))
+
+    @asynccontextmanager
+    async def use_room(self, room_id: str) -> AsyncIterator[Optional[DeckState]]:
+        """
+        Get the up-to-date deck of a room for an HTTP request, following the
+        room while the request uses it.
+
+        A worker that does not follow the room subscribes and asks its peers
+        for a snapshot first, so the deck is never a copy that missed ops.
+        The room is released again afterwards unless local clients joined it.
+
+        Args:
+            room_id: The room to use
+
+        Yields:
+            The room's DeckState, or None if neither this worker nor a peer
+            has a deck for the room. The deck is still flagged as stale when
+            this worker's copy may have missed ops and no peer sent a
+            snapshot.
+        """
+        self._holds[room_id] = self._holds.get(room_id, 0) + 1
+        try:
+            await self._follow(room_id)
+            sync = self._syncing.get(room_id)
+            if sync is not None:
+                await sync.done.wait()
+            yield self.decks.peek(room_id)
+        finally:
+            self._holds[room_id] -= 1
+            if not self._holds[room_id]:
+                del self._holds[room_id]
+                if self.manager.get_room_size(room_id) == 0:
+                    self._unfollow(room_id)
+
+    def on_room_empty(self, room_id: str):
+        """
+        Stop following a room once its last local connection has left,
+        unless an HTTP request is still using it.
+
+        Args:
+            room_id: The room that no longer has local connections
+        """
+        if room_id not in self._holds:
+            self._unfollow(room_id)
+
+    def _in_use(self, room_id: str) -> bool:
+        return self.manager.get_room_size(room_id) > 0 or room_id in self._holds
+
+    async def _follow(self, room_id: str):
+        """
+        Subscribe to a room's channel, catching up with a snapshot from the
+        workers already following it.
+        """
+        if room_id in self._subscribed:
+            return
+        self._subscribed.add(room_id)
+        sync = None
+        if self.backplane.distributed:
+            # Registered before subscribing, so that concurrent users of the
+            # room wait for the snapshot too
+            sync = _RoomSync(uuid.uuid4().hex)
+            self._syncing[room_id] = sync
+        releasing = self._releasing.get(room_id)
+        if releasing is not None:
+            # Let the unsubscription finish so it cannot undo this subscription
+            await asyncio.wait({releasing})
+        await self.backplane.subscribe(room_id)
+        if sync is not None and self._syncing.get(room_id) is sync:
+            await self._request_snapshot(room_id, sync)
+
+    def _unfollow(self, room_id: str):
+        """
+        Unsubscribe from a room's channel, flagging its deck as stale.
+        """
+        if room_id not in self._subscribed:
+            return
+        self._subscribed.discard(room_id)
+
+        sync = self._syncing.pop(room_id, None)
+        if sync is not None:
+            if sync.timeout_handle is not None:
+                sync.timeout_handle.cancel()
+            sync.done.set()
+
+        # Ops published from now on are not delivered to this worker
+        deck = self.decks.peek(room_id)
+        if deck is not None and self.backplane.distributed:
+            deck.stale = True
+
+        task = asyncio.ensure_future(self._release(room_id))
+        self._releasing[room_id] = task
+
+    async def _release(self, room_id: str):
+        """
+        Unsubscribe from a room's channel.
+        """
+        try:
+            await self.backplane.unsubscribe(room_id)
+        finally:
+            if self._releasing.get(room_id) is asyncio.current_task():
+                del self._releasing[room_id]
+
+    async def publish_chat(self, websocket: WebSocket, room_id: str, message: str):
+        """
+        Send a chat line to everyone in the room except its sender.
+
+        Args:
+            websocket: The sending connection
+            room_id: The room to send to
+            message: The formatted chat line ("client_id: message")
+        """
+        await self.backplane.publish(room_id, {
+            "kind": "chat",
+            "origin": self.backplane.worker_id,
+            "sender": self._connection_id(websocket),
+            "text": message,
+        })
+
+    async def publish_relay(self, room_id: str, payload: Any):
+        """
+        Send an arbitrary JSON payload to everyone in the room.
+
+        Args:
+            room_id: The room to send to
+            payload: The JSON payload
+        """
+        await self.backplane.publish(room_id, {
+            "kind": "relay",
+            "payload": payload,
+        })
+
+    async def publish_edit(self, websocket: Optional[WebSocket], room_id: str, client_id: str, edit: Dict[str, Any]):
+        """
+        Submit an edit for the room's deck.
+
+        The edit is validated and applied when it comes back from the
+        backplane; if it is rejected the sender receives an error.
+
+        Args:
+            websocket: The sending connection, or None for edits made by
+                the server (e.g. regenerated slides)
+            room_id: The room to edit
+            client_id: The client that made the edit
+            edit: The edit payload (slide_index, field, and value or delta)
+        """
+        message = {
+            "kind": "edit",
+            "origin": self.backplane.worker_id,
+            "sender": self._connection_id(websocket),
+            "client_id": client_id,
+            "slide_index": edit.get("slide_index"),
+            "field": edit.get("field"),
+        }
+        if "delta" in edit:
+            message["delta"] = edit["delta"]
+        else:
+            message["value"] = edit.get("value")
+        await self.backplane.publish(room_id, message)
+
+    async def submit_edits(self, room_id: str, client_id: str, edits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Submit edits made by the server (e.g. regenerated slides) and wait
+        until this worker has applied them, so that a rejected edit is
+        reported to the caller instead of being dropped.
+
+        The edits are first checked against this worker's copy of the deck,
+        so that none are published when any of them no longer applies.
+
+        Args:
+            room_id: The room to edit
+            client_id: The client the edits are attributed to
+            edits: The edit payloads (slide_index, field and value)
+
+        Returns:
+            The versioned 'edit' ops
+
+        Raises:
+            LookupError: If this worker does not follow the room, so the
+                edits cannot be checked
+            ValueError: If an edit does not apply to the room's deck, e.g.
+                because the deck changed in the meantime
+            asyncio.TimeoutError: If the edits did not come back from the
+                backplane in time
+        """
+        deck = self.decks.peek(room_id)
+        if room_id not in self._subscribed or deck is None:
+            raise LookupError(f"Room {room_id!r} has no deck on this worker")
+        if room_id not in self._syncing:
+            for edit in edits:
+                deck.check_edit(edit.get("slide_index"), edit.get("field"))
+
+        loop = asyncio.get_running_loop()
+        edit_ids = []
+        try:
+            for edit in edits:
+                edit_id = uuid.uuid4().hex
+                edit_ids.append(edit_id)
+                self._pending_edits[edit_id] = loop.create_future()
+                await self.backplane.publish(room_id, {
+                    "kind": "edit",
+                    "origin": self.backplane.worker_id,
+                    "sender": None,
+                    "edit_id": edit_id,
+                    "client_id": client_id,
+                    "slide_index": edit.get("slide_index"),
+                    "field": edit.get("field"),
+                    "value": edit.get("value"),
+                })
+            # Raises the first rejection, if any
+            return await asyncio.wait_for(
+                asyncio.gather(*[self._pending_edits[edit_id] for edit_id in edit_ids]),
+                self.EDIT_CONFIRM_TIMEOUT,
+            )
+        finally:
+            for edit_id in edit_ids:
+                self._pending_edits.pop(edit_id, None)
+
+    async def publish_deck(self, websocket: WebSocket, room_id: str, client_id: str, slides: Any):
+        """
+        Submit a new deck for the room.
+
+        Args:
+            websocket: The sending connection
+            room_id: The room to load the deck into
+            client_id: The client that loaded the deck
+            slides: The list of slides
+        """
+        await self.backplane.publish(room_id, {
+            "kind": "set_deck",
+            "origin": self.backplane.worker_id,
+            "sender": self._connection_id(websocket),
+            "client_id": client_id,
+            "slides": slides,
+        })
+
+    async def handle_message(self, room_id: str, message: Dict[str, Any]):
+        """
+        Handle a message delivered by the backplane.
+
+        Args:
+            room_id: The room the message was published to
+            message: The published message
+        """
+        kind = message.get("kind")
+
+        if kind == "chat":
+            sender = None
+            if message.get("origin") == self.backplane.worker_id:
+                # Sender suppression only applies on the sender's own worker
+                sender = self._websocket_for(message.get("sender"))
+            await self.manager.broadcast_to_others(message.get("text", ""), sender, room_id)
+            return
+
+        if kind == "relay":
+            await self.manager.broadcast_json(message.get("payload"), room_id)
+            return
+
+        if kind == "snapshot_request":
+            await self._handle_snapshot_request(room_id, message)
+            return
+
+        if kind == "snapshot":
+            await self._handle_snapshot(room_id, message)
+            return
+
+        if kind in ("edit", "set_deck"):
+            sync = self._syncing.get(room_id)
+            if sync is not None:
+                if sync.request_seen:
+                    sync.buffered.append(message)
+                return
+            await self._apply_op(room_id, message)
+
+    async def _apply_op(self, room_id: str, message: Dict[str, Any]):
+        """
+        Apply a deck op to this worker's copy and deliver it locally.
+        """
+        deck = self.decks.get(room_id)
+        client_id = message.get("client_id", "")
+
+        try:
+            if message["kind"] == "set_deck":
+                op = deck.set_deck(client_id, message.get("slides"))
+            elif "delta" in message:
+                op = deck.apply_delta(client_id, message.get("slide_index"), message.get("field"), message["delta"])
+            else:
+                op = deck.apply_edit(client_id, message.get("slide_index"), message.get("field"), message.get("value"))
+        except ValueError as e:
+            # Only the sender's worker reports the rejection
+            pending = self._pending_edit(message)
+            if pending is not None:
+                pending.set_exception(e)
+            elif message.get("origin") == self.backplane.worker_id:
+                websocket = self._websocket_for(message.get("sender"))
+                if websocket is not None:
+                    label = "deck" if message["kind"] == "set_deck" else "edit"
+                    self.manager.send_json(websocket, {
+                        "type": "error",
+                        "message": f"Invalid {label}: {str(e)}"
+                    })
+            return
+
+        pending = self._pending_edit(message)
+        if pending is not None:
+            pending.set_result(op)
+
+        if op["type"] == "edit":
+            # Edits are coalesced and broadcast in batches
+            self.manager.queue_edit(op, room_id)
+        else:
+            await self.manager.broadcast_json(op, room_id)
+
+    async def _request_snapshot(self, room_id: str, sync: _RoomSync):
+        """
+        Ask the other workers following a room for its current deck.
+        """
+        loop = asyncio.get_running_loop()
+        sync.timeout_handle = loop.call_later(
+            self.SNAPSHOT_TIMEOUT,
+            lambda: asyncio.ensure_future(self._finish_sync(room_id, sync.request_id)),
+        )
+        await self.backplane.publish(room_id, {
+            "kind": "snapshot_request",
+            "origin": self.backplane.worker_id,
+            "request_id": sync.request_id,
+        })
+
+    async def _handle_snapshot_request(self, room_id: str, message: Dict[str, Any]):
+        """
+        Note our own request coming back, or answer another worker's.
+        """
+        sync = self._syncing.get(room_id)
+        if sync is not None:
+            if message.get("request_id") == sync.request_id:
+                sync.request_seen = True
+            # A worker that is still catching up has nothing reliable to share
+            return
+
+        deck = self.decks.peek(room_id)
+        if deck is None or deck.version == 0 or deck.stale:
+            return
+
+        await self.backplane.publish(room_id, {
+            "kind": "snapshot",
+            "request_id": message.get("request_id"),
+            **deck.snapshot(),
+        })
+
+    async def _handle_snapshot(self, room_id: str, message: Dict[str, Any]):
+        """
+        Adopt the snapshot a peer sent in reply to our request.
+        """
+        sync = self._syncing.get(room_id)
+        if sync is None or message.get("request_id") != sync.request_id:
+            return
+
+        deck = self.decks.get(room_id)
+        if message.get("version", 0) > deck.version:
+            deck.restore(message.get("slides"), message["version"])
+        else:
+            # This copy already has every op the peer has
+            deck.stale = False
+
+        await self._finish_sync(room_id, sync.request_id)
+
+    async def _finish_sync(self, room_id: str, request_id: str):
+        """
+        Replay the ops buffered while catching up and refresh local clients.
+        """
+        sync = self._syncing.get(room_id)
+        if sync is None or sync.request_id != request_id:
+            return
+
+        del self._syncing[room_id]
+        if sync.timeout_handle is not None:
+            sync.timeout_handle.cancel()
+
+        try:
+            if self.manager.get_room_size(room_id) > 0:
+                deck = self.decks.get(room_id)
+                # Either a peer's snapshot was adopted or no other worker
+                # follows the room; this copy is the room's deck from now on
+                deck.stale = False
+                # Local clients that joined while catching up have not been sent the deck yet
+                await self.manager.broadcast_json(deck.snapshot(), room_id)
+
+            for message in sync.buffered:
+                await self._apply_op(room_id, message)
+        finally:
+            sync.done.set()
+
+    def _pending_edit(self, message: Dict[str, Any]) -> Optional["asyncio.Future"]:
+        """
+        Get the future of a server-made edit submitted by this worker, if the
+        message is one and its submitter is still waiting.
+        """
+        if message.get("origin") != self.backplane.worker_id:
+            return None
+        future = self._pending_edits.get(message.get("edit_id"))
+        if future is None or future.done():
+            return None
+        return future
+
+    def _connection_id(self, websocket: WebSocket) -> Optional[str]:
+        connection = self.manager.connections.get(websocket)
+        return connection.connection_id if connection is not None else None
+
+    def _websocket_for(self, connection_id: Optional[str]) -> Optional[WebSocket]:
+        connection = self.manager.get_connection(connection_id)
+        return connection.websocket if connection is not None else None
@@ -22,3 +22,583 @@ def get_openai_api_key() -> str:
     
     return api_key
 
+
+def _get_positive_int_env(name: str, default: int) -> int:
+    """
+    Read a positive integer setting from the environment.
+    
+    Args:
+        name: Name of the environment variable
+        default: Value to use when the variable is not set
+        
+    Returns:
+        The configured integer value, or the default
+        
+    Raises:
+        ValueError: If the variable is set but is not a positive integer
+    """
+    raw_value = os.getenv(name)
+    
+    if raw_value is None or not raw_value.strip():
+        return default
+    
+    try:
+        value = int(raw_value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {raw_value!r}")
+    
+    if value <= 0:
+        raise ValueError(f"{name} must be a positive integer, got {value}")
+    
+    return value
+
+
+def _get_positive_float_env(name: str, default: float) -> float:
+    """
+    Read a positive float setting from the environment.
+    
+    Args:
+        name: Name of the environment variable
+        default: Value to use when the variable is not set
+        
+    Returns:
+        The configured float value, or the default
+        
+    Raises:
+        ValueError: If the variable is set but is not a positive number
+    """
+    raw_value = os.getenv(name)
+    
+    if raw_value is None or not raw_value.strip():
+        return default
+    
+    try:
+        value = float(raw_value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got {raw_value!r}")
+    
+    if value <= 0:
+        raise ValueError(f"{name} must be a positive number, got {value}")
+    
+    return value
+
+
+def _get_optional_positive_int_env(name: str) -> Optional[int]:
+    """
+    Read an optional positive integer setting from the environment.
+    
+    Args:
+        name: Name of the environment variable
+        
+    Returns:
+        The configured integer value, or None when the variable is not set
+        
+    Raises:
+        ValueError: If the variable is set but is not a positive integer
+    """
+    raw_value = os.getenv(name)
+    
+    if raw_value is None or not raw_value.strip():
+        return None
+    
+    return _get_positive_int_env(name, 0)
+
+
+def _get_non_negative_int_env(name: str, default: int) -> int:
+    """
+    Read a non-negative integer setting from the environment.
+    
+    Args:
+        name: Name of the environment variable
+        default: Value to use when the variable is not set
+        
+    Returns:
+        The configured value, or the default
+        
+    Raises:
+        ValueError: If the variable is set but is not a non-negative integer
+    """
+    raw_value = os.getenv(name)
+    
+    if raw_value is None or not raw_value.strip():
+        return default
+    
+    try:
+        value = int(raw_value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {raw_value!r}")
+    
+    if value < 0:
+        raise ValueError(f"{name} must not be negative, got {value}")
+    
+    return value
+
+
+def _get_bool_env(name: str, default: bool) -> bool:
+    """
+    Read a boolean setting from the environment.
+    
+    Args:
+        name: Name of the environment variable
+        default: Value to use when the variable is not set
+        
+    Returns:
+        True for 1/true/yes/on, False for 0/false/no/off
+        
+    Raises:
+        ValueError: If the variable is set to anything else
+    """
+    raw_value = os.getenv(name)
+    
+    if raw_value is None or not raw_value.strip():
+        return default
+    
+    value = raw_value.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"{name} must be true or false, got {raw_value!r}")
+
+
+def get_openai_base_url() -> Optional[str]:
+    """
+    Get an optional override for the OpenAI API base URL.
+    
+    Returns:
+        The base URL, or None to use the OpenAI default
+    """
+    return os.getenv("OPENAI_BASE_URL") or None
+
+
+def get_max_concurrent_generations() -> int:
+    """
+    Get the maximum number of slide generations allowed in flight at once.
+    
+    Returns:
+        The concurrency cap (default 8)
+    """
+    return _get_positive_int_env("MAX_CONCURRENT_GENERATIONS", 8)
+
+
+def get_openai_max_connections() -> int:
+    """
+    Get the size of the HTTP connection pool used for OpenAI requests.
+    
+    Returns:
+        The maximum number of pooled connections (default 20)
+    """
+    return _get_positive_int_env("OPENAI_MAX_CONNECTIONS", 20)
+
+
+def get_openai_timeout() -> float:
+    """
+    Get the timeout in seconds for a single OpenAI request.
+    
+    Returns:
+        The request timeout (default 60 seconds)
+    """
+    return _get_positive_float_env("OPENAI_TIMEOUT", 60.0)
+
+
+def get_prompt_cache_max_entries() -> int:
+    """
+    Get the maximum number of generated decks kept in the in-memory cache.
+    
+    Returns:
+        The in-memory cache capacity (default 256)
+    """
+    return _get_positive_int_env("PROMPT_CACHE_MAX_ENTRIES", 256)
+
+
+def get_prompt_cache_ttl() -> float:
+    """
+    Get how long, in seconds, a generated deck stays in the cache.
+    
+    Returns:
+        The cache time-to-live (default 3600 seconds)
+    """
+    return _get_positive_float_env("PROMPT_CACHE_TTL", 3600.0)
+
+
+def get_prompt_cache_db_path() -> Optional[str]:
+    """
+    Get the path of the optional SQLite database backing the prompt cache.
+    
+    Returns:
+        The database path, or None to keep the cache in memory only
+    """
+    return os.getenv("PROMPT_CACHE_DB") or None
+
+
+def get_semantic_cache_enabled() -> bool:
+    """
+    Get whether prompts similar to an earlier one reuse its cached deck.
+    
+    Returns:
+        True to enable the semantic cache tier (default False)
+    """
+    return _get_bool_env("SEMANTIC_CACHE_ENABLED", False)
+
+
+def get_semantic_cache_threshold() -> float:
+    """
+    Get the similarity a prompt needs with an earlier one to reuse its deck.
+    
+    Returns:
+        The cosine similarity threshold, between 0 and 1 (default 0.9)
+        
+    Raises:
+        ValueError: If the variable is set but is not a number in (0, 1]
+    """
+    threshold = _get_positive_float_env("SEMANTIC_CACHE_THRESHOLD", 0.9)
+    
+    if threshold > 1:
+        raise ValueError(f"SEMANTIC_CACHE_THRESHOLD must be at most 1, got {threshold}")
+    
+    return threshold
+
+
+def get_semantic_cache_max_entries() -> int:
+    """
+    Get the number of prompts kept in the semantic cache index.
+    
+    Returns:
+        The number of indexed prompts before evicting the least recently used (default 1000)
+    """
+    return _get_positive_int_env("SEMANTIC_CACHE_MAX_ENTRIES", 1000)
+
+
+def get_ws_send_queue_size() -> int:
+    """
+    Get the number of outbound messages buffered per WebSocket connection.
+    
+    Returns:
+        The per-connection queue size (default 256)
+    """
+    return _get_positive_int_env("WS_SEND_QUEUE_SIZE", 256)
+
+
+def get_ws_slow_consumer_policy() -> str:
+    """
+    Get what to do with a WebSocket client whose outbound queue is full.
+    
+    Returns:
+        'disconnect' (default) to drop the client, or 'drop_oldest' to
+        discard its oldest pending message
+    """
+    return os.getenv("WS_SLOW_CONSUMER_POLICY", "disconnect").strip().lower()
+
+
+def get_ws_heartbeat_interval() -> float:
+    """
+    Get how long a WebSocket connection that opted into application
+    heartbeats may stay quiet before the server pings it.
+    
+    Returns:
+        The heartbeat interval in seconds (default 20)
+    """
+    return _get_positive_float_env("WS_HEARTBEAT_INTERVAL", 20.0)
+
+
+def get_ws_idle_timeout() -> float:
+    """
+    Get how long a WebSocket connection that opted into application
+    heartbeats may go without sending anything, pong replies included,
+    before it is closed. Other connections are left to protocol-level pings.
+    
+    Returns:
+        The idle timeout in seconds (default 60)
+    """
+    return _get_positive_float_env("WS_IDLE_TIMEOUT", 60.0)
+
+
+def get_ws_max_connections() -> int:
+    """
+    Get the maximum number of WebSocket connections this process accepts.
+    
+    Returns:
+        The connection cap (default 10000)
+    """
+    return _get_positive_int_env("WS_MAX_CONNECTIONS", 10000)
+
+
+def get_ws_max_connections_per_client() -> int:
+    """
+    Get the maximum number of WebSocket connections sharing one client id.
+    
+    Returns:
+        The per-client connection cap (default 1)
+    """
+    return _get_positive_int_env("WS_MAX_CONNECTIONS_PER_CLIENT", 1)
+
+
+def get_ws_duplicate_client_policy() -> str:
+    """
+    Get what to do when a client id that is already at its connection cap
+    connects again.
+    
+    Returns:
+        'replace' (default) to close the client's oldest connection in
+        favour of the new one, or 'reject' to refuse the new connection
+    """
+    return os.getenv("WS_DUPLICATE_CLIENT_POLICY", "replace").strip().lower()
+
+
+def get_deck_state_max_rooms() -> int:
+    """
+    Get the maximum number of room decks kept in server memory.
+    
+    Returns:
+        The number of decks to keep before evicting the least recently used (default 1000)
+    """
+    return _get_positive_int_env("DECK_STATE_MAX_ROOMS", 1000)
+
+
+def get_deck_ops_buffer_size() -> int:
+    """
+    Get how many recent ops each deck keeps for catching up reconnecting clients.
+    
+    Returns:
+        The per-deck op ring buffer size (default 500)
+    """
+    return _get_positive_int_env("DECK_OPS_BUFFER_SIZE", 500)
+
+
+def get_edit_flush_interval() -> float:
+    """
+    Get the edit coalescing window, in seconds.
+    
+    Edits to the same slide field within the window are collapsed into the
+    latest value and broadcast as one batched frame.
+    
+    Returns:
+        The flush interval, from EDIT_FLUSH_INTERVAL_MS (default 30 ms);
+        0 disables coalescing
+        
+    Raises:
+        ValueError: If the variable is set but is not a non-negative number
+    """
+    raw_value = os.getenv("EDIT_FLUSH_INTERVAL_MS")
+    
+    if raw_value is None or not raw_value.strip():
+        return 0.03
+    
+    try:
+        interval_ms = float(raw_value)
+    except ValueError:
+        raise ValueError(f"EDIT_FLUSH_INTERVAL_MS must be a number, got {raw_value!r}")
+    
+    if interval_ms < 0:
+        raise ValueError(f"EDIT_FLUSH_INTERVAL_MS must not be negative, got {interval_ms}")
+    
+    return interval_ms / 1000
+
+
+def get_backplane_url() -> Optional[str]:
+    """
+    Get the URL of the pub/sub backplane shared by all workers.
+    
+    Returns:
+        A redis:// URL, or None to keep collaboration within one process
+    """
+    return os.getenv("BACKPLANE_URL") or None
+
+
+def get_backplane_channel_prefix() -> str:
+    """
+    Get the prefix for backplane channel names, so several deployments can
+    share one Redis server.
+    
+    Returns:
+        The channel prefix (default 'smartslides:')
+    """
+    return os.getenv("BACKPLANE_CHANNEL_PREFIX", "smartslides:")
+
+
+def get_openai_rpm_limit() -> Optional[int]:
+    """
+    Get the OpenAI requests-per-minute quota to stay within.
+    
+    Returns:
+        The quota from OPENAI_RPM_LIMIT, or None for no client-side limit
+    """
+    return _get_optional_positive_int_env("OPENAI_RPM_LIMIT")
+
+
+def get_openai_tpm_limit() -> Optional[int]:
+    """
+    Get the OpenAI tokens-per-minute quota to stay within.
+    
+    Returns:
+        The quota from OPENAI_TPM_LIMIT, or None for no client-side limit
+    """
+    return _get_optional_positive_int_env("OPENAI_TPM_LIMIT")
+
+
+def get_openai_limit_workers() -> int:
+    """
+    Get the number of worker processes sharing the OpenAI quota.
+    
+    Each worker paces its own requests, so every worker gets an equal share
+    of OPENAI_RPM_LIMIT and OPENAI_TPM_LIMIT. Defaults to WEB_CONCURRENCY,
+    which uvicorn and gunicorn also read as their default worker count.
+    
+    Returns:
+        The number of workers from OPENAI_LIMIT_WORKERS or WEB_CONCURRENCY
+        (default 1)
+    """
+    return _get_positive_int_env(
+        "OPENAI_LIMIT_WORKERS",
+        _get_positive_int_env("WEB_CONCURRENCY", 1),
+    )
+
+
+def get_openai_max_retries() -> int:
+    """
+    Get how many times a rate-limited or timed-out OpenAI call is retried.
+    
+    Returns:
+        The number of retries (default 4; 0 disables retries)
+        
+    Raises:
+        ValueError: If the variable is set but is not a non-negative integer
+    """
+    return _get_non_negative_int_env("OPENAI_MAX_RETRIES", 4)
+
+
+def get_openai_retry_base_delay() -> float:
+    """
+    Get the backoff before the first retry of a failed OpenAI call.
+    
+    Returns:
+        The base delay in seconds (default 0.5), doubled on every retry
+    """
+    return _get_positive_float_env("OPENAI_RETRY_BASE_DELAY", 0.5)
+
+
+def get_openai_retry_max_delay() -> float:
+    """
+    Get the cap on the wait between retries.
+
+    A server's Retry-After above this cap is not waited out; the request
+    fails instead.
+    
+    Returns:
+        The maximum delay in seconds (default 30)
+    """
+    return _get_positive_float_env("OPENAI_RETRY_MAX_DELAY", 30.0)
+
+
+def get_batch_max_items() -> int:
+    """
+    Get the maximum number of prompts accepted by one batch request.
+    
+    Returns:
+        The batch size limit (default 50)
+    """
+    return _get_positive_int_env("BATCH_MAX_ITEMS", 50)
+
+
+def get_metrics_enabled() -> bool:
+    """
+    Get whether metrics are collected and served on /metrics.
+    
+    Returns:
+        False to disable all instrumentation (default True)
+    """
+    return _get_bool_env("METRICS_ENABLED", True)
+
+
+def get_metrics_timing_logs() -> bool:
+    """
+    Get whether a structured timing log line is written for every request.
+    
+    Returns:
+        True to log per-stage timings as JSON (default False)
+    """
+    return _get_bool_env("METRICS_TIMING_LOGS", False)
+
+
+def get_export_workers() -> int:
+    """
+    Get the number of processes rendering PPTX and PDF exports.
+    
+    Returns:
+        The process pool size (default: the CPU count, at most 4)
+    """
+    return _get_positive_int_env("EXPORT_WORKERS", min(4, os.cpu_count() or 1))
+
+
+def get_export_cache_max_slides() -> int:
+    """
+    Get the number of rendered slides kept in the export render cache.
+    
+    Returns:
+        The maximum number of cached slides (default 2000)
+    """
+    return _get_positive_int_env("EXPORT_CACHE_MAX_SLIDES", 2000)
+
+
+def get_export_cache_ttl() -> float:
+    """
+    Get how long a rendered slide stays in the export render cache.
+    
+    Returns:
+        The time-to-live in seconds (default 3600)
+    """
+    return _get_positive_float_env("EXPORT_CACHE_TTL", 3600.0)
+
+
+def get_job_workers() -> int:
+    """
+    Get the number of workers running queued generation jobs.
+    
+    Returns:
+        The worker count (default: MAX_CONCURRENT_GENERATIONS, so the job
+        workers can use the whole OpenAI concurrency budget)
+    """
+    return _get_positive_int_env("JOB_WORKERS", get_max_concurrent_generations())
+
+
+def get_job_queue_size() -> int:
+    """
+    Get the maximum number of generation jobs waiting for a worker.
+    
+    Returns:
+        The queue capacity (default 100)
+    """
+    return _get_positive_int_env("JOB_QUEUE_SIZE", 100)
+
+
+def get_job_interactive_reserve() -> int:
+    """
+    Get how many queue slots only interactive jobs may use.
+    
+    Returns:
+        The number of reserved slots (default 20; 0 disables the reserve)
+        
+    Raises:
+        ValueError: If the variable is set but is not a non-negative integer
+    """
+    return _get_non_negative_int_env("JOB_INTERACTIVE_RESERVE", 20)
+
+
+def get_job_abandon_timeout() -> float:
+    """
+    Get how long a job may go without being polled or watched before it is cancelled.
+    
+    Returns:
+        The timeout in seconds (default 30)
+    """
+    return _get_positive_float_env("JOB_ABANDON_TIMEOUT", 30.0)
+
+
+def get_job_result_ttl() -> float:
+    """
+    Get how long a finished job's result stays available.
+    
+    Returns:
+        The time-to-live in seconds (default 300)
+    """
+    return _get_positive_float_env("JOB_RESULT_TTL", 300.0)
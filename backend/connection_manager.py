@@ -0,0 +1,612 @@
+import asyncio
+import time
+import uuid
+from typing import Callable, Dict, Any, List, Optional, Union
+from fastapi import WebSocket
+from backend.edit_coalescer import EditCoalescer
+from backend.wire import ENCODING_JSON, Frame
+from backend import metrics
+
+
+# Room used by clients that connect without naming a deck
+DEFAULT_ROOM = "default"
+
+# What to do when a connection's outbound queue is full
+SLOW_CONSUMER_DISCONNECT = "disconnect"
+SLOW_CONSUMER_DROP_OLDEST = "drop_oldest"
+SLOW_CONSUMER_POLICIES = (SLOW_CONSUMER_DISCONNECT, SLOW_CONSUMER_DROP_OLDEST)
+
+# Close code sent to consumers that cannot keep up ("Try Again Later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# What to do when a client id that is already at its connection cap connects again
+DUPLICATE_CLIENT_REPLACE = "replace"
+DUPLICATE_CLIENT_REJECT = "reject"
+DUPLICATE_CLIENT_POLICIES = (DUPLICATE_CLIENT_REPLACE, DUPLICATE_CLIENT_REJECT)
+
+# Close code sent when the process is at its connection cap ("Try Again Later")
+CAPACITY_CLOSE_CODE = 1013
+
+# Application close codes: the connection was superseded by a newer one with the
+# same client id, refused because the client id is already connected, or
+# silent for longer than the idle timeout
+REPLACED_CLOSE_CODE = 4000
+DUPLICATE_CLIENT_CLOSE_CODE = 4001
+IDLE_CLOSE_CODE = 4002
+
+
+class ConnectionRejected(Exception):
+    """
+    Raised when a WebSocket is refused by the connection caps. The socket has
+    already been closed with the given code.
+    """
+
+    def __init__(self, code: int, reason: str):
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+
+
+class Connection:
+    """
+    A single WebSocket connection with its own bounded outbound queue.
+
+    Messages are enqueued without waiting and written by a dedicated writer
+    task, so a slow client only ever delays its own messages. Structured
+    messages are queued as Frames and encoded in the connection's negotiated
+    encoding when written.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        room_id: str,
+        queue_size: int,
+        encoding: str = ENCODING_JSON,
+        deltas: bool = False,
+        heartbeat: bool = False,
+    ):
+        self.websocket = websocket
+        self.connection_id = uuid.uuid4().hex
+        self.client_id = client_id
+        self.room_id = room_id
+        self.encoding = encoding
+        self.deltas = deltas
+        self.heartbeat = heartbeat
+        self.queue: "asyncio.Queue[Union[str, Frame]]" = asyncio.Queue(maxsize=queue_size)
+        self.writer_task: Optional["asyncio.Task"] = None
+        self.closed = False
+        # When the client was last heard from (any message, including pongs)
+        self.last_seen = time.monotonic()
+
+    def touch(self):
+        """
+        Record that a message was received from the client.
+        """
+        self.last_seen = time.monotonic()
+
+    def start(self, on_failure, on_sent):
+        """
+        Start the writer task.
+
+        Args:
+            on_failure: Callback invoked with this connection if a send fails
+            on_sent: Callback invoked with the size in bytes of each message sent
+        """
+        self.writer_task = asyncio.ensure_future(self._write_loop(on_failure, on_sent))
+
+    async def _write_loop(self, on_failure, on_sent):
+        """
+        Drain the outbound queue onto the socket until the connection closes.
+        """
+        while True:
+            message = await self.queue.get()
+            if isinstance(message, Frame):
+                message = message.encode(self.encoding, self.deltas)
+            started = time.perf_counter()
+            try:
+                if isinstance(message, bytes):
+                    await self.websocket.send_bytes(message)
+                    on_sent(len(message))
+                else:
+                    await self.websocket.send_text(message)
+                    on_sent(len(message.encode("utf-8")))
+                metrics.WS_SEND_SECONDS.observe(time.perf_counter() - started)
+            except Exception:
+                # Connection is likely closed
+                on_failure(self)
+                return
+
+    def close(self, code: Optional[int] = None, reason: str = ""):
+        """
+        Stop the writer task and optionally close the socket.
+
+        Args:
+            code: WebSocket close code to send, or None to leave the socket as-is
+            reason: Close reason sent with the code
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        if self.writer_task is not None and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+
+        if code is not None:
+            asyncio.ensure_future(self._close_socket(code, reason))
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    """
+    WebSocket connection manager that groups connections into rooms (one
+    room per deck) and fans messages out concurrently.
+
+    Each connection has a bounded outbound queue drained by its own writer
+    task. Broadcasting only enqueues, so its cost scales with the size of
+    the room and never waits on a slow client. Slide edits are coalesced
+    per room and sent as batched frames (see EditCoalescer).
+
+    Connections are indexed by socket, connection id, room and client id, so
+    registering and removing one is O(1) however many are open. The number of
+    connections is capped per process and per client id.
+
+    Dead sockets are found by the server's protocol-level WebSocket pings
+    (uvicorn's ws_ping_interval and ws_ping_timeout), which every client
+    answers automatically. Clients that opt into application heartbeats are
+    also pinged with a {'type': 'ping'} message when they go quiet, and a
+    reaper task closes them once they stay silent past the idle timeout.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 256,
+        slow_consumer_policy: str = SLOW_CONSUMER_DISCONNECT,
+        edit_flush_interval: float = 0.0,
+        heartbeat_interval: float = 20.0,
+        idle_timeout: float = 60.0,
+        max_connections: int = 10000,
+        max_connections_per_client: int = 1,
+        duplicate_client_policy: str = DUPLICATE_CLIENT_REPLACE,
+    ):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(
+                f"Unknown slow consumer policy {slow_consumer_policy!r}. "
+                f"Expected one of: {', '.join(SLOW_CONSUMER_POLICIES)}"
+            )
+        if duplicate_client_policy not in DUPLICATE_CLIENT_POLICIES:
+            raise ValueError(
+                f"Unknown duplicate client policy {duplicate_client_policy!r}. "
+                f"Expected one of: {', '.join(DUPLICATE_CLIENT_POLICIES)}"
+            )
+        if idle_timeout <= heartbeat_interval:
+            raise ValueError(
+                f"The idle timeout ({idle_timeout}s) must be longer than the "
+                f"heartbeat interval ({heartbeat_interval}s)"
+            )
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        self.max_connections_per_client = max_connections_per_client
+        self.duplicate_client_policy = duplicate_client_policy
+        self.connections: Dict[WebSocket, Connection] = {}
+        self.connections_by_id: Dict[str, Connection] = {}
+        # Insertion ordered, so the first entry is the client's oldest connection
+        self.connections_by_client: Dict[str, Dict[WebSocket, Connection]] = {}
+        # Connections that opted into application heartbeats, the only ones reaped
+        self.heartbeat_connections: Dict[WebSocket, Connection] = {}
+        self.rooms: Dict[str, Dict[WebSocket, Connection]] = {}
+        # Called with the room id when a room's last connection is removed
+        self.on_room_empty: Optional[Callable[[str], None]] = None
+        self.coalescer = EditCoalescer(edit_flush_interval, self._deliver)
+        self._reaper: Optional["asyncio.Task"] = None
+        self.stats = {
+            "messages_enqueued": 0,
+            "messages_sent": 0,
+            "bytes_sent": 0,
+            "messages_dropped": 0,
+            "send_failures": 0,
+            "slow_consumer_disconnects": 0,
+            "disconnects": 0,
+            "pings_sent": 0,
+            "idle_disconnects": 0,
+            "replaced_connections": 0,
+            "rejected_at_capacity": 0,
+            "rejected_duplicate_client": 0,
+        }
+
+    def start(self):
+        """
+        Start the heartbeat and idle connection reaper.
+        """
+        if self._reaper is None:
+            self._reaper = asyncio.ensure_future(self._reap_loop())
+
+    def close(self):
+        """
+        Stop the reaper.
+        """
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+    @property
+    def active_connections(self):
+        """
+        All active WebSocket connections across every room.
+        """
+        return list(self.connections)
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        client_id: str = "",
+        room_id: str = DEFAULT_ROOM,
+        subprotocol: Optional[str] = None,
+        encoding: str = ENCODING_JSON,
+        deltas: bool = False,
+        heartbeat: bool = False,
+    ) -> Connection:
+        """
+        Accept a new WebSocket connection and add it to a room.
+
+        A client id already holding max_connections_per_client connections
+        either replaces its oldest one (closed with REPLACED_CLOSE_CODE) or is
+        refused, depending on the duplicate client policy. Connections beyond
+        the process cap are refused with CAPACITY_CLOSE_CODE.
+
+        Args:
+            websocket: The WebSocket connection to add
+            client_id: Identifier of the connecting client
+            room_id: The room (deck) the connection joins
+            subprotocol: The negotiated subprotocol to accept, if any
+            encoding: The payload encoding for structured messages
+            deltas: Whether the client receives text deltas instead of full values
+            heartbeat: Whether the client answers application pings, making it
+                subject to the idle timeout
+
+        Returns:
+            The registered connection
+
+        Raises:
+            ConnectionRejected: If a connection cap refused the socket
+        """
+        # Accept first so that a refused client receives the close code
+        await websocket.accept(subprotocol=subprotocol)
+
+        client_connections = self.connections_by_client.get(client_id)
+        at_client_cap = client_connections is not None and len(client_connections) >= self.max_connections_per_client
+
+        if at_client_cap and self.duplicate_client_policy == DUPLICATE_CLIENT_REJECT:
+            self.stats["rejected_duplicate_client"] += 1
+            await self._refuse(websocket, DUPLICATE_CLIENT_CLOSE_CODE, "Client is already connected")
+        if not at_client_cap and len(self.connections) >= self.max_connections:
+            self.stats["rejected_at_capacity"] += 1
+            await self._refuse(websocket, CAPACITY_CLOSE_CODE, "Server is at its connection limit")
+
+        if at_client_cap:
+            # The newest connection wins, e.g. a client reconnecting before
+            # its previous socket was found dead
+            oldest = next(iter(client_connections.values()))
+            self.stats["replaced_connections"] += 1
+            oldest.close(REPLACED_CLOSE_CODE, "Replaced by a newer connection")
+            self.disconnect(oldest.websocket)
+
+        connection = Connection(websocket, client_id, room_id, self.queue_size, encoding, deltas, heartbeat)
+        self.connections[websocket] = connection
+        if heartbeat:
+            self.heartbeat_connections[websocket] = connection
+        self.connections_by_id[connection.connection_id] = connection
+        self.connections_by_client.setdefault(client_id, {})[websocket] = connection
+        self.rooms.setdefault(room_id, {})[websocket] = connection
+        connection.start(self._on_send_failure, self._on_sent)
+        return connection
+
+    async def _refuse(self, websocket: WebSocket, code: int, reason: str):
+        """
+        Close an accepted socket that will not be registered.
+
+        Raises:
+            ConnectionRejected: Always
+        """
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+        raise ConnectionRejected(code, reason)
+
+    def disconnect(self, websocket: WebSocket):
+        """
+        Remove a WebSocket connection from its room.
+
+        Args:
+            websocket: The WebSocket connection to remove
+        """
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        self.connections_by_id.pop(connection.connection_id, None)
+        self.heartbeat_connections.pop(websocket, None)
+        self.stats["disconnects"] += 1
+
+        client_connections = self.connections_by_client.get(connection.client_id)
+        if client_connections is not None:
+            client_connections.pop(websocket, None)
+            if not client_connections:
+                del self.connections_by_client[connection.client_id]
+
+        room = self.rooms.get(connection.room_id)
+        if room is not None:
+            room.pop(websocket, None)
+            if not room:
+                del self.rooms[connection.room_id]
+                self.coalescer.discard(connection.room_id)
+                if self.on_room_empty is not None:
+                    self.on_room_empty(connection.room_id)
+
+        connection.close()
+
+    def get_connection(self, connection_id: Optional[str]) -> Optional[Connection]:
+        """
+        Look up a connection by its connection id.
+
+        Args:
+            connection_id: The id assigned when the connection was accepted
+
+        Returns:
+            The connection, or None if it is no longer connected
+        """
+        if connection_id is None:
+            return None
+        return self.connections_by_id.get(connection_id)
+
+    def get_client_connections(self, client_id: str) -> List[Connection]:
+        """
+        Get the open connections of a client, oldest first.
+
+        Args:
+            client_id: The client id the connections were opened with
+
+        Returns:
+            The client's connections
+        """
+        return list(self.connections_by_client.get(client_id, {}).values())
+
+    def get_room_size(self, room_id: str) -> int:
+        """
+        Get the number of connections in a room.
+
+        Args:
+            room_id: The room to inspect
+
+        Returns:
+            The number of connections in the room
+        """
+        return len(self.rooms.get(room_id, ()))
+
+    def send_to(self, websocket: WebSocket, message: str):
+        """
+        Queue a message for a single connection.
+
+        Args:
+            websocket: The recipient WebSocket connection
+            message: The message string to send
+        """
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            self._enqueue(connection, message)
+
+    def send_json(self, websocket: WebSocket, payload: Dict[str, Any]):
+        """
+        Queue a structured message for a single connection, encoded in the
+        connection's negotiated encoding.
+
+        Args:
+            websocket: The recipient WebSocket connection
+            payload: The JSON-serializable dictionary to send
+        """
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            self._enqueue(connection, Frame(payload))
+
+    async def broadcast(self, message: str, room_id: str = DEFAULT_ROOM):
+        """
+        Send a message to every connection in a room.
+
+        Args:
+            message: The message string to broadcast
+            room_id: The room to broadcast to
+        """
+        # Pending edits go out first so the room sees messages in order
+        self.coalescer.flush(room_id)
+        self._deliver(room_id, message)
+
+    async def broadcast_to_others(self, message: str, sender: Optional[WebSocket], room_id: str = DEFAULT_ROOM):
+        """
+        Send a message to every connection in a room except the sender.
+
+        Args:
+            message: The message string to broadcast to all other clients
+            sender: The WebSocket connection to exclude from the broadcast
+            room_id: The room to broadcast to
+        """
+        self.coalescer.flush(room_id)
+        started = time.perf_counter()
+        recipients = list(self.rooms.get(room_id, {}).items())
+        for websocket, connection in recipients:
+            if websocket is not sender:
+                self._enqueue(connection, message)
+        metrics.WS_BROADCAST_SECONDS.observe(time.perf_counter() - started)
+        metrics.WS_BROADCAST_RECIPIENTS.observe(len(recipients))
+
+    async def broadcast_json(self, payload: Dict[str, Any], room_id: str = DEFAULT_ROOM):
+        """
+        Send a JSON payload to every connection in a room.
+
+        The payload is serialized once per encoding and shared by all
+        recipients using it.
+
+        Args:
+            payload: The JSON-serializable dictionary to broadcast
+            room_id: The room to broadcast to
+        """
+        self.coalescer.flush(room_id)
+        self._deliver(room_id, Frame(payload))
+
+    def queue_edit(self, op: Dict[str, Any], room_id: str = DEFAULT_ROOM):
+        """
+        Queue a versioned edit op to be broadcast in the room's next batch.
+
+        Args:
+            op: The versioned 'edit' op
+            room_id: The room to broadcast to
+        """
+        self.coalescer.submit(room_id, op)
+
+    def _deliver(self, room_id: str, message: Union[str, Frame]) -> int:
+        """
+        Queue a message for every connection in a room.
+
+        Returns:
+            The number of recipients
+        """
+        started = time.perf_counter()
+        recipients = list(self.rooms.get(room_id, {}).values())
+        for connection in recipients:
+            self._enqueue(connection, message)
+        metrics.WS_BROADCAST_SECONDS.observe(time.perf_counter() - started)
+        metrics.WS_BROADCAST_RECIPIENTS.observe(len(recipients))
+        return len(recipients)
+
+    def _enqueue(self, connection: Connection, message: Union[str, Frame]):
+        """
+        Queue a message for a connection, applying the slow consumer policy
+        when its queue is full.
+        """
+        if connection.closed:
+            return
+
+        try:
+            connection.queue.put_nowait(message)
+            self.stats["messages_enqueued"] += 1
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.slow_consumer_policy == SLOW_CONSUMER_DROP_OLDEST:
+            # Degrade: discard the oldest pending message to make room
+            connection.queue.get_nowait()
+            connection.queue.put_nowait(message)
+            self.stats["messages_dropped"] += 1
+            return
+
+        # Disconnect the consumer rather than stall the room
+        self.stats["slow_consumer_disconnects"] += 1
+        self.stats["messages_dropped"] += connection.queue.qsize() + 1
+        connection.close(SLOW_CONSUMER_CLOSE_CODE, "Client is not keeping up")
+        self.disconnect(connection.websocket)
+
+    async def _reap_loop(self):
+        """
+        Run a heartbeat and reaping pass every heartbeat interval.
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            self.reap()
+
+    def reap(self) -> int:
+        """
+        Ping heartbeat connections that have been quiet for a heartbeat
+        interval and close those that have been silent for the idle timeout.
+
+        Only clients that opted into heartbeats are considered: they answer a
+        {'type': 'ping'} message with {'type': 'pong'}, and any message they
+        send counts as a sign of life, so active clients are never pinged.
+        Other clients are left to the protocol-level pings.
+
+        Returns:
+            The number of connections closed
+        """
+        now = time.monotonic()
+        # One frame for the whole pass, encoded once per encoding
+        ping = Frame({"type": "ping"})
+        reaped = 0
+
+        for connection in list(self.heartbeat_connections.values()):
+            idle = now - connection.last_seen
+            if idle >= self.idle_timeout:
+                self.stats["idle_disconnects"] += 1
+                connection.close(IDLE_CLOSE_CODE, "Idle timeout")
+                self.disconnect(connection.websocket)
+                reaped += 1
+            elif idle >= self.heartbeat_interval:
+                self.stats["pings_sent"] += 1
+                self._enqueue(connection, ping)
+
+        return reaped
+
+    def _on_sent(self, size: int):
+        """
+        Count a message written to a socket.
+        """
+        self.stats["messages_sent"] += 1
+        self.stats["bytes_sent"] += size
+
+    def _on_send_failure(self, connection: Connection):
+        """
+        Drop a connection whose socket failed during a send.
+        """
+        self.stats["send_failures"] += 1
+        self.disconnect(connection.websocket)
+
+    def get_room_size_distribution(self, bounds=(1, 5, 25, 100, 500)) -> Dict[str, int]:
+        """
+        Count rooms by number of connections, without one entry per room.
+
+        Args:
+            bounds: Upper bounds of the size ranges, ascending
+
+        Returns:
+            A dictionary mapping a size range (e.g. '2-5', '501+') to the
+            number of rooms in it
+        """
+        labels = []
+        lower = 1
+        for bound in bounds:
+            labels.append(str(bound) if lower == bound else f"{lower}-{bound}")
+            lower = bound + 1
+        labels.append(f"{lower}+")
+
+        distribution = dict.fromkeys(labels, 0)
+        for room in self.rooms.values():
+            for label, bound in zip(labels, bounds):
+                if len(room) <= bound:
+                    distribution[label] += 1
+                    break
+            else:
+                distribution[labels[-1]] += 1
+        return distribution
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get connection counts and fan-out counters.
+
+        Returns:
+            A dictionary of counters plus connection and room counts
+        """
+        return {
+            **self.stats,
+            "active_connections": len(self.connections),
+            "clients": len(self.connections_by_client),
+            "heartbeat_connections": len(self.heartbeat_connections),
+            "rooms": len(self.rooms),
+            "coalescing": self.coalescer.get_stats(),
+        }
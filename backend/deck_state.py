@@ -0,0 +1,341 @@
+import copy
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+from backend.slide_generator import validate_slide
+
+
+# Slide fields that can be replaced by an edit
+EDITABLE_FIELDS = ("title", "content", "theme")
+
+
+class DeckState:
+    """
+    Authoritative copy of one room's deck.
+
+    Every accepted change is stamped with a monotonically increasing
+    version and kept in a bounded ring buffer, so a reconnecting client can
+    catch up with only the ops it missed.
+    """
+
+    def __init__(self, max_ops: int):
+        self.slides: Optional[List[dict]] = None
+        self.version = 0
+        self.ops: "deque[Dict[str, Any]]" = deque(maxlen=max_ops)
+        # Set while this copy may have missed ops published elsewhere (e.g.
+        # after its worker stopped following the room)
+        self.stale = False
+
+    def set_deck(self, client_id: str, slides: Any) -> Dict[str, Any]:
+        """
+        Replace the whole deck, e.g. after a client generates a new one.
+
+        Args:
+            client_id: The client that loaded the deck
+            slides: The list of slides
+
+        Returns:
+            The versioned 'deck' op
+
+        Raises:
+            ValueError: If the slides are not a valid list of slides
+        """
+        if not isinstance(slides, list):
+            raise ValueError("'slides' must be a list")
+        for slide in slides:
+            validate_slide(slide)
+
+        self.slides = copy.deepcopy(slides)
+        return self._record({
+            "type": "deck",
+            "client_id": client_id,
+            "slides": slides,
+        })
+
+    def apply_edit(self, client_id: str, slide_index: Any, field: Any, value: Any) -> Dict[str, Any]:
+        """
+        Apply a field edit to the deck.
+
+        Supports whole-field edits ('title', 'content', 'theme') and single
+        bullet edits ('content.<n>').
+
+        Args:
+            client_id: The client that made the edit
+            slide_index: Index of the slide to edit
+            field: Name of the field to edit
+            value: The new value
+
+        Returns:
+            The versioned 'edit' op
+
+        Raises:
+            ValueError: If there is no deck or the edit does not apply to it
+        """
+        self._check_field(slide_index, field)
+        self._set_field(slide_index, field, value)
+
+        return self._record({
+            "type": "edit",
+            "client_id": client_id,
+            "slide_index": slide_index,
+            "field": field,
+            "value": value,
+        })
+
+    def apply_delta(self, client_id: str, slide_index: Any, field: Any, delta: Any) -> Dict[str, Any]:
+        """
+        Apply a text delta (delete then insert at an offset) to a string field.
+
+        The delta is applied against the server's copy of the field, which
+        works for 'title', 'theme' and 'content.<n>'. Offsets past the end
+        of the text are clamped.
+
+        Args:
+            client_id: The client that made the edit
+            slide_index: Index of the slide to edit
+            field: Name of the field to edit
+            delta: Dictionary with 'index', and optional 'delete' (count of
+                characters to remove) and 'insert' (text to add)
+
+        Returns:
+            The versioned 'edit' op, carrying both the resulting 'value' and
+            the 'delta' so it can be sent to either kind of client
+
+        Raises:
+            ValueError: If there is no deck or the delta does not apply to it
+        """
+        self._check_field(slide_index, field)
+
+        if not isinstance(delta, dict):
+            raise ValueError("delta must be an object")
+        index = delta.get("index")
+        delete = delta.get("delete", 0)
+        insert = delta.get("insert", "")
+        if not isinstance(index, int) or isinstance(index, bool) or index < 0:
+            raise ValueError("delta index must be a non-negative integer")
+        if not isinstance(delete, int) or isinstance(delete, bool) or delete < 0:
+            raise ValueError("delta delete must be a non-negative integer")
+        if not isinstance(insert, str):
+            raise ValueError("delta insert must be a string")
+
+        current = self._get_field(slide_index, field)
+        if not isinstance(current, str):
+            raise ValueError(f"Field {field!r} is not text and cannot take a delta")
+
+        index = min(index, len(current))
+        value = current[:index] + insert + current[index + delete:]
+        self._set_field(slide_index, field, value)
+
+        return self._record({
+            "type": "edit",
+            "client_id": client_id,
+            "slide_index": slide_index,
+            "field": field,
+            "value": value,
+            "delta": {"index": index, "delete": delete, "insert": insert},
+        })
+
+    def check_edit(self, slide_index: Any, field: Any):
+        """
+        Check that an edit targets an existing slide and a known field,
+        without applying it.
+
+        Args:
+            slide_index: Index of the slide to edit
+            field: Name of the field to edit
+
+        Raises:
+            ValueError: If there is no deck or the edit does not apply to it
+        """
+        self._check_field(slide_index, field)
+
+    def _check_field(self, slide_index: Any, field: Any):
+        """
+        Check that an edit targets an existing slide and a known field.
+        """
+        if self.slides is None:
+            raise ValueError("No deck loaded in this room")
+        if not isinstance(slide_index, int) or isinstance(slide_index, bool):
+            raise ValueError("slide_index must be an integer")
+        if slide_index < 0 or slide_index >= len(self.slides):
+            raise ValueError(f"Invalid slide index {slide_index}")
+        if not isinstance(field, str):
+            raise ValueError("field must be a string")
+
+        if field in EDITABLE_FIELDS:
+            return
+
+        # Nested bullet edits, e.g. 'content.0'
+        field_parts = field.split(".")
+        if len(field_parts) != 2 or field_parts[0] != "content" or not field_parts[1].isdigit():
+            raise ValueError(f"Unknown field {field!r}")
+        content_index = int(field_parts[1])
+        if content_index >= len(self.slides[slide_index]["content"]):
+            raise ValueError(f"Invalid content index {content_index}")
+
+    def _get_field(self, slide_index: int, field: str) -> Any:
+        """
+        Read a field of a slide; the field must have passed _check_field.
+        """
+        slide = self.slides[slide_index]
+        if field in EDITABLE_FIELDS:
+            return slide[field]
+        return slide["content"][int(field.split(".")[1])]
+
+    def _set_field(self, slide_index: int, field: str, value: Any):
+        """
+        Write a field of a slide; the field must have passed _check_field.
+
+        Raises:
+            ValueError: If the value is not valid for the field
+        """
+        slide = self.slides[slide_index]
+
+        if field in EDITABLE_FIELDS:
+            updated = dict(slide)
+            updated[field] = copy.deepcopy(value)
+            validate_slide(updated)
+            self.slides[slide_index] = updated
+        else:
+            if not isinstance(value, str):
+                raise ValueError("Slide bullets must be strings")
+            slide["content"][int(field.split(".")[1])] = value
+
+    def restore(self, slides: Optional[List[dict]], version: int):
+        """
+        Replace the deck with a snapshot taken elsewhere (e.g. another worker).
+
+        The ring buffer is cleared, so clients behind the snapshot version
+        receive a full snapshot on their next sync, and the deck is no
+        longer stale.
+
+        Args:
+            slides: The snapshot slides
+            version: The snapshot version
+        """
+        self.slides = copy.deepcopy(slides)
+        self.version = version
+        self.ops.clear()
+        self.stale = False
+
+    def sync_message(self, since_version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Build the message that brings a client up to date.
+
+        Args:
+            since_version: The last version the client has seen, if any
+
+        Returns:
+            An 'ops' message with only the missed ops when they are all
+            still buffered, otherwise a full 'snapshot' message
+        """
+        if since_version is not None and 0 <= since_version <= self.version:
+            # Every missed op must still be in the ring buffer
+            missed_all_buffered = bool(self.ops) and since_version + 1 >= self.ops[0]["version"]
+            if since_version == self.version or missed_all_buffered:
+                return {
+                    "type": "ops",
+                    "from_version": since_version,
+                    "version": self.version,
+                    "ops": [op for op in self.ops if op["version"] > since_version],
+                }
+
+        return self.snapshot()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Build a full snapshot of the deck.
+
+        Returns:
+            A 'snapshot' message with the current version and slides
+        """
+        return {
+            "type": "snapshot",
+            "version": self.version,
+            "slides": copy.deepcopy(self.slides),
+        }
+
+    def _record(self, op: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Stamp an op with the next version and add it to the ring buffer.
+        """
+        self.version += 1
+        op["version"] = self.version
+        self.ops.append(op)
+        return op
+
+
+class DeckStore:
+    """
+    Holds the DeckState of each room, evicting the least recently used
+    rooms beyond a fixed limit.
+
+    Rooms for which is_pinned returns True (those with live connections)
+    are never evicted, so the store may briefly hold more than max_rooms
+    decks when every room is in use.
+    """
+
+    def __init__(self, max_rooms: int, max_ops: int):
+        self.max_rooms = max_rooms
+        self.max_ops = max_ops
+        self._decks: "OrderedDict[str, DeckState]" = OrderedDict()
+        # Called with a room id to check whether its deck must be kept
+        self.is_pinned: Optional[Callable[[str], bool]] = None
+
+    def get(self, room_id: str) -> DeckState:
+        """
+        Get the deck of a room, creating an empty one if needed.
+
+        Only call this for rooms that are in use (e.g. from a connection in
+        the room); look up rooms named by HTTP requests with peek.
+
+        Args:
+            room_id: The room identifier
+
+        Returns:
+            The room's DeckState
+        """
+        deck = self._decks.get(room_id)
+        if deck is None:
+            deck = DeckState(self.max_ops)
+            self._decks[room_id] = deck
+            self._evict(keep=room_id)
+        else:
+            self._decks.move_to_end(room_id)
+        return deck
+
+    def peek(self, room_id: str) -> Optional[DeckState]:
+        """
+        Get the deck of a room without creating it or refreshing its recency.
+
+        Args:
+            room_id: The room identifier
+
+        Returns:
+            The room's DeckState, or None if the store has no deck for it
+        """
+        return self._decks.get(room_id)
+
+    def _evict(self, keep: str):
+        """
+        Evict the least recently used unpinned decks beyond max_rooms.
+
+        Args:
+            keep: The room just added, which is never evicted
+        """
+        excess = len(self._decks) - self.max_rooms
+        if excess <= 0:
+            return
+
+        evicted = []
+        for room_id in self._decks:
+            if room_id == keep or (self.is_pinned is not None and self.is_pinned(room_id)):
+                continue
+            evicted.append(room_id)
+            if len(evicted) == excess:
+                break
+
+        for room_id in evicted:
+            del self._decks[room_id]
+
+    def __len__(self) -> int:
+        return len(self._decks)
@@ -0,0 +1,177 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from backend.wire import Frame
+
+
+def fields_overlap(field_a: str, field_b: str) -> bool:
+    """
+    Check whether two edit fields touch the same part of a slide.
+
+    'content' overlaps with every 'content.<n>' bullet edit.
+
+    Args:
+        field_a: The first field name
+        field_b: The second field name
+
+    Returns:
+        True if applying the edits in a different order could change the result
+    """
+    if field_a == field_b:
+        return True
+    return (
+        (field_a == "content" and field_b.startswith("content."))
+        or (field_b == "content" and field_a.startswith("content."))
+    )
+
+
+class _PendingBatch:
+    """
+    Edits waiting to be flushed for one room.
+    """
+
+    def __init__(self):
+        # Ops in arrival order; superseded ops are replaced with None
+        self.ops: List[Optional[Dict[str, Any]]] = []
+        self.positions: Dict[Tuple[Any, Any], int] = {}
+        self.from_version: Optional[int] = None
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+
+class EditCoalescer:
+    """
+    Collapses bursts of edits into one batched frame per room.
+
+    Within a flush window, successive edits to the same (slide_index, field)
+    are collapsed into the latest value. At the end of the window the room
+    receives a single Frame, encoded once per wire encoding and shared by
+    every recipient.
+    Ops keep their arrival order, so each client's edits stay in order.
+    """
+
+    def __init__(self, flush_interval: float, send: Callable[[str, Frame], int]):
+        """
+        Args:
+            flush_interval: Length of the coalescing window in seconds;
+                0 flushes every edit immediately
+            send: Callback taking (room_id, frame) that delivers a frame to
+                the room and returns the number of recipients
+        """
+        self.flush_interval = flush_interval
+        self._send = send
+        self._pending: Dict[str, _PendingBatch] = {}
+        self.stats = {
+            "edits_received": 0,
+            "edits_coalesced": 0,
+            "frames_sent": 0,
+        }
+
+    def submit(self, room_id: str, op: Dict[str, Any]):
+        """
+        Queue a versioned edit op for the room's next batch.
+
+        Args:
+            room_id: The room the edit belongs to
+            op: The versioned 'edit' op returned by DeckState.apply_edit
+        """
+        self.stats["edits_received"] += 1
+
+        batch = self._pending.get(room_id)
+        if batch is None:
+            batch = _PendingBatch()
+            batch.from_version = op["version"] - 1
+            self._pending[room_id] = batch
+
+        key = (op["slide_index"], op["field"])
+        previous = batch.positions.get(key)
+        if previous is not None and not self._overlaps_after(batch, previous, op):
+            # Superseded by this edit
+            batch.ops[previous] = None
+            self.stats["edits_coalesced"] += 1
+            if "delta" in op:
+                # The delta alone no longer describes the change from the
+                # last value clients saw, so send the full value instead
+                op = {key: value for key, value in op.items() if key != "delta"}
+
+        batch.positions[key] = len(batch.ops)
+        batch.ops.append(op)
+
+        if self.flush_interval <= 0:
+            self.flush(room_id)
+        elif batch.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            batch.flush_handle = loop.call_later(self.flush_interval, self.flush, room_id)
+
+    def flush(self, room_id: str):
+        """
+        Send the room's pending edits now.
+
+        Called when the window closes, and before any other message is
+        broadcast to the room so that ordering is preserved.
+
+        Args:
+            room_id: The room to flush
+        """
+        batch = self._pending.pop(room_id, None)
+        if batch is None:
+            return
+
+        if batch.flush_handle is not None:
+            batch.flush_handle.cancel()
+
+        ops = [op for op in batch.ops if op is not None]
+        last_version = ops[-1]["version"]
+
+        if len(ops) == 1 and batch.from_version == last_version - 1:
+            # Nothing was coalesced; send the plain edit
+            frame = Frame(ops[0])
+        else:
+            frame = Frame({
+                "type": "edit_batch",
+                "from_version": batch.from_version,
+                "version": last_version,
+                "ops": ops,
+            })
+
+        self._send(room_id, frame)
+        self.stats["frames_sent"] += 1
+
+    def discard(self, room_id: str):
+        """
+        Drop the pending edits of a room that no longer has any connections.
+
+        Args:
+            room_id: The room to discard
+        """
+        batch = self._pending.pop(room_id, None)
+        if batch is not None and batch.flush_handle is not None:
+            batch.flush_handle.cancel()
+
+    @staticmethod
+    def _overlaps_after(batch: _PendingBatch, position: int, op: Dict[str, Any]) -> bool:
+        """
+        Check whether an edit queued after position touches the same part of
+        the same slide, in which case the earlier edit cannot be dropped.
+        """
+        for later in batch.ops[position + 1:]:
+            if (
+                later is not None
+                and later["slide_index"] == op["slide_index"]
+                and fields_overlap(later["field"], op["field"])
+            ):
+                return True
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the coalescing counters.
+
+        Returns:
+            A dictionary of counters plus the coalescing ratio (edits
+            received per edit broadcast)
+        """
+        broadcast = self.stats["edits_received"] - self.stats["edits_coalesced"]
+        return {
+            **self.stats,
+            "pending_rooms": len(self._pending),
+            "coalescing_ratio": (self.stats["edits_received"] / broadcast) if broadcast else 1.0,
+        }
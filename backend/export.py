@@ -0,0 +1,633 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import re
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from backend import metrics
+from backend.cache import LRUTTLCache
+
+
+EXPORT_PPTX = "pptx"
+EXPORT_PDF = "pdf"
+
+EXPORT_MEDIA_TYPES = {
+    EXPORT_PPTX: "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    EXPORT_PDF: "application/pdf",
+}
+
+# Bump when the rendering of a slide changes, so cached parts are not reused
+RENDER_VERSION = 1
+
+# Background, title and body colors of each theme; unknown themes use DEFAULT_THEME
+THEME_COLORS = {
+    "professional": ("FFFFFF", "1F3864", "333333"),
+    "corporate": ("FFFFFF", "1F3864", "333333"),
+    "creative": ("FFF7E6", "C0392B", "4A4A4A"),
+    "modern": ("1E1E2E", "FFFFFF", "D0D0D8"),
+    "dark": ("1E1E2E", "FFFFFF", "D0D0D8"),
+    "minimalist": ("FFFFFF", "111111", "555555"),
+    "minimal": ("FFFFFF", "111111", "555555"),
+}
+DEFAULT_THEME = "professional"
+
+# Characters that are not allowed in XML documents
+_INVALID_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def theme_colors(theme: str) -> Tuple[str, str, str]:
+    """
+    Get the (background, title, body) hex colors of a theme.
+    """
+    return THEME_COLORS.get(theme.strip().lower(), THEME_COLORS[DEFAULT_THEME])
+
+
+def slide_text(slide: Dict[str, Any]) -> Tuple[str, List[str]]:
+    """
+    Get the title and bullet points of a slide as clean strings.
+    """
+    title = _INVALID_XML_CHARS.sub("", str(slide.get("title", "")))
+    bullets = [_INVALID_XML_CHARS.sub("", str(item)) for item in slide.get("content", [])]
+    return title, bullets
+
+
+def slide_hash(export_format: str, slide: Dict[str, Any]) -> str:
+    """
+    Hash the content of a slide to key its rendered part.
+
+    Args:
+        export_format: EXPORT_PPTX or EXPORT_PDF
+        slide: The slide (title, content, theme)
+
+    Returns:
+        A hex digest that changes whenever the rendered part would
+    """
+    title, bullets = slide_text(slide)
+    key_material = json.dumps(
+        [RENDER_VERSION, export_format, title, bullets, str(slide.get("theme", ""))],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+# --- PPTX ------------------------------------------------------------------
+
+# 16:9 slide size in EMUs
+PPTX_WIDTH = 12192000
+PPTX_HEIGHT = 6858000
+PPTX_MARGIN = 609600
+
+_NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+_NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_P = "http://schemas.openxmlformats.org/presentationml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_NAMESPACES = f'xmlns:a="{_NS_A}" xmlns:r="{_NS_R}" xmlns:p="{_NS_P}"'
+
+_EMPTY_SP_TREE = (
+    '<p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr>'
+    '<p:grpSpPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="0" cy="0"/>'
+    '<a:chOff x="0" y="0"/><a:chExt cx="0" cy="0"/></a:xfrm></p:grpSpPr>'
+)
+
+_SLIDE_LAYOUT_XML = (
+    f'{_XML_DECLARATION}<p:sldLayout {_NAMESPACES} type="blank" preserve="1">'
+    f'<p:cSld name="Blank"><p:spTree>{_EMPTY_SP_TREE}</p:spTree></p:cSld>'
+    '<p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sldLayout>'
+)
+
+_SLIDE_MASTER_XML = (
+    f'{_XML_DECLARATION}<p:sldMaster {_NAMESPACES}>'
+    '<p:cSld><p:bg><p:bgRef idx="1001"><a:schemeClr val="bg1"/></p:bgRef></p:bg>'
+    f'<p:spTree>{_EMPTY_SP_TREE}</p:spTree></p:cSld>'
+    '<p:clrMap bg1="lt1" tx1="dk1" bg2="lt2" tx2="dk2" accent1="accent1" accent2="accent2" '
+    'accent3="accent3" accent4="accent4" accent5="accent5" accent6="accent6" '
+    'hlink="hlink" folHlink="folHlink"/>'
+    '<p:sldLayoutIdLst><p:sldLayoutId id="2147483649" r:id="rId1"/></p:sldLayoutIdLst>'
+    '</p:sldMaster>'
+)
+
+
+def _theme_xml() -> str:
+    colors = "".join(
+        f'<a:{name}><a:srgbClr val="{value}"/></a:{name}>'
+        for name, value in (
+            ("dk1", "000000"), ("lt1", "FFFFFF"), ("dk2", "1F3864"), ("lt2", "E7E6E6"),
+            ("accent1", "4A90E2"), ("accent2", "ED7D31"), ("accent3", "A5A5A5"),
+            ("accent4", "FFC000"), ("accent5", "5B9BD5"), ("accent6", "70AD47"),
+            ("hlink", "0563C1"), ("folHlink", "954F72"),
+        )
+    )
+    font = '<a:latin typeface="Calibri"/><a:ea typeface=""/><a:cs typeface=""/>'
+    fill = '<a:solidFill><a:schemeClr val="phClr"/></a:solidFill>'
+    line = f'<a:ln w="9525">{fill}</a:ln>'
+    effect = '<a:effectStyle><a:effectLst/></a:effectStyle>'
+    return (
+        f'{_XML_DECLARATION}<a:theme xmlns:a="{_NS_A}" name="Smart Slides"><a:themeElements>'
+        f'<a:clrScheme name="Smart Slides">{colors}</a:clrScheme>'
+        f'<a:fontScheme name="Smart Slides"><a:majorFont>{font}</a:majorFont>'
+        f'<a:minorFont>{font}</a:minorFont></a:fontScheme>'
+        f'<a:fmtScheme name="Smart Slides"><a:fillStyleLst>{fill * 3}</a:fillStyleLst>'
+        f'<a:lnStyleLst>{line * 3}</a:lnStyleLst>'
+        f'<a:effectStyleLst>{effect * 3}</a:effectStyleLst>'
+        f'<a:bgFillStyleLst>{fill * 3}</a:bgFillStyleLst></a:fmtScheme>'
+        '</a:themeElements></a:theme>'
+    )
+
+
+def _pptx_run(text: str, size: int, color: str, bold: bool = False) -> str:
+    bold_attribute = ' b="1"' if bold else ""
+    return (
+        f'<a:r><a:rPr lang="en-US" sz="{size}"{bold_attribute} dirty="0">'
+        f'<a:solidFill><a:srgbClr val="{color}"/></a:solidFill></a:rPr>'
+        f'<a:t>{escape(text)}</a:t></a:r>'
+    )
+
+
+def _pptx_text_box(shape_id: int, name: str, y: int, height: int, anchor: str, paragraphs: str) -> str:
+    return (
+        f'<p:sp><p:nvSpPr><p:cNvPr id="{shape_id}" name="{name}"/><p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>'
+        f'<p:spPr><a:xfrm><a:off x="{PPTX_MARGIN}" y="{y}"/>'
+        f'<a:ext cx="{PPTX_WIDTH - 2 * PPTX_MARGIN}" cy="{height}"/></a:xfrm>'
+        '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/></p:spPr>'
+        f'<p:txBody><a:bodyPr wrap="square" anchor="{anchor}"><a:normAutofit/></a:bodyPr>'
+        f'<a:lstStyle/>{paragraphs}</p:txBody></p:sp>'
+    )
+
+
+def render_pptx_slide(slide: Dict[str, Any]) -> bytes:
+    """
+    Render one slide as the slide XML part of a PPTX package.
+
+    Args:
+        slide: The slide (title, content, theme)
+
+    Returns:
+        The UTF-8 encoded slide XML
+    """
+    title, bullets = slide_text(slide)
+    background, title_color, body_color = theme_colors(str(slide.get("theme", "")))
+
+    title_paragraph = f'<a:p>{_pptx_run(title, 4000, title_color, bold=True)}</a:p>'
+    body_paragraphs = "".join(
+        '<a:p><a:pPr marL="342900" indent="-342900"><a:buFont typeface="Arial"/><a:buChar char="&#8226;"/></a:pPr>'
+        f'{_pptx_run(bullet, 2400, body_color)}</a:p>'
+        for bullet in bullets
+    ) or '<a:p><a:endParaRPr lang="en-US"/></a:p>'
+
+    title_height = 1371600
+    body_y = PPTX_MARGIN + title_height + 228600
+    xml = (
+        f'{_XML_DECLARATION}<p:sld {_NAMESPACES}><p:cSld>'
+        f'<p:bg><p:bgPr><a:solidFill><a:srgbClr val="{background}"/></a:solidFill><a:effectLst/></p:bgPr></p:bg>'
+        f'<p:spTree>{_EMPTY_SP_TREE}'
+        f'{_pptx_text_box(2, "Title", PPTX_MARGIN, title_height, "b", title_paragraph)}'
+        f'{_pptx_text_box(3, "Content", body_y, PPTX_HEIGHT - body_y - PPTX_MARGIN, "t", body_paragraphs)}'
+        '</p:spTree></p:cSld><p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sld>'
+    )
+    return xml.encode("utf-8")
+
+
+def _relationships(relationships: List[Tuple[str, str, str]]) -> str:
+    entries = "".join(
+        f'<Relationship Id="{rel_id}" Type="{rel_type}" Target="{target}"/>'
+        for rel_id, rel_type, target in relationships
+    )
+    return f'{_XML_DECLARATION}<Relationships xmlns="{_NS_REL}">{entries}</Relationships>'
+
+
+def assemble_pptx(slide_parts: List[bytes], title: str) -> bytes:
+    """
+    Assemble rendered slide parts into a PPTX package.
+
+    Args:
+        slide_parts: The output of render_pptx_slide for each slide, in order
+        title: The document title
+
+    Returns:
+        The PPTX file
+    """
+    count = len(slide_parts)
+    content_type = "application/vnd.openxmlformats-officedocument.presentationml"
+    overrides = [
+        ("/ppt/presentation.xml", f"{content_type}.presentation.main+xml"),
+        ("/ppt/slideMasters/slideMaster1.xml", f"{content_type}.slideMaster+xml"),
+        ("/ppt/slideLayouts/slideLayout1.xml", f"{content_type}.slideLayout+xml"),
+        ("/ppt/theme/theme1.xml", "application/vnd.openxmlformats-officedocument.theme+xml"),
+        ("/docProps/core.xml", "application/vnd.openxmlformats-package.core-properties+xml"),
+        ("/docProps/app.xml", "application/vnd.openxmlformats-officedocument.extended-properties+xml"),
+    ] + [(f"/ppt/slides/slide{number}.xml", f"{content_type}.slide+xml") for number in range(1, count + 1)]
+    content_types = (
+        f'{_XML_DECLARATION}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        + "".join(f'<Override PartName="{part}" ContentType="{value}"/>' for part, value in overrides)
+        + "</Types>"
+    )
+
+    slide_ids = "".join(
+        f'<p:sldId id="{255 + number}" r:id="rId{number + 2}"/>' for number in range(1, count + 1)
+    )
+    presentation = (
+        f'{_XML_DECLARATION}<p:presentation {_NAMESPACES}>'
+        '<p:sldMasterIdLst><p:sldMasterId id="2147483648" r:id="rId1"/></p:sldMasterIdLst>'
+        + (f"<p:sldIdLst>{slide_ids}</p:sldIdLst>" if count else "")
+        + f'<p:sldSz cx="{PPTX_WIDTH}" cy="{PPTX_HEIGHT}"/><p:notesSz cx="6858000" cy="9144000"/>'
+        '</p:presentation>'
+    )
+    core = (
+        f'{_XML_DECLARATION}<cp:coreProperties '
+        'xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+        'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f'<dc:title>{escape(_INVALID_XML_CHARS.sub("", title))}</dc:title><dc:creator>Smart Slides</dc:creator>'
+        '</cp:coreProperties>'
+    )
+    app = (
+        f'{_XML_DECLARATION}<Properties '
+        'xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+        f'<Application>Smart Slides</Application><Slides>{count}</Slides></Properties>'
+    )
+
+    parts = [
+        ("[Content_Types].xml", content_types),
+        ("_rels/.rels", _relationships([
+            ("rId1", f"{_REL_TYPE}/officeDocument", "ppt/presentation.xml"),
+            ("rId2", "http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties",
+             "docProps/core.xml"),
+            ("rId3", f"{_REL_TYPE}/extended-properties", "docProps/app.xml"),
+        ])),
+        ("docProps/core.xml", core),
+        ("docProps/app.xml", app),
+        ("ppt/presentation.xml", presentation),
+        ("ppt/_rels/presentation.xml.rels", _relationships(
+            [("rId1", f"{_REL_TYPE}/slideMaster", "slideMasters/slideMaster1.xml"),
+             ("rId2", f"{_REL_TYPE}/theme", "theme/theme1.xml")]
+            + [(f"rId{number + 2}", f"{_REL_TYPE}/slide", f"slides/slide{number}.xml")
+               for number in range(1, count + 1)]
+        )),
+        ("ppt/slideMasters/slideMaster1.xml", _SLIDE_MASTER_XML),
+        ("ppt/slideMasters/_rels/slideMaster1.xml.rels", _relationships([
+            ("rId1", f"{_REL_TYPE}/slideLayout", "../slideLayouts/slideLayout1.xml"),
+            ("rId2", f"{_REL_TYPE}/theme", "../theme/theme1.xml"),
+        ])),
+        ("ppt/slideLayouts/slideLayout1.xml", _SLIDE_LAYOUT_XML),
+        ("ppt/slideLayouts/_rels/slideLayout1.xml.rels", _relationships([
+            ("rId1", f"{_REL_TYPE}/slideMaster", "../slideMasters/slideMaster1.xml"),
+        ])),
+        ("ppt/theme/theme1.xml", _theme_xml()),
+    ]
+    slide_rels = _relationships([("rId1", f"{_REL_TYPE}/slideLayout", "../slideLayouts/slideLayout1.xml")])
+    for number, part in enumerate(slide_parts, start=1):
+        parts.append((f"ppt/slides/slide{number}.xml", part))
+        parts.append((f"ppt/slides/_rels/slide{number}.xml.rels", slide_rels))
+
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as package:
+        for name, data in parts:
+            # Fixed timestamps keep the output identical for identical decks
+            info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            package.writestr(info, data)
+    return buffer.getvalue()
+
+
+# --- PDF -------------------------------------------------------------------
+
+# 16:9 page size in points
+PDF_WIDTH = 960
+PDF_HEIGHT = 540
+PDF_MARGIN = 60
+PDF_TITLE_SIZE = 34
+PDF_BODY_SIZES = (22, 20, 18, 16, 14, 12)
+
+# Helvetica advance widths (per 1000 units of font size) for ASCII 32-126
+_HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+# Helvetica-Bold is wider; wrap bold text as if it were this much wider
+_BOLD_WIDTH_FACTOR = 1.1
+
+
+def _text_width(text: str, size: float, bold: bool = False) -> float:
+    units = sum(
+        _HELVETICA_WIDTHS[ord(char) - 32] if 32 <= ord(char) <= 126 else 556
+        for char in text
+    )
+    return units * size / 1000 * (_BOLD_WIDTH_FACTOR if bold else 1.0)
+
+
+def _wrap(text: str, size: float, width: float, bold: bool = False) -> List[str]:
+    """
+    Greedily wrap text into lines no wider than width; overlong words are split.
+    """
+    lines: List[str] = []
+    line = ""
+    for word in text.split():
+        candidate = f"{line} {word}" if line else word
+        if _text_width(candidate, size, bold) <= width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        line = ""
+        while _text_width(word, size, bold) > width:
+            cut = len(word) - 1
+            while cut > 1 and _text_width(word[:cut], size, bold) > width:
+                cut -= 1
+            lines.append(word[:cut])
+            word = word[cut:]
+        line = word
+    if line:
+        lines.append(line)
+    return lines or [""]
+
+
+def _pdf_string(text: str) -> str:
+    encoded = text.encode("cp1252", errors="replace").decode("latin-1")
+    return "(" + encoded.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def _pdf_color(hex_color: str) -> str:
+    return " ".join(f"{int(hex_color[index:index + 2], 16) / 255:.3f}" for index in (0, 2, 4))
+
+
+def render_pdf_page(slide: Dict[str, Any]) -> bytes:
+    """
+    Render one slide as the compressed content stream of a PDF page.
+
+    The body font shrinks until every bullet fits on the page; lines that
+    still do not fit at the smallest size are cut off.
+
+    Args:
+        slide: The slide (title, content, theme)
+
+    Returns:
+        The zlib-compressed page content stream
+    """
+    title, bullets = slide_text(slide)
+    background, title_color, body_color = theme_colors(str(slide.get("theme", "")))
+    text_width = PDF_WIDTH - 2 * PDF_MARGIN
+
+    commands = [f"{_pdf_color(background)} rg", f"0 0 {PDF_WIDTH} {PDF_HEIGHT} re f"]
+
+    y = PDF_HEIGHT - PDF_MARGIN - PDF_TITLE_SIZE
+    commands.append(f"BT /F2 {PDF_TITLE_SIZE} Tf {_pdf_color(title_color)} rg")
+    for line in _wrap(title, PDF_TITLE_SIZE, text_width, bold=True)[:2]:
+        commands.append(f"1 0 0 1 {PDF_MARGIN} {y:.1f} Tm {_pdf_string(line)} Tj")
+        y -= PDF_TITLE_SIZE * 1.2
+    commands.append("ET")
+
+    top = y - 16
+    bottom = PDF_MARGIN
+    for size in PDF_BODY_SIZES:
+        indent = size * 1.2
+        wrapped = [_wrap(bullet, size, text_width - indent) for bullet in bullets]
+        needed = sum(len(lines) * size * 1.3 + size * 0.5 for lines in wrapped)
+        if needed <= top - bottom:
+            break
+
+    commands.append(f"BT /F1 {size} Tf {_pdf_color(body_color)} rg")
+    y = top - size
+    for lines in wrapped:
+        if y < bottom:
+            break
+        commands.append(f"1 0 0 1 {PDF_MARGIN} {y:.1f} Tm {_pdf_string(chr(8226))} Tj")
+        for line in lines:
+            if y < bottom:
+                break
+            commands.append(f"1 0 0 1 {PDF_MARGIN + indent:.1f} {y:.1f} Tm {_pdf_string(line)} Tj")
+            y -= size * 1.3
+        y -= size * 0.5
+    commands.append("ET")
+
+    return zlib.compress("\n".join(commands).encode("latin-1"))
+
+
+def assemble_pdf(page_streams: List[bytes], title: str) -> bytes:
+    """
+    Assemble rendered page content streams into a PDF document.
+
+    Args:
+        page_streams: The output of render_pdf_page for each slide, in order
+        title: The document title
+
+    Returns:
+        The PDF file
+    """
+    count = len(page_streams)
+    # Objects 1-5 are fixed; each page then takes a page and a content object
+    page_ids = [6 + 2 * index for index in range(count)]
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] /Count {count} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        f"<< /Title {_pdf_string(title)} /Producer (Smart Slides) >>".encode("latin-1"),
+    ]
+    for page_id, stream in zip(page_ids, page_streams):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PDF_WIDTH} {PDF_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(
+            f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode() + stream + b"\nendstream"
+        )
+
+    output = BytesIO()
+    output.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref_offset = output.tell()
+    output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode())
+    output.write(
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R /Info 5 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n".encode()
+    )
+    return output.getvalue()
+
+
+_RENDERERS = {EXPORT_PPTX: render_pptx_slide, EXPORT_PDF: render_pdf_page}
+_ASSEMBLERS = {EXPORT_PPTX: assemble_pptx, EXPORT_PDF: assemble_pdf}
+
+
+def render_slides(export_format: str, slides: List[Dict[str, Any]]) -> List[bytes]:
+    """
+    Render a list of slides; runs in a worker process.
+    """
+    render = _RENDERERS[export_format]
+    return [render(slide) for slide in slides]
+
+
+def assemble_document(export_format: str, parts: List[bytes], title: str) -> bytes:
+    """
+    Assemble rendered parts into a document; runs in a worker process.
+    """
+    return _ASSEMBLERS[export_format](parts, title)
+
+
+class DeckExporter:
+    """
+    Renders decks to PPTX and PDF on a bounded process pool.
+
+    Rendering is CPU-bound, so it runs on the pool instead of on the event
+    loop. Each slide is rendered on its own into the part it becomes in the
+    document (the slide XML of a PPTX, the compressed page content of a PDF)
+    and cached by a hash of its content, so re-exporting a deck after
+    editing one slide renders only that slide. Exports of the same deck in
+    the same format that overlap in time share a single job, including its
+    result or error.
+
+    Both formats are written with the standard library only: the PPTX is a
+    minimal Office Open XML package with one blank layout and a text box per
+    title and body, and the PDF uses the built-in Helvetica fonts.
+    """
+
+    # Missing slides are sent to the pool in chunks of this size, so a large
+    # deck spreads over the workers without one task per slide
+    RENDER_CHUNK_SIZE = 8
+
+    def __init__(self, max_workers: int, cache_max_slides: int, cache_ttl: float):
+        self.max_workers = max_workers
+        self.cache = LRUTTLCache(max_entries=cache_max_slides, ttl_seconds=cache_ttl)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, "asyncio.Task"] = {}
+        self.stats = {
+            "exports": 0,
+            "shared": 0,
+            "errors": 0,
+            "slides_rendered": 0,
+            "slides_cached": 0,
+        }
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Created on first use so that importing the app does not start processes.
+        # Spawned workers do not inherit the server's event loop or sockets.
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def export(self, slides: List[Dict[str, Any]], export_format: str, title: str) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Export a deck, sharing the job with any identical export in flight.
+
+        Args:
+            slides: The validated slides
+            export_format: EXPORT_PPTX or EXPORT_PDF
+            title: The document title
+
+        Returns:
+            A tuple of (document bytes, info) where info reports the number
+            of slides rendered and taken from the cache, and whether the job
+            was shared with another request
+
+        Raises:
+            ValueError: If the format is not supported
+            Exception: If rendering fails
+        """
+        if export_format not in _RENDERERS:
+            raise ValueError(f"Unsupported export format {export_format!r}; use one of {sorted(_RENDERERS)}")
+
+        hashes = [slide_hash(export_format, slide) for slide in slides]
+        job_key = hashlib.sha256(json.dumps([export_format, title, hashes]).encode("utf-8")).hexdigest()
+
+        inflight = self._inflight.get(job_key)
+        if inflight is not None:
+            self.stats["shared"] += 1
+            document, info = await asyncio.shield(inflight)
+            return document, {**info, "shared": True}
+
+        # Run the job as its own task so that a cancelled leader request does
+        # not cancel the followers waiting on the same export
+        task = asyncio.ensure_future(self._export(slides, hashes, export_format, title))
+        self._inflight[job_key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(job_key, None))
+
+        document, info = await asyncio.shield(task)
+        return document, {**info, "shared": False}
+
+    async def _export(self, slides: List[Dict[str, Any]], hashes: List[str],
+                      export_format: str, title: str) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Render the slides missing from the cache, then assemble the document.
+        """
+        started = time.perf_counter()
+        self.stats["exports"] += 1
+        loop = asyncio.get_running_loop()
+        try:
+            parts: List[Optional[bytes]] = [self.cache.get(key) for key in hashes]
+            missing = [index for index, part in enumerate(parts) if part is None]
+
+            pool = self._get_pool()
+            chunks = [missing[start:start + self.RENDER_CHUNK_SIZE]
+                      for start in range(0, len(missing), self.RENDER_CHUNK_SIZE)]
+            rendered_chunks = await asyncio.gather(*[
+                loop.run_in_executor(pool, render_slides, export_format, [slides[index] for index in chunk])
+                for chunk in chunks
+            ])
+            for chunk, rendered in zip(chunks, rendered_chunks):
+                for index, part in zip(chunk, rendered):
+                    parts[index] = part
+                    self.cache.set(hashes[index], part)
+
+            document = await loop.run_in_executor(pool, assemble_document, export_format, parts, title)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool next time
+            self._discard_pool()
+            self.stats["errors"] += 1
+            metrics.EXPORT_SECONDS.labels(export_format, "error").observe(time.perf_counter() - started)
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            metrics.EXPORT_SECONDS.labels(export_format, "error").observe(time.perf_counter() - started)
+            raise
+
+        self.stats["slides_rendered"] += len(missing)
+        self.stats["slides_cached"] += len(slides) - len(missing)
+        metrics.EXPORT_SECONDS.labels(export_format, "ok").observe(time.perf_counter() - started)
+        return document, {"slides_rendered": len(missing), "slides_cached": len(slides) - len(missing)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the export counters.
+
+        Returns:
+            A dictionary of export and render cache counters plus current sizes
+        """
+        return {
+            **self.stats,
+            "inflight": len(self._inflight),
+            "cached_slides": len(self.cache),
+            "workers": self.max_workers,
+        }
+
+    def _discard_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def close(self):
+        """
+        Shut the process pool down, abandoning queued renders.
+        """
+        self._discard_pool()
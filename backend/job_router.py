@@ -0,0 +1,206 @@
+import asyncio
+import uuid
+from typing import Any, Callable, Dict, Optional
+from backend.backplane import Backplane
+from backend.jobs import JobQueue, JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED
+
+
+# Separates the owning worker's id from the rest of a job id
+JOB_ID_SEPARATOR = "-"
+
+
+class JobRouter:
+    """
+    Finds generation jobs across workers.
+
+    A job runs on the worker that accepted it, and its id starts with that
+    worker's id. Looking up, cancelling or watching a job owned by another
+    worker is forwarded to the owner over the backplane, so a client can
+    follow a job through any worker, e.g. behind uvicorn --workers, which
+    cannot route a client's requests to a given process.
+
+    WebSocket subscribers of a job owned by another worker are sent its
+    updates by polling the owner, which also keeps the job from being
+    abandoned.
+    """
+
+    # How long to wait for the owning worker to answer
+    REQUEST_TIMEOUT = 2.0
+
+    # How often a job owned by another worker is polled for its subscribers
+    WATCH_INTERVAL = 1.0
+
+    def __init__(self, job_queue: JobQueue, backplane: Backplane, notify: Callable[[Any, Dict[str, Any]], None]):
+        """
+        Args:
+            job_queue: This worker's job queue
+            backplane: The backplane shared with the other workers
+            notify: Sends a message to a subscriber (a WebSocket)
+        """
+        self.job_queue = job_queue
+        self.backplane = backplane
+        self._notify = notify
+        self.backplane.on_direct = self.handle_direct
+        # Requests waiting for the owning worker's reply, by request id
+        self._pending: Dict[str, "asyncio.Future"] = {}
+        # Polling tasks of subscribers to other workers' jobs
+        self._watchers: Dict[Any, Dict[str, "asyncio.Task"]] = {}
+
+    @staticmethod
+    def make_queue_id_prefix(backplane: Backplane) -> str:
+        """
+        Get the job id prefix that names this worker as a job's owner.
+
+        Args:
+            backplane: The backplane shared with the other workers
+
+        Returns:
+            The prefix to pass to JobQueue
+        """
+        return backplane.worker_id + JOB_ID_SEPARATOR
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Describe a job, wherever it runs. Counts as the client still waiting for it.
+
+        Args:
+            job_id: The job id
+
+        Returns:
+            The job's description (see JobQueue.describe), or None if it is
+            unknown, has expired or its worker did not answer
+        """
+        job = self.job_queue.get(job_id)
+        if job is not None:
+            return self.job_queue.describe(job)
+        return await self._forward("get", job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a queued or running job, wherever it runs.
+
+        Args:
+            job_id: The job id
+
+        Returns:
+            The job's description after cancelling, or None if it is
+            unknown, has expired or its worker did not answer
+        """
+        job = self.job_queue.cancel(job_id)
+        if job is not None:
+            return self.job_queue.describe(job)
+        return await self._forward("cancel", job_id)
+
+    async def subscribe(self, job_id: str, subscriber: Any) -> bool:
+        """
+        Send a job's updates to a subscriber until it finishes, wherever the
+        job runs. The current state is sent right away.
+
+        Args:
+            job_id: The job id
+            subscriber: The WebSocket to notify
+
+        Returns:
+            Whether the job was found
+        """
+        if self.job_queue.subscribe(job_id, subscriber) is not None:
+            return True
+
+        info = await self._forward("get", job_id)
+        if info is None:
+            return False
+        self._notify(subscriber, {"type": "job", **info})
+        if not self._is_done(info):
+            watchers = self._watchers.setdefault(subscriber, {})
+            if job_id not in watchers:
+                watchers[job_id] = asyncio.ensure_future(self._watch(job_id, subscriber, info["status"]))
+        return True
+
+    def unsubscribe_all(self, subscriber: Any):
+        """
+        Forget a subscriber, e.g. when its WebSocket closes.
+        """
+        self.job_queue.unsubscribe_all(subscriber)
+        for task in self._watchers.pop(subscriber, {}).values():
+            task.cancel()
+
+    async def handle_direct(self, message: Dict[str, Any]):
+        """
+        Answer another worker's request about one of our jobs, or take the
+        reply to one of ours.
+
+        Args:
+            message: A message sent directly to this worker
+        """
+        kind = message.get("kind")
+
+        if kind == "job_request":
+            job_id = str(message.get("job_id"))
+            if message.get("op") == "cancel":
+                job = self.job_queue.cancel(job_id)
+            else:
+                job = self.job_queue.get(job_id)
+            await self.backplane.send(str(message.get("reply_to")), {
+                "kind": "job_reply",
+                "request_id": message.get("request_id"),
+                "job": self.job_queue.describe(job) if job is not None else None,
+            })
+            return
+
+        if kind == "job_reply":
+            future = self._pending.get(message.get("request_id"))
+            if future is not None and not future.done():
+                future.set_result(message.get("job"))
+
+    async def _forward(self, op: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Ask the worker that owns a job to look it up or cancel it.
+        """
+        owner, separator, _ = job_id.partition(JOB_ID_SEPARATOR)
+        if not separator or owner == self.backplane.worker_id or not self.backplane.distributed:
+            return None
+
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self.backplane.send(owner, {
+                "kind": "job_request",
+                "op": op,
+                "job_id": job_id,
+                "request_id": request_id,
+                "reply_to": self.backplane.worker_id,
+            })
+            return await asyncio.wait_for(future, self.REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            # The owner is gone, and its jobs with it
+            return None
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _watch(self, job_id: str, subscriber: Any, status: str):
+        """
+        Poll another worker's job and send its state changes to a subscriber.
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.WATCH_INTERVAL)
+                info = await self._forward("get", job_id)
+                if info is None:
+                    self._notify(subscriber, {"type": "error", "message": f"Unknown job: {job_id}"})
+                    return
+                if info["status"] != status:
+                    status = info["status"]
+                    self._notify(subscriber, {"type": "job", **info})
+                if self._is_done(info):
+                    return
+        finally:
+            watchers = self._watchers.get(subscriber)
+            if watchers is not None and watchers.get(job_id) is asyncio.current_task():
+                del watchers[job_id]
+                if not watchers:
+                    del self._watchers[subscriber]
+
+    @staticmethod
+    def _is_done(info: Dict[str, Any]) -> bool:
+        return info.get("status") in (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
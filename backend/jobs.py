@@ -0,0 +1,478 @@
+import asyncio
+import math
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from backend import metrics
+
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+# Job priorities, highest first
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while its lane of the queue is full.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"The generation queue is full. Retry in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+class Job:
+    """
+    One queued slide generation and its outcome.
+    """
+
+    def __init__(self, query: str, bypass_cache: bool, priority: str, id_prefix: str = ""):
+        self.id = id_prefix + uuid.uuid4().hex
+        self.query = query
+        self.bypass_cache = bypass_cache
+        self.priority = priority
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.enqueued = time.monotonic()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        # Last time a client polled the job; subscribers keep it alive instead
+        self.last_seen = self.enqueued
+        self.subscribers: Set[Any] = set()
+        self.task: Optional["asyncio.Task"] = None
+        self.result: Optional[dict] = None
+        self.cache: Optional[str] = None
+        self.similarity: Optional[float] = None
+        self.error: Optional[Dict[str, Any]] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+    def to_dict(self, position: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Describe the job for clients.
+
+        Args:
+            position: The job's place in the queue, if it is queued
+
+        Returns:
+            The job id, status and priority, its timings, and its result or
+            error once it has finished
+        """
+        now = time.monotonic()
+        info: Dict[str, Any] = {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "queue_seconds": round((self.started or self.finished or now) - self.enqueued, 3),
+        }
+        if position is not None:
+            info["position"] = position
+        if self.started is not None:
+            info["run_seconds"] = round((self.finished or now) - self.started, 3)
+        if self.status == JOB_SUCCEEDED:
+            info["result"] = self.result
+            info["cache"] = self.cache.upper() if self.cache else None
+            info["similarity"] = round(self.similarity, 3) if self.similarity is not None else None
+        elif self.error is not None:
+            info["error"] = self.error
+        return info
+
+
+class JobQueue:
+    """
+    Bounded priority queue of generation jobs with a fixed worker pool.
+
+    Submitting a job returns immediately with its id. Interactive jobs
+    always go before batch jobs, a share of the queue is reserved for
+    interactive jobs, and with more than one worker one of them only runs
+    interactive jobs, so a burst of bulk submissions cannot starve
+    interactive users. When the queue is full, submissions are rejected
+    with an estimate of when to retry.
+
+    Clients follow a job by polling it or by subscribing to it. A job that
+    is neither polled nor watched for longer than the abandon timeout is
+    cancelled, which also cancels its upstream call if no other request is
+    waiting on it.
+    """
+
+    # Expected job duration before any job has finished, for Retry-After
+    INITIAL_DURATION_ESTIMATE = 10.0
+    # Weight of the latest job in the moving average of job durations
+    DURATION_SMOOTHING = 0.2
+    # Bounds of the Retry-After sent with rejected submissions, in seconds
+    MIN_RETRY_AFTER = 1
+    MAX_RETRY_AFTER = 120
+
+    def __init__(
+        self,
+        generate: Callable[[str, bool], Awaitable[Tuple[dict, str]]],
+        error_status: Callable[[Exception], int],
+        notify: Callable[[Any, Dict[str, Any]], None],
+        workers: int,
+        max_queued: int,
+        interactive_reserve: int,
+        abandon_timeout: float,
+        result_ttl: float,
+        max_finished: int = 1000,
+        id_prefix: str = "",
+    ):
+        """
+        Args:
+            generate: Coroutine function taking (query, bypass_cache) and
+                returning (slides dictionary, cache outcome, similarity)
+            error_status: Maps a generation error to its HTTP status
+            notify: Sends a message to a subscriber (a WebSocket)
+            workers: Number of jobs run at once
+            max_queued: Maximum number of jobs waiting for a worker
+            interactive_reserve: Queue slots batch jobs may not use
+            abandon_timeout: Seconds a job may go unpolled and unwatched
+            result_ttl: Seconds a finished job stays available
+            max_finished: Maximum number of finished jobs kept
+            id_prefix: Prefix of the ids of the jobs, e.g. to name the
+                worker that owns them
+
+        Raises:
+            ValueError: If the reserve leaves no room for batch jobs
+        """
+        if interactive_reserve >= max_queued:
+            raise ValueError(
+                f"JOB_INTERACTIVE_RESERVE ({interactive_reserve}) must be smaller than JOB_QUEUE_SIZE ({max_queued})"
+            )
+        self._generate = generate
+        self._error_status = error_status
+        self._notify = notify
+        self.workers = workers
+        self.max_queued = max_queued
+        self.interactive_reserve = interactive_reserve
+        self.abandon_timeout = abandon_timeout
+        self.result_ttl = result_ttl
+        self.max_finished = max_finished
+        self.id_prefix = id_prefix
+
+        self._lanes: Dict[str, Deque[Job]] = {priority: deque() for priority in PRIORITIES}
+        self.running = 0
+        self._active: Dict[str, Job] = {}
+        self._finished: "OrderedDict[str, Job]" = OrderedDict()
+        self._subscriptions: Dict[Any, Set[str]] = {}
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._tasks: List["asyncio.Task"] = []
+        self._duration_estimate = self.INITIAL_DURATION_ESTIMATE
+        self.stats = {
+            "submitted": 0,
+            "rejected": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "abandoned": 0,
+        }
+
+    def start(self):
+        """
+        Start the workers and the reaper of abandoned and expired jobs.
+        """
+        self._wakeup = asyncio.Condition()
+        # With several workers, keep one for interactive jobs only
+        self._tasks = [
+            asyncio.ensure_future(self._worker(allow_batch=self.workers == 1 or index > 0))
+            for index in range(self.workers)
+        ]
+        self._tasks.append(asyncio.ensure_future(self._reap_loop()))
+
+    async def close(self):
+        """
+        Stop the workers, cancelling running jobs.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, query: str, bypass_cache: bool = False, priority: str = PRIORITY_INTERACTIVE) -> Job:
+        """
+        Queue a generation job.
+
+        Args:
+            query: The validated query
+            bypass_cache: Whether to force a fresh generation
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+
+        Returns:
+            The queued job
+
+        Raises:
+            ValueError: If the priority is unknown
+            QueueFullError: If the job's lane of the queue is full
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}; use one of {list(PRIORITIES)}")
+
+        queued = sum(len(lane) for lane in self._lanes.values())
+        capacity = self.max_queued if priority == PRIORITY_INTERACTIVE else self.max_queued - self.interactive_reserve
+        if queued >= capacity:
+            self.stats["rejected"] += 1
+            raise QueueFullError(self.retry_after(queued - capacity + 1))
+
+        job = Job(query, bypass_cache, priority, self.id_prefix)
+        self._active[job.id] = job
+        self._lanes[priority].append(job)
+        self.stats["submitted"] += 1
+        async with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def retry_after(self, excess: int) -> int:
+        """
+        Estimate how long until a rejected job would find room in the queue.
+
+        Args:
+            excess: How many queued jobs must start before there is room
+
+        Returns:
+            Whole seconds, from the worker count and the moving average of
+            job durations
+        """
+        estimate = math.ceil(max(1, excess) * self._duration_estimate / self.workers)
+        return min(self.MAX_RETRY_AFTER, max(self.MIN_RETRY_AFTER, estimate))
+
+    def get(self, job_id: str, touch: bool = True) -> Optional[Job]:
+        """
+        Look up a job.
+
+        Args:
+            job_id: The job id
+            touch: Whether the lookup counts as the client still waiting for it
+
+        Returns:
+            The job, or None if it is unknown or has expired
+        """
+        job = self._active.get(job_id) or self._finished.get(job_id)
+        if job is not None and touch:
+            job.last_seen = time.monotonic()
+        return job
+
+    def queue_depths(self) -> Dict[str, int]:
+        """
+        Get the number of queued jobs per priority.
+        """
+        return {priority: len(lane) for priority, lane in self._lanes.items()}
+
+    def position(self, job: Job) -> Optional[int]:
+        """
+        Get the number of jobs a queued job will wait for, or None if it is not queued.
+        """
+        if job.status != JOB_QUEUED:
+            return None
+        ahead = 0
+        for priority in PRIORITIES:
+            lane = self._lanes[priority]
+            if priority == job.priority:
+                return ahead + lane.index(job)
+            ahead += len(lane)
+        return None
+
+    def describe(self, job: Job) -> Dict[str, Any]:
+        """
+        Describe a job for clients, including its place in the queue.
+
+        Args:
+            job: The job
+
+        Returns:
+            The job's to_dict(), with its queue position while it is queued
+        """
+        return job.to_dict(self.position(job))
+
+    def cancel(self, job_id: str, abandoned: bool = False) -> Optional[Job]:
+        """
+        Cancel a queued or running job; finished jobs are left as they are.
+
+        Args:
+            job_id: The job id
+            abandoned: Whether the job is cancelled because nobody is waiting for it
+
+        Returns:
+            The job, or None if it is unknown
+        """
+        job = self.get(job_id, touch=False)
+        if job is None or job.done:
+            return job
+
+        if job.status == JOB_QUEUED:
+            self._lanes[job.priority].remove(job)
+        job.status = JOB_CANCELLED
+        job.error = {
+            "status": 499,
+            "detail": "Job abandoned: no client polled or watched it" if abandoned else "Job cancelled",
+        }
+        if job.task is not None:
+            # Cancels the upstream call too, unless another request shares it
+            job.task.cancel()
+        self.stats["abandoned" if abandoned else "cancelled"] += 1
+        self._finish(job)
+        return job
+
+    def subscribe(self, job_id: str, subscriber: Any) -> Optional[Job]:
+        """
+        Send a job's updates to a subscriber until it finishes. The current
+        state is sent right away.
+
+        Args:
+            job_id: The job id
+            subscriber: The WebSocket to notify
+
+        Returns:
+            The job, or None if it is unknown
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if not job.done:
+            job.subscribers.add(subscriber)
+            self._subscriptions.setdefault(subscriber, set()).add(job_id)
+        self._notify(subscriber, {"type": "job", **self.describe(job)})
+        return job
+
+    def unsubscribe_all(self, subscriber: Any):
+        """
+        Forget a subscriber, e.g. when its WebSocket closes. Its jobs are
+        then kept only as long as the abandon timeout allows.
+        """
+        now = time.monotonic()
+        for job_id in self._subscriptions.pop(subscriber, ()):
+            job = self._active.get(job_id)
+            if job is not None:
+                job.subscribers.discard(subscriber)
+                job.last_seen = now
+
+    async def _worker(self, allow_batch: bool):
+        while True:
+            job = await self._next_job(allow_batch)
+            await self._run(job)
+
+    async def _next_job(self, allow_batch: bool) -> Job:
+        async with self._wakeup:
+            while True:
+                for priority in PRIORITIES:
+                    if priority == PRIORITY_BATCH and not allow_batch:
+                        continue
+                    if self._lanes[priority]:
+                        return self._lanes[priority].popleft()
+                await self._wakeup.wait()
+
+    async def _run(self, job: Job):
+        job.status = JOB_RUNNING
+        job.started = time.monotonic()
+        self.running += 1
+        metrics.JOB_QUEUE_SECONDS.labels(job.priority).observe(job.started - job.enqueued)
+        self._publish(job)
+
+        job.task = asyncio.ensure_future(self._generate(job.query, job.bypass_cache))
+        error: Optional[Exception] = None
+        try:
+            result, cache_outcome, similarity = await job.task
+        except asyncio.CancelledError:
+            if job.status != JOB_CANCELLED:
+                # The worker itself is being stopped
+                raise
+        except Exception as e:
+            error = e
+        finally:
+            self.running -= 1
+
+        if job.status == JOB_CANCELLED:
+            # Already finished by cancel(), possibly just as the generation completed
+            return
+        if error is None:
+            job.status = JOB_SUCCEEDED
+            job.result, job.cache, job.similarity = result, cache_outcome, similarity
+            self.stats["succeeded"] += 1
+        else:
+            status = self._error_status(error)
+            job.status = JOB_FAILED
+            job.error = {
+                "status": status,
+                "detail": str(error) if status != 500 else f"Internal server error: {str(error)}",
+            }
+            self.stats["failed"] += 1
+
+        duration = time.monotonic() - job.started
+        self._duration_estimate += self.DURATION_SMOOTHING * (duration - self._duration_estimate)
+        self._finish(job)
+
+    def _finish(self, job: Job):
+        job.finished = time.monotonic()
+        self._active.pop(job.id, None)
+        self._finished[job.id] = job
+        while len(self._finished) > self.max_finished:
+            self._finished.popitem(last=False)
+
+        self._publish(job)
+        for subscriber in job.subscribers:
+            subscriptions = self._subscriptions.get(subscriber)
+            if subscriptions is not None:
+                subscriptions.discard(job.id)
+                if not subscriptions:
+                    del self._subscriptions[subscriber]
+        job.subscribers = set()
+
+    def _publish(self, job: Job):
+        if job.subscribers:
+            message = {"type": "job", **self.describe(job)}
+            for subscriber in job.subscribers:
+                self._notify(subscriber, message)
+
+    async def _reap_loop(self):
+        interval = min(5.0, self.abandon_timeout / 2)
+        while True:
+            await asyncio.sleep(interval)
+            self.reap()
+
+    def reap(self):
+        """
+        Cancel abandoned jobs and drop finished jobs past their time-to-live.
+        """
+        now = time.monotonic()
+        abandoned = [
+            job.id for job in self._active.values()
+            if not job.subscribers and now - job.last_seen > self.abandon_timeout
+        ]
+        for job_id in abandoned:
+            self.cancel(job_id, abandoned=True)
+
+        while self._finished:
+            job = next(iter(self._finished.values()))
+            if now - job.finished <= self.result_ttl:
+                break
+            self._finished.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the job counters.
+
+        Returns:
+            A dictionary of outcome counters plus the queue depth per
+            priority, running jobs and the configured limits
+        """
+        return {
+            **self.stats,
+            "queued": self.queue_depths(),
+            "running": self.running,
+            "finished_kept": len(self._finished),
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "interactive_reserve": self.interactive_reserve,
+            "estimated_job_seconds": round(self._duration_estimate, 3),
+        }
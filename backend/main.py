@@ -1,11 +1,99 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, List, Optional
+import asyncio
 import json
-from backend.slide_generator import generate_slides
+import re
+from openai import RateLimitError
+from backend.slide_generator import (
+    generate_slides_async,
+    regenerate_slides_async,
+    validate_slide,
+    get_async_client,
+    get_rate_limiter,
+    close_async_client,
+    MODEL,
+    TEMPERATURE,
+    SYSTEM_PROMPT,
+)
+from backend.slide_stream import stream_slides_async
+from backend.cache import PromptCache, make_cache_key
+from backend.semantic_cache import SemanticIndex
+from backend.connection_manager import ConnectionManager, ConnectionRejected, DEFAULT_ROOM
+from backend.deck_state import DeckState, DeckStore
+from backend.backplane import create_backplane
+from backend.collaboration import CollaborationHub
+from backend.wire import negotiate_encoding, decode_binary
+from backend.export import DeckExporter, EXPORT_MEDIA_TYPES
+from backend.jobs import JobQueue, QueueFullError, PRIORITY_INTERACTIVE
+from backend.job_router import JobRouter
+from backend import metrics
+from backend.config import (
+    get_deck_state_max_rooms,
+    get_deck_ops_buffer_size,
+    get_ws_send_queue_size,
+    get_ws_slow_consumer_policy,
+    get_edit_flush_interval,
+    get_ws_heartbeat_interval,
+    get_ws_idle_timeout,
+    get_ws_max_connections,
+    get_ws_max_connections_per_client,
+    get_ws_duplicate_client_policy,
+    get_backplane_url,
+    get_backplane_channel_prefix,
+    get_prompt_cache_max_entries,
+    get_prompt_cache_ttl,
+    get_prompt_cache_db_path,
+    get_semantic_cache_enabled,
+    get_semantic_cache_threshold,
+    get_semantic_cache_max_entries,
+    get_batch_max_items,
+    get_export_workers,
+    get_export_cache_max_slides,
+    get_export_cache_ttl,
+    get_job_workers,
+    get_job_queue_size,
+    get_job_interactive_reserve,
+    get_job_abandon_timeout,
+    get_job_result_ttl,
+)
+
 
-app = FastAPI(title="Smart Slides API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create shared resources on startup and release them on shutdown.
+    """
+    # Create the pooled OpenAI client up front so the first request does not
+    # pay for it. A missing API key is reported per request instead.
+    try:
+        get_async_client()
+    except ValueError:
+        pass
+    
+    await hub.start()
+    manager.start()
+    job_queue.start()
+    
+    # Sample event loop lag for as long as the app runs
+    loop_monitor = asyncio.ensure_future(metrics.monitor_event_loop()) if metrics.registry.enabled else None
+    
+    yield
+    
+    if loop_monitor is not None:
+        loop_monitor.cancel()
+    await job_queue.close()
+    manager.close()
+    await hub.close()
+    await close_async_client()
+    prompt_cache.close()
+    exporter.close()
+
+
+app = FastAPI(title="Smart Slides API", version="1.0.0", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -16,108 +104,324 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time every HTTP request for /metrics and the optional timing log
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+# Create a global connection manager instance
+manager = ConnectionManager(
+    queue_size=get_ws_send_queue_size(),
+    slow_consumer_policy=get_ws_slow_consumer_policy(),
+    edit_flush_interval=get_edit_flush_interval(),
+    heartbeat_interval=get_ws_heartbeat_interval(),
+    idle_timeout=get_ws_idle_timeout(),
+    max_connections=get_ws_max_connections(),
+    max_connections_per_client=get_ws_max_connections_per_client(),
+    duplicate_client_policy=get_ws_duplicate_client_policy(),
+)
+
+# Create a global store of the authoritative deck of each room
+decks = DeckStore(
+    max_rooms=get_deck_state_max_rooms(),
+    max_ops=get_deck_ops_buffer_size(),
+)
+
+# Create the global backplane that connects this worker to the others
+backplane = create_backplane(get_backplane_url(), get_backplane_channel_prefix())
 
-class ConnectionManager:
+# Create the global hub that shares rooms with other workers over the backplane
+hub = CollaborationHub(manager, decks, backplane)
+
+# Create a global cache for generated decks
+prompt_cache = PromptCache(
+    max_entries=get_prompt_cache_max_entries(),
+    ttl_seconds=get_prompt_cache_ttl(),
+    db_path=get_prompt_cache_db_path(),
+    semantic=SemanticIndex(
+        max_entries=get_semantic_cache_max_entries(),
+        ttl_seconds=get_prompt_cache_ttl(),
+        threshold=get_semantic_cache_threshold(),
+    ) if get_semantic_cache_enabled() else None,
+)
+
+# Create the global exporter that renders PPTX and PDF files on a process pool
+exporter = DeckExporter(
+    max_workers=get_export_workers(),
+    cache_max_slides=get_export_cache_max_slides(),
+    cache_ttl=get_export_cache_ttl(),
+)
+
+# Create the global queue of asynchronous generation jobs; job updates are
+# sent to subscribed WebSockets through the connection manager
+job_queue = JobQueue(
+    generate=lambda query, bypass_cache: generate_cached(query, bypass_cache),
+    error_status=lambda e: error_status(e),
+    notify=manager.send_json,
+    workers=get_job_workers(),
+    max_queued=get_job_queue_size(),
+    interactive_reserve=get_job_interactive_reserve(),
+    abandon_timeout=get_job_abandon_timeout(),
+    result_ttl=get_job_result_ttl(),
+    id_prefix=JobRouter.make_queue_id_prefix(backplane),
+)
+
+# Create the global router that follows jobs owned by other workers
+job_router = JobRouter(job_queue, backplane, notify=manager.send_json)
+
+
+def register_state_metrics():
     """
-    WebSocket connection manager to handle multiple concurrent connections.
+    Expose counters and gauges already tracked by the app's components on /metrics.
     """
+    registry = metrics.registry
     
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    registry.callback(
+        "smartslides_ws_connections", "Open WebSocket connections.", "gauge",
+        lambda: len(manager.connections),
+    )
+    registry.callback(
+        "smartslides_ws_rooms", "Rooms with at least one connection.", "gauge",
+        lambda: len(manager.rooms),
+    )
+    registry.callback(
+        "smartslides_ws_rooms_by_size", "Rooms by number of connections.", "gauge",
+        lambda: {(size,): count for size, count in manager.get_room_size_distribution().items()},
+        ("size",),
+    )
+    for stat, help_text in (
+        ("messages_sent", "Messages written to WebSockets."),
+        ("bytes_sent", "Bytes written to WebSockets."),
+        ("messages_dropped", "Messages dropped because a client could not keep up."),
+        ("send_failures", "WebSocket writes that failed, dropping the connection."),
+        ("slow_consumer_disconnects", "Connections closed because their queue was full."),
+        ("disconnects", "WebSocket connections closed for any reason."),
+        ("pings_sent", "Application heartbeat pings sent to quiet WebSocket connections."),
+        ("idle_disconnects", "Heartbeat connections closed for being silent past the idle timeout."),
+        ("replaced_connections", "Connections closed in favour of a newer one with the same client id."),
+        ("rejected_at_capacity", "Connections refused because the process was at its connection cap."),
+        ("rejected_duplicate_client", "Connections refused because the client id was already connected."),
+    ):
+        registry.callback(
+            f"smartslides_ws_{stat}_total", help_text, "counter",
+            lambda stat=stat: manager.stats[stat],
+        )
+    registry.callback(
+        "smartslides_edits_coalesced_total", "Edits superseded within a coalescing window.", "counter",
+        lambda: manager.coalescer.stats["edits_coalesced"],
+    )
+    registry.callback(
+        "smartslides_decks", "Room decks held in memory.", "gauge",
+        lambda: len(decks),
+    )
+    registry.callback(
+        "smartslides_prompt_cache_requests_total", "Generation requests by prompt cache outcome.", "counter",
+        lambda: {
+            (outcome,): prompt_cache.stats[key]
+            for outcome, key in (
+                ("hit", "hits"), ("semantic", "semantic_hits"), ("miss", "misses"),
+                ("coalesced", "coalesced"), ("bypass", "bypassed"),
+            )
+        },
+        ("outcome",),
+    )
+    registry.callback(
+        "smartslides_rate_limit_pauses_total", "Times a 429 paused the OpenAI quota limiter.", "counter",
+        lambda: get_rate_limiter().stats["pauses"],
+    )
+    registry.callback(
+        "smartslides_jobs_queued", "Generation jobs waiting for a worker, by priority.", "gauge",
+        lambda: {(priority,): depth for priority, depth in job_queue.queue_depths().items()},
+        ("priority",),
+    )
+    registry.callback(
+        "smartslides_jobs_running", "Generation jobs being run.", "gauge",
+        lambda: job_queue.running,
+    )
+    registry.callback(
+        "smartslides_jobs_total", "Generation jobs by outcome, including submissions rejected because the queue was full.", "counter",
+        lambda: {
+            (outcome,): job_queue.stats[outcome]
+            for outcome in ("succeeded", "failed", "cancelled", "abandoned", "rejected")
+        },
+        ("outcome",),
+    )
+    registry.callback(
+        "smartslides_export_slides_total", "Slides exported, by whether they were rendered or taken from the render cache.", "counter",
+        lambda: {
+            ("rendered",): exporter.stats["slides_rendered"],
+            ("cached",): exporter.stats["slides_cached"],
+        },
+        ("source",),
+    )
+    registry.callback(
+        "smartslides_export_shared_total", "Export requests that joined an identical export already in flight.", "counter",
+        lambda: exporter.stats["shared"],
+    )
+
+
+register_state_metrics()
+
+
+class GenerateSlidesRequest(BaseModel):
+    query: str
+    bypass_cache: bool = False
+
+
+class RegenerateSlidesRequest(BaseModel):
+    indices: List[int]
+    slides: Optional[List[Dict[str, Any]]] = None
+    room_id: Optional[str] = None
+    client_id: str = ""
+    instructions: str = ""
+
+
+class SubmitJobRequest(GenerateSlidesRequest):
+    priority: str = PRIORITY_INTERACTIVE
+
+
+class ExportSlidesRequest(BaseModel):
+    slides: Optional[List[Dict[str, Any]]] = None
+    room_id: Optional[str] = None
+    title: str = ""
+
+
+class BatchGenerateSlidesRequest(BaseModel):
+    queries: List[str]
+    bypass_cache: bool = False
+    stream: bool = False
+
+
+def validate_query(request: GenerateSlidesRequest) -> str:
+    """
+    Validate and normalize the query of a generation request.
     
-    async def connect(self, websocket: WebSocket):
-        """
-        Accept a new WebSocket connection and add it to the active connections.
-        
-        Args:
-            websocket: The WebSocket connection to add
-        """
-        await websocket.accept()
-        self.active_connections.append(websocket)
-    
-    def disconnect(self, websocket: WebSocket):
-        """
-        Remove a WebSocket connection from the active connections.
-        
-        Args:
-            websocket: The WebSocket connection to remove
-        """
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-    
-    async def broadcast(self, message: str):
-        """
-        Send a message to all active WebSocket connections.
-        
-        Args:
-            message: The message string to broadcast to all clients
-        """
-        # Create a list of connections to remove if they fail
-        disconnected = []
+    Args:
+        request: Request body containing the query string
         
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                # Connection is likely closed, mark for removal
-                disconnected.append(connection)
+    Returns:
+        The stripped query
         
-        # Remove disconnected connections
-        for connection in disconnected:
-            self.disconnect(connection)
+    Raises:
+        HTTPException: If the query is empty
+    """
+    if not request.query or not request.query.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Query cannot be empty. Please provide a prompt to generate slides."
+        )
     
-    async def broadcast_to_others(self, message: str, sender: WebSocket):
-        """
-        Send a message to all active WebSocket connections except the sender.
-        
-        Args:
-            message: The message string to broadcast to all other clients
-            sender: The WebSocket connection to exclude from the broadcast
-        """
-        # Create a list of connections to remove if they fail
-        disconnected = []
+    return request.query.strip()
+
+
+async def generate_cached(query: str, bypass_cache: bool = False):
+    """
+    Generate slides for a validated query through the prompt cache.
+    
+    Args:
+        query: The stripped query
+        bypass_cache: Whether to force a fresh generation
         
-        for connection in self.active_connections:
-            if connection != sender:
-                try:
-                    await connection.send_text(message)
-                except Exception:
-                    # Connection is likely closed, mark for removal
-                    disconnected.append(connection)
+    Returns:
+        A tuple of (slides dictionary, cache outcome, similarity of the prompt
+        the deck was generated for, or None if it was not served from the cache)
         
-        # Remove disconnected connections
-        for connection in disconnected:
-            self.disconnect(connection)
+    Raises:
+        ValueError: If the API key is missing or the response is invalid
+        Exception: If the API call fails
+    """
+    cache_key = make_cache_key(query, MODEL, TEMPERATURE, SYSTEM_PROMPT)
+    return await prompt_cache.get_or_generate(
+        cache_key,
+        lambda: generate_slides_async(query),
+        bypass=bypass_cache,
+        prompt=query,
+    )
+
+
+def error_status(e: Exception) -> int:
+    """
+    Map a generation error to the HTTP status reported for it.
     
-    async def broadcast_json(self, payload: Dict[str, Any]):
-        """
-        Send a JSON payload to all active WebSocket connections.
+    Args:
+        e: The exception raised while generating slides
         
-        Args:
-            payload: The JSON-serializable dictionary to broadcast to all clients
-        """
-        # Create a list of connections to remove if they fail
-        disconnected = []
-        json_message = json.dumps(payload)
+    Returns:
+        400 for validation errors, 429 when OpenAI kept rate limiting the
+        request after every retry, 500 otherwise
+    """
+    if isinstance(e, ValueError):
+        return 400
+    if isinstance(e.__cause__, RateLimitError):
+        return 429
+    return 500
+
+
+@asynccontextmanager
+async def room_deck(room_id: str) -> AsyncIterator[DeckState]:
+    """
+    Use the up-to-date deck of a room named by a request.
+    
+    The room is followed while the context is open (see
+    CollaborationHub.use_room), so a worker with no clients in the room
+    fetches the deck from its peers rather than serving a copy that missed
+    edits.
+    
+    Args:
+        room_id: The room whose deck to use
         
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(json_message)
-            except Exception:
-                # Connection is likely closed, mark for removal
-                disconnected.append(connection)
+    Yields:
+        The room's DeckState
         
-        # Remove disconnected connections
-        for connection in disconnected:
-            self.disconnect(connection)
+    Raises:
+        HTTPException: If the room has no deck, or this worker's copy may be
+            out of date and no worker following the room sent the current one
+    """
+    async with hub.use_room(room_id) as deck:
+        if deck is None or deck.slides is None:
+            raise HTTPException(status_code=400, detail="No deck loaded in this room.")
+        if deck.stale:
+            raise HTTPException(
+                status_code=409,
+                detail="The room's deck may be out of date on this server and no server following the room sent the current one. Rejoin the room and try again."
+            )
+        yield deck
 
 
-# Create a global connection manager instance
-manager = ConnectionManager()
+async def resolve_deck(slides: Optional[List[Dict[str, Any]]], room_id: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Get the deck a request operates on: the slides it carries, or else the
+    current deck of its room.
+    
+    Args:
+        slides: The slides sent with the request, if any
+        room_id: The room whose deck to use when no slides are sent
+        
+    Returns:
+        The deck's list of slides
+        
+    Raises:
+        HTTPException: If neither is given or the room's deck is unavailable
+    """
+    if slides is not None:
+        return slides
+    if room_id is None:
+        raise HTTPException(status_code=400, detail="Either 'slides' or 'room_id' is required.")
+    async with room_deck(room_id) as deck:
+        return deck.snapshot()["slides"]
 
 
-class GenerateSlidesRequest(BaseModel):
-    query: str
+def format_sse(event: str, payload: Dict[str, Any]) -> str:
+    """
+    Format a Server-Sent Events frame.
+    
+    Args:
+        event: The event name
+        payload: The JSON-serializable event data
+        
+    Returns:
+        The encoded SSE frame
+    """
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
 
 
 @app.get("/api/status")
@@ -128,13 +432,79 @@ async def health_check():
     return {"status": "healthy", "message": "API is running"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Expose metrics in the Prometheus text format.
+    
+    Raises:
+        HTTPException: 404 if metrics are disabled with METRICS_ENABLED=false
+    """
+    if not metrics.registry.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    
+    return PlainTextResponse(
+        metrics.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """
+    Report prompt cache counters (hits, misses, coalesced requests, sizes).
+    """
+    return prompt_cache.get_stats()
+
+
+@app.get("/api/rate-limit/stats")
+async def rate_limit_stats():
+    """
+    Report OpenAI quota limiter counters and the currently available budget.
+    """
+    return get_rate_limiter().get_stats()
+
+
+@app.get("/api/export/stats")
+async def export_stats():
+    """
+    Report export counters, render cache size and shared jobs.
+    """
+    return exporter.get_stats()
+
+
+@app.get("/api/jobs/stats")
+async def job_stats():
+    """
+    Report generation job counters, queue depth per priority and running jobs.
+    """
+    return job_queue.get_stats()
+
+
+@app.get("/api/collaboration/stats")
+async def collaboration_stats():
+    """
+    Report WebSocket connection, fan-out and edit coalescing counters.
+    """
+    return manager.get_stats()
+
+
 @app.post("/api/generate-slides")
-async def generate_slides_endpoint(request: GenerateSlidesRequest):
+async def generate_slides_endpoint(request: GenerateSlidesRequest, response: Response):
     """
     Generate slides based on a user query.
     
+    Results are cached by normalized prompt, and identical requests that
+    arrive while a generation is in flight share its result. With the
+    semantic cache enabled, a prompt worded differently from an earlier one
+    but similar enough reuses its deck. The cache outcome is reported in the
+    X-Cache response header, and the similarity of the prompt the deck was
+    generated for in X-Cache-Similarity.
+    
     Args:
-        request: Request body containing the query string
+        request: Request body containing the query string and an optional
+            bypass_cache flag to force a fresh generation
+        response: The outgoing response, used to set the cache headers
         
     Returns:
         JSON object containing a list of slides with title, content, and theme
@@ -142,20 +512,21 @@ async def generate_slides_endpoint(request: GenerateSlidesRequest):
     Raises:
         HTTPException: If slide generation fails
     """
-    # Validate input
-    if not request.query or not request.query.strip():
-        raise HTTPException(
-            status_code=400,
-            detail="Query cannot be empty. Please provide a prompt to generate slides."
-        )
+    query = validate_query(request)
     
     try:
-        slides_data = generate_slides(request.query.strip())
+        slides_data, cache_outcome, similarity = await generate_cached(query, request.bypass_cache)
+        response.headers["X-Cache"] = cache_outcome.upper()
+        if similarity is not None:
+            response.headers["X-Cache-Similarity"] = f"{similarity:.3f}"
         return slides_data
     except ValueError as e:
         # Validation errors (e.g., missing API key, invalid response structure)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        if error_status(e) == 429:
+            # OpenAI kept rate limiting the request after every retry
+            raise HTTPException(status_code=429, detail=str(e))
         # All other errors (OpenAI API errors, I/O errors, etc.) return 500
         error_message = str(e)
         raise HTTPException(
@@ -164,24 +535,478 @@ async def generate_slides_endpoint(request: GenerateSlidesRequest):
         )
 
 
+@app.post("/api/generate-slides/stream")
+async def generate_slides_stream_endpoint(request: GenerateSlidesRequest):
+    """
+    Generate slides and stream them as Server-Sent Events.
+    
+    Each slide is validated and sent in a 'slide' event as soon as the model
+    finishes it, so clients can render the first slide while the rest of
+    the deck is still being generated. The stream ends with a 'done' event
+    carrying the slide count, or an 'error' event carrying the HTTP status
+    the non-streaming endpoint would have returned.
+    
+    Args:
+        request: Request body containing the query string and an optional
+            bypass_cache flag to force a fresh generation
+        
+    Returns:
+        A text/event-stream response
+        
+    Raises:
+        HTTPException: If the query is empty
+    """
+    query = validate_query(request)
+    cache_key = make_cache_key(query, MODEL, TEMPERATURE, SYSTEM_PROMPT)
+    
+    async def event_stream():
+        slides = []
+        try:
+            # Replay cached decks immediately
+            cached = None if request.bypass_cache else await prompt_cache.lookup(cache_key, query)
+            if cached is not None:
+                cached_data, cache_outcome, similarity = cached
+                for index, slide in enumerate(cached_data["slides"]):
+                    yield format_sse("slide", {"index": index, "slide": slide})
+                yield format_sse("done", {
+                    "slide_count": len(cached_data["slides"]),
+                    "cache": cache_outcome.upper(),
+                    "similarity": round(similarity, 3),
+                })
+                return
+            
+            async for slide in stream_slides_async(query):
+                yield format_sse("slide", {"index": len(slides), "slide": slide})
+                slides.append(slide)
+            
+            await prompt_cache.store(cache_key, {"slides": slides}, query)
+            yield format_sse("done", {"slide_count": len(slides), "cache": "MISS"})
+        except Exception as e:
+            status = error_status(e)
+            detail = str(e) if status != 500 else f"Internal server error: {str(e)}"
+            yield format_sse("error", {"status": status, "detail": detail})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job_endpoint(request: SubmitJobRequest):
+    """
+    Queue a slide generation and return immediately with its job id.
+    
+    Follow the job by polling GET /api/jobs/{job_id} or by sending
+    {"type": "subscribe_job", "job_id": ...} over the collaboration WebSocket.
+    Interactive jobs run before batch jobs. A job that is neither polled nor
+    watched for JOB_ABANDON_TIMEOUT seconds is cancelled.
+    
+    Args:
+        request: Request body containing the query string, an optional
+            bypass_cache flag and the priority ('interactive' or 'batch')
+        
+    Returns:
+        202 with the queued job (job_id, status, position) and its URL in the
+        Location header
+        
+    Raises:
+        HTTPException: 400 if the query or priority is invalid, 429 with a
+            Retry-After header if the queue is full
+    """
+    query = validate_query(request)
+    
+    try:
+        job = await job_queue.submit(query, request.bypass_cache, request.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    
+    return JSONResponse(
+        job_queue.describe(job),
+        status_code=202,
+        headers={"Location": f"/api/jobs/{job.id}"},
+    )
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_endpoint(job_id: str):
+    """
+    Get the status of a generation job, and its slides once it has succeeded.
+    
+    Polling a job keeps it from being cancelled as abandoned.
+    
+    Args:
+        job_id: The id returned when the job was submitted
+        
+    Returns:
+        JSON object with the job's status, queue position or timings, and its
+        'result' or 'error' once finished
+        
+    Raises:
+        HTTPException: 404 if the job is unknown or its result has expired
+    """
+    info = await job_router.get(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return info
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job_endpoint(job_id: str):
+    """
+    Cancel a queued or running generation job.
+    
+    Args:
+        job_id: The id returned when the job was submitted
+        
+    Returns:
+        JSON object with the job's final status
+        
+    Raises:
+        HTTPException: 404 if the job is unknown or its result has expired
+    """
+    info = await job_router.cancel(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return info
+
+
+async def regenerate_or_raise(slides: List[Dict[str, Any]], request: RegenerateSlidesRequest) -> List[Dict[str, Any]]:
+    """
+    Regenerate the requested slides of a deck, turning failures into HTTP errors.
+    
+    Args:
+        slides: The deck to regenerate slides of
+        request: The regenerate request (indices and instructions)
+        
+    Returns:
+        The replacement slides, in the order of request.indices
+        
+    Raises:
+        HTTPException: If the indices are invalid or regeneration fails
+    """
+    try:
+        return await regenerate_slides_async(slides, request.indices, request.instructions)
+    except Exception as e:
+        status = error_status(e)
+        detail = str(e) if status != 500 else f"Internal server error: {str(e)}"
+        raise HTTPException(status_code=status, detail=detail)
+
+
+@app.post("/api/regenerate-slides")
+async def regenerate_slides_endpoint(request: RegenerateSlidesRequest):
+    """
+    Regenerate one slide or a subset of slides of a deck, by index.
+    
+    Only the deck outline (the slide titles) and the target slides are sent
+    to the model, so cost and latency scale with the number of slides
+    regenerated rather than the size of the deck. The replacement slides
+    are validated like a generated deck.
+    
+    When room_id is given, the deck defaults to the room's current deck and
+    the replacement slides are pushed to everyone in the room as edits
+    attributed to client_id (so the requesting client, which applies the
+    response itself, ignores them). The room's deck is checked before the
+    model is called, so a request for a room without a usable deck fails
+    without paying for a generation. The response is only sent once the
+    edits have been applied to the room's deck; if the deck changed while
+    the slides were regenerated (e.g. slides were removed) the edits are
+    rejected with 409.
+    
+    Args:
+        request: Request body containing the indices to regenerate, the deck
+            (optional when room_id is given), the room, the requesting
+            client_id and optional instructions for the model
+        
+    Returns:
+        JSON object with the regenerated 'indices' and the replacement 'slides',
+        in the same order
+        
+    Raises:
+        HTTPException: If the deck or indices are invalid, regeneration fails
+            or the room's deck no longer accepts the regenerated slides
+    """
+    if request.room_id is None:
+        slides = await resolve_deck(request.slides, None)
+        new_slides = await regenerate_or_raise(slides, request)
+        return {"indices": request.indices, "slides": new_slides}
+    
+    # Check the room before paying for the generation, and keep following it
+    # until the new slides have been applied
+    async with room_deck(request.room_id) as deck:
+        slides = request.slides if request.slides is not None else deck.snapshot()["slides"]
+        try:
+            for index in request.indices:
+                deck.check_edit(index, "title")
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=f"The room's deck does not match the request: {str(e)}")
+        
+        new_slides = await regenerate_or_raise(slides, request)
+        
+        # Push the new slides to collaborators through the same path as client
+        # edits, and wait for the room's deck to accept them
+        edits = [
+            {"slide_index": index, "field": field, "value": slide[field]}
+            for index, slide in zip(request.indices, new_slides)
+            for field in ("title", "content", "theme")
+        ]
+        try:
+            await hub.submit_edits(request.room_id, request.client_id, edits)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=409,
+                detail=f"The room's deck changed while the slides were regenerated: {str(e)}"
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Slides were regenerated but could not be shared: {str(e)}"
+            )
+    
+    return {"indices": request.indices, "slides": new_slides}
+
+
+@app.post("/api/export/{export_format}")
+async def export_slides_endpoint(export_format: str, request: ExportSlidesRequest):
+    """
+    Export a deck as a PPTX or PDF file.
+    
+    Rendering runs on a process pool, off the event loop. Rendered slides are
+    cached by content, so exporting a deck again after editing one slide
+    renders only that slide; concurrent exports of the same deck share one
+    render job. The X-Export-Rendered, X-Export-Cached and X-Export-Shared
+    response headers report how the file was produced.
+    
+    Args:
+        export_format: 'pptx' or 'pdf'
+        request: Request body containing the deck (optional when room_id is
+            given), the room and an optional document title
+        
+    Returns:
+        The file, as an attachment
+        
+    Raises:
+        HTTPException: If the format or deck is invalid or rendering fails
+    """
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unsupported export format '{export_format}'. Use one of: {', '.join(sorted(EXPORT_MEDIA_TYPES))}."
+        )
+    
+    slides = await resolve_deck(request.slides, request.room_id)
+    try:
+        if not slides:
+            raise ValueError("'slides' must be a non-empty list")
+        for slide in slides:
+            validate_slide(slide)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    title = request.title.strip() or slides[0]["title"].strip() or "Presentation"
+    try:
+        document, info = await exporter.export(slides, export_format, title)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
+    
+    filename = re.sub(r"[^A-Za-z0-9]+", "-", title).strip("-").lower()[:60] or "presentation"
+    return Response(
+        content=document,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{export_format}"',
+            "X-Export-Rendered": str(info["slides_rendered"]),
+            "X-Export-Cached": str(info["slides_cached"]),
+            "X-Export-Shared": "true" if info["shared"] else "false",
+        },
+    )
+
+
+async def generate_batch_item(index: int, query: str, bypass_cache: bool) -> Dict[str, Any]:
+    """
+    Generate the slides of one batch item, capturing any error in the result.
+    
+    Args:
+        index: Position of the item in the batch
+        query: The item's query
+        bypass_cache: Whether to force a fresh generation
+        
+    Returns:
+        The item result: status 'ok' with the slides and cache outcome, or
+        status 'error' with the HTTP status and detail a single request
+        would have received
+    """
+    query = query.strip() if isinstance(query, str) else ""
+    if not query:
+        return {
+            "index": index,
+            "status": "error",
+            "error": {"status": 400, "detail": "Query cannot be empty."},
+        }
+    
+    try:
+        slides_data, cache_outcome, similarity = await generate_cached(query, bypass_cache)
+    except Exception as e:
+        status = error_status(e)
+        detail = str(e) if status != 500 else f"Internal server error: {str(e)}"
+        return {
+            "index": index,
+            "query": query,
+            "status": "error",
+            "error": {"status": status, "detail": detail},
+        }
+    
+    return {
+        "index": index,
+        "query": query,
+        "status": "ok",
+        "cache": cache_outcome.upper(),
+        "similarity": round(similarity, 3) if similarity is not None else None,
+        "slides": slides_data["slides"],
+    }
+
+
+@app.post("/api/generate-slides/batch")
+async def generate_slides_batch_endpoint(request: BatchGenerateSlidesRequest):
+    """
+    Generate slides for many prompts in one request.
+    
+    All items run concurrently but share the generation semaphore and the
+    OpenAI quota limiter with every other request, so throughput stays
+    close to OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT. Rate-limited and timed-out
+    calls are retried with backoff. Each item succeeds or fails on its own;
+    identical prompts are generated once through the prompt cache.
+    
+    Args:
+        request: Request body containing the list of queries, an optional
+            bypass_cache flag, and a stream flag
+        
+    Returns:
+        With stream=false, a JSON object with the per-item 'results' in
+        request order and the 'succeeded' and 'failed' counts. With
+        stream=true, a text/event-stream of 'result' events in completion
+        order followed by a 'done' event with the counts.
+        
+    Raises:
+        HTTPException: If the batch is empty or larger than BATCH_MAX_ITEMS
+    """
+    max_items = get_batch_max_items()
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one query.")
+    if len(request.queries) > max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch contains {len(request.queries)} queries; the limit is {max_items}."
+        )
+    
+    if not request.stream:
+        results = await asyncio.gather(*[
+            generate_batch_item(index, query, request.bypass_cache)
+            for index, query in enumerate(request.queries)
+        ])
+        succeeded = sum(1 for result in results if result["status"] == "ok")
+        return {
+            "results": results,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+        }
+    
+    async def event_stream():
+        tasks = [
+            asyncio.ensure_future(generate_batch_item(index, query, request.bypass_cache))
+            for index, query in enumerate(request.queries)
+        ]
+        succeeded = 0
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                if result["status"] == "ok":
+                    succeeded += 1
+                yield format_sse("result", result)
+            yield format_sse("done", {"succeeded": succeeded, "failed": len(tasks) - succeeded})
+        finally:
+            # Stop generating if the client went away
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.websocket("/ws/chat/{client_id}")
-async def websocket_chat_endpoint(websocket: WebSocket, client_id: str):
+@app.websocket("/ws/chat/{room_id}/{client_id}")
+async def websocket_chat_endpoint(
+    websocket: WebSocket,
+    client_id: str,
+    room_id: str = DEFAULT_ROOM,
+    since: Optional[int] = None,
+    deltas: bool = False,
+    heartbeat: bool = False,
+):
     """
     WebSocket endpoint for chat functionality and slide editing.
-    Accepts connections, receives messages (text or JSON), and broadcasts them to all connected clients.
+    Accepts connections, receives messages (text or JSON), and broadcasts them to the other
+    clients in the same room. Each deck is a room; clients that connect without a room id
+    join the default room.
+    
+    The server holds the authoritative deck of each room. On connect the client receives
+    either a 'snapshot' of the deck or, when it passes the last version it saw as ?since=,
+    an 'ops' message with only the ops it missed. Messages are routed through the
+    backplane, so clients of the same room connected to different workers see each other.
+    
+    Clients can opt into a compact protocol: offering the 'smartslides.msgpack' subprotocol
+    switches structured messages to binary MessagePack frames (both directions), and
+    ?deltas=true delivers text edits as deltas instead of full field values. Clients that
+    opt into neither keep receiving plain JSON.
     
-    Handles two types of messages:
+    Dead sockets are detected with protocol-level WebSocket pings (uvicorn's
+    --ws-ping-interval and --ws-ping-timeout), which every client answers without any
+    code. Clients that connect with ?heartbeat=true also take part in application
+    heartbeats: the server sends them {"type": "ping"} when they have been quiet for
+    WS_HEARTBEAT_INTERVAL and closes them with code 4002 if they send nothing, not even
+    {"type": "pong"}, for WS_IDLE_TIMEOUT.
+    
+    Handles these types of messages:
     1. Plain text messages: Broadcasts as "client_id: message" for chat
-    2. JSON messages with type 'edit': Broadcasts the structured payload for slide edits
+    2. JSON messages with type 'edit': Applies the edit (a full 'value', or a text 'delta'
+       of the form {index, delete, insert}) to the room's deck and broadcasts it stamped
+       with the new deck version
+    3. JSON messages with type 'set_deck': Replaces the room's deck and broadcasts it
+    4. JSON messages with type 'sync': Replies with the ops since the given version
+    5. JSON messages with type 'subscribe_job': Sends the job's state now and a 'job'
+       message whenever it changes, until it finishes
+    6. From heartbeat clients, JSON messages with type 'ping' or 'pong': a 'ping' is
+       answered with a 'pong'; neither is relayed to the room
+    
+    A client id may hold WS_MAX_CONNECTIONS_PER_CLIENT connections. When it connects
+    again, its oldest connection is closed with code 4000 (WS_DUPLICATE_CLIENT_POLICY
+    'replace') or the new one is refused with code 4001 ('reject'). Connections beyond
+    WS_MAX_CONNECTIONS are refused with code 1013.
     
     Args:
         websocket: The WebSocket connection
         client_id: Unique identifier for the client
+        room_id: Identifier of the room (deck) to join
+        since: The last deck version the client has seen, if reconnecting
+        deltas: Whether to send text edits to this client as deltas
+        heartbeat: Whether the client answers application pings
     """
     try:
-        await manager.connect(websocket)
+        subprotocol, encoding = negotiate_encoding(websocket.scope.get("subprotocols", []))
+        connection = await manager.connect(websocket, client_id, room_id, subprotocol, encoding, deltas, heartbeat)
+        await hub.join(websocket, room_id, since)
+    except ConnectionRejected:
+        # Refused by a connection cap; the socket is already closed
+        return
     except Exception as e:
         # Handle connection errors
+        manager.disconnect(websocket)
         try:
             await websocket.close(code=1011, reason=f"Connection error: {str(e)}")
         except Exception:
@@ -192,66 +1017,106 @@ async def websocket_chat_endpoint(websocket: WebSocket, client_id: str):
         while True:
             try:
                 # Receive message from the client
-                data = await websocket.receive_text()
+                message = await websocket.receive()
             except Exception as e:
                 # Handle I/O errors when receiving messages
                 raise WebSocketDisconnect(f"Error receiving message: {str(e)}")
             
-            # Try to parse as JSON to check if it's a structured payload
-            try:
-                payload = json.loads(data)
-                
-                # Check if it's a slide edit message
-                if isinstance(payload, dict) and payload.get('type') == 'edit':
-                    # Validate the edit payload structure
-                    if 'slide_index' in payload and 'field' in payload and 'value' in payload:
-                        # Add client_id to the payload for context
-                        edit_payload = {
-                            'type': 'edit',
-                            'client_id': client_id,
-                            'slide_index': payload['slide_index'],
-                            'field': payload['field'],
-                            'value': payload['value']
-                        }
-                        # Broadcast the structured JSON payload to all clients
-                        try:
-                            await manager.broadcast_json(edit_payload)
-                        except Exception as e:
-                            # Handle I/O errors during broadcast
-                            await websocket.send_text(json.dumps({
-                                'type': 'error',
-                                'message': f'Failed to broadcast edit: {str(e)}'
-                            }))
-                    else:
-                        # Invalid edit payload structure
-                        await websocket.send_text(json.dumps({
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            
+            # Any message shows the client is alive
+            connection.touch()
+            
+            data = message.get("text")
+            if data is None:
+                # Binary frames carry MessagePack-encoded structured payloads
+                try:
+                    payload = decode_binary(message.get("bytes") or b"")
+                except ValueError as e:
+                    manager.send_json(websocket, {
+                        'type': 'error',
+                        'message': str(e)
+                    })
+                    continue
+            else:
+                # Try to parse as JSON to check if it's a structured payload
+                try:
+                    payload = json.loads(data)
+                except json.JSONDecodeError:
+                    # Not JSON, treat as plain text chat message
+                    # Broadcast the message to all other connected clients
+                    # Format: "client_id: message"
+                    chat_message = f"{client_id}: {data}"
+                    try:
+                        await hub.publish_chat(websocket, room_id, chat_message)
+                    except Exception as e:
+                        # Handle I/O errors during broadcast
+                        manager.send_json(websocket, {
                             'type': 'error',
-                            'message': 'Invalid edit payload. Required fields: slide_index, field, value'
-                        }))
-                else:
-                    # JSON message but not an edit type, broadcast as-is
+                            'message': f'Failed to broadcast chat message: {str(e)}'
+                        })
+                    continue
+            
+            # Heartbeats are answered here and never relayed to the room; for
+            # other clients 'ping' and 'pong' are ordinary relayed messages
+            if connection.heartbeat and isinstance(payload, dict) and payload.get('type') == 'pong':
+                continue
+            elif connection.heartbeat and isinstance(payload, dict) and payload.get('type') == 'ping':
+                manager.send_json(websocket, {'type': 'pong'})
+            elif isinstance(payload, dict) and payload.get('type') == 'edit':
+                # Validate the edit payload structure
+                if 'slide_index' in payload and 'field' in payload and ('value' in payload or 'delta' in payload):
+                    # Publish the edit; every worker applies it to its copy of the
+                    # room's deck, stamps it with the new deck version and queues
+                    # it for the room's next batched broadcast
                     try:
-                        await manager.broadcast_json(payload)
+                        await hub.publish_edit(websocket, room_id, client_id, payload)
                     except Exception as e:
                         # Handle I/O errors during broadcast
-                        await websocket.send_text(json.dumps({
+                        manager.send_json(websocket, {
                             'type': 'error',
-                            'message': f'Failed to broadcast message: {str(e)}'
-                        }))
-                    
-            except json.JSONDecodeError:
-                # Not JSON, treat as plain text chat message
-                # Broadcast the message to all other connected clients
-                # Format: "client_id: message"
-                message = f"{client_id}: {data}"
+                            'message': f'Failed to broadcast edit: {str(e)}'
+                        })
+                else:
+                    # Invalid edit payload structure
+                    manager.send_json(websocket, {
+                        'type': 'error',
+                        'message': 'Invalid edit payload. Required fields: slide_index, field, value (or delta)'
+                    })
+            elif isinstance(payload, dict) and payload.get('type') == 'set_deck':
+                # Replace the room's deck, e.g. after generating new slides
+                try:
+                    await hub.publish_deck(websocket, room_id, client_id, payload.get('slides'))
+                except Exception as e:
+                    # Handle I/O errors during broadcast
+                    manager.send_json(websocket, {
+                        'type': 'error',
+                        'message': f'Failed to broadcast deck: {str(e)}'
+                    })
+            elif isinstance(payload, dict) and payload.get('type') == 'sync':
+                # Explicit catch-up request from a client that noticed a version gap
+                since_version = payload.get('since')
+                if not isinstance(since_version, int):
+                    since_version = None
+                manager.send_json(websocket, decks.get(room_id).sync_message(since_version))
+            elif isinstance(payload, dict) and payload.get('type') == 'subscribe_job':
+                # Follow a generation job submitted over HTTP
+                if not await job_router.subscribe(str(payload.get('job_id')), websocket):
+                    manager.send_json(websocket, {
+                        'type': 'error',
+                        'message': f"Unknown job: {payload.get('job_id')}"
+                    })
+            else:
+                # JSON message but not an edit type, broadcast as-is
                 try:
-                    await manager.broadcast_to_others(message, websocket)
+                    await hub.publish_relay(room_id, payload)
                 except Exception as e:
                     # Handle I/O errors during broadcast
-                    await websocket.send_text(json.dumps({
+                    manager.send_json(websocket, {
                         'type': 'error',
-                        'message': f'Failed to broadcast chat message: {str(e)}'
-                    }))
+                        'message': f'Failed to broadcast message: {str(e)}'
+                    })
             
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -269,4 +1134,7 @@ async def websocket_chat_endpoint(websocket: WebSocket, client_id: str):
             await websocket.close(code=1011, reason=f"Unexpected error: {str(e)}")
         except Exception:
             pass
+    finally:
+        # Jobs this connection was watching are now only kept alive by polling
+        job_router.unsubscribe_all(websocket)
 
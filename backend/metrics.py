@@ -0,0 +1,429 @@
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from backend.config import get_metrics_enabled, get_metrics_timing_logs
+
+
+# Default latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Buckets for fast in-process work (parsing, fan-out), in seconds
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+# Buckets for token counts
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+# How often the event loop lag is sampled, in seconds
+EVENT_LOOP_SAMPLE_INTERVAL = 0.5
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """
+    Format a Prometheus label set, e.g. '{route="/api/status",le="0.1"}'.
+    """
+    parts = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f"{name}=\"{escaped}\"")
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """
+    Base class for metrics with an optional set of labels.
+
+    Children are kept per label value combination; label values should come
+    from a small fixed set (routes, outcomes), never from user input.
+    """
+
+    type_name = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, Any] = {}
+
+    def labels(self, *values: str) -> Any:
+        """
+        Get the child metric for a combination of label values.
+
+        Args:
+            *values: One value per label name, in order
+
+        Returns:
+            The child metric
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._new_child()
+            self._children[key] = child
+        return child
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: LabelValues, child: Any) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("registry", "value")
+
+    def __init__(self, registry: "MetricsRegistry"):
+        self.registry = registry
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        if self.registry.enabled:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count.
+    """
+
+    type_name = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild(self.registry)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _render_child(self, values: LabelValues, child: _CounterChild) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("registry", "buckets", "counts", "sum", "count")
+
+    def __init__(self, registry: "MetricsRegistry", buckets: Tuple[float, ...]):
+        self.registry = registry
+        self.buckets = buckets
+        # One count per bucket plus one for values above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        if self.registry.enabled:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values over fixed buckets.
+
+    Observing is a bisect and three additions, cheap enough for hot paths.
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str,
+                 labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.registry, self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values: LabelValues, child: _HistogramChild) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f"le=\"{_format_value(bound)}\"")
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    Counter or gauge whose values are read from a callback at scrape time,
+    for state that is already tracked elsewhere (e.g. manager stats).
+    """
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, type_name: str,
+                 callback: Callable[[], Union[float, Dict[LabelValues, float]]], labelnames: Sequence[str] = ()):
+        super().__init__(registry, name, help_text, labelnames)
+        self.type_name = type_name
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        try:
+            result = self.callback()
+        except Exception:
+            # A failing callback must not break the whole scrape
+            return []
+        samples = result if isinstance(result, dict) else {(): result}
+        for values, value in samples.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered in the Prometheus text format.
+
+    When disabled, metrics can still be created and used everywhere but
+    record nothing, and nothing is rendered.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name!r} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labelnames, buckets))
+
+    def callback(self, name: str, help_text: str, type_name: str,
+                 callback: Callable[[], Union[float, Dict[LabelValues, float]]],
+                 labelnames: Sequence[str] = ()) -> CallbackMetric:
+        """
+        Register a counter or gauge read from a callback at scrape time.
+
+        Registering a name again replaces the previous callback.
+
+        Args:
+            name: The metric name
+            help_text: The HELP text
+            type_name: 'counter' or 'gauge'
+            callback: Returns the value, or a dictionary of label values to value
+            labelnames: The label names, when the callback returns a dictionary
+
+        Returns:
+            The registered metric
+        """
+        self._metrics.pop(name, None)
+        return self._register(CallbackMetric(self, name, help_text, type_name, callback, labelnames))
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            The exposition text
+        """
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by the whole process
+registry = MetricsRegistry(enabled=get_metrics_enabled())
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "smartslides_http_request_seconds",
+    "Total time to serve an HTTP request, until the last byte of the response.",
+    ("method", "route", "status"),
+)
+GENERATION_SECONDS = registry.histogram(
+    "smartslides_generation_seconds",
+    "Time to generate one deck, including queueing, retries and validation.",
+    ("mode", "outcome"),
+)
+GENERATION_QUEUE_SECONDS = registry.histogram(
+    "smartslides_generation_queue_seconds",
+    "Time spent waiting for a generation slot (MAX_CONCURRENT_GENERATIONS).",
+)
+RATE_LIMIT_WAIT_SECONDS = registry.histogram(
+    "smartslides_rate_limit_wait_seconds",
+    "Time spent waiting for the OpenAI quota limiter.",
+)
+OPENAI_REQUEST_SECONDS = registry.histogram(
+    "smartslides_openai_request_seconds",
+    "OpenAI round trip per attempt; for streams, until the response starts.",
+    ("stream", "outcome"),
+)
+OPENAI_RETRIES = registry.counter(
+    "smartslides_openai_retries_total",
+    "OpenAI calls retried after a transient failure.",
+    ("reason",),
+)
+OPENAI_TOKENS = registry.histogram(
+    "smartslides_openai_tokens",
+    "Tokens used per OpenAI completion.",
+    ("kind",),
+    buckets=TOKEN_BUCKETS,
+)
+PARSE_SECONDS = registry.histogram(
+    "smartslides_parse_seconds",
+    "Time spent parsing and validating the model output of one deck.",
+    ("mode",),
+    buckets=FAST_BUCKETS,
+)
+JOB_QUEUE_SECONDS = registry.histogram(
+    "smartslides_job_queue_seconds",
+    "Time a generation job waited in the job queue before a worker took it.",
+    ("priority",),
+)
+EXPORT_SECONDS = registry.histogram(
+    "smartslides_export_seconds",
+    "Time to export one deck to PPTX or PDF, including rendering on the process pool.",
+    ("format", "outcome"),
+)
+SEMANTIC_CACHE_SIMILARITY = registry.histogram(
+    "smartslides_semantic_cache_similarity",
+    "Similarity of the closest indexed prompt on each semantic cache lookup, hit or not.",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0),
+)
+WS_BROADCAST_SECONDS = registry.histogram(
+    "smartslides_ws_broadcast_seconds",
+    "Time to fan one message out to the queues of every connection in a room.",
+    buckets=FAST_BUCKETS,
+)
+WS_BROADCAST_RECIPIENTS = registry.histogram(
+    "smartslides_ws_broadcast_recipients",
+    "Number of connections a room message was fanned out to.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+WS_SEND_SECONDS = registry.histogram(
+    "smartslides_ws_send_seconds",
+    "Time to write one message to a WebSocket.",
+    buckets=FAST_BUCKETS,
+)
+EVENT_LOOP_LAG_SECONDS = registry.histogram(
+    "smartslides_event_loop_lag_seconds",
+    "How late the event loop ran a timer; high values mean blocking work on the loop.",
+    buckets=FAST_BUCKETS + (0.5, 1.0, 2.5),
+)
+
+
+# Per-request stage timings for the structured timing log
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+timing_logger = logging.getLogger("smartslides.timing")
+timing_logs_enabled = get_metrics_timing_logs()
+
+if timing_logs_enabled and not timing_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    timing_logger.addHandler(_handler)
+    timing_logger.setLevel(logging.INFO)
+    timing_logger.propagate = False
+
+
+def record_stage(stage: str, seconds: float):
+    """
+    Add the time spent in a stage to the current request's timing log entry.
+
+    Does nothing unless timing logs are enabled. Time spent in the same
+    stage more than once (e.g. retries) is summed.
+
+    Args:
+        stage: The stage name, e.g. 'openai' or 'parse'
+        seconds: The time spent
+    """
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request and, when enabled, writing one
+    JSON timing log line per request with the time spent in each stage.
+
+    The time is measured until the last body chunk is sent, so streamed
+    responses are measured in full. Requests are labelled with their route
+    template rather than the raw path, keeping label values bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500}
+        token = _stage_timings.set({}) if timing_logs_enabled else None
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route_path, status["code"]).observe(elapsed)
+
+            if token is not None:
+                stages = _stage_timings.get() or {}
+                _stage_timings.reset(token)
+                timing_logger.info(json.dumps({
+                    "event": "http_request",
+                    "method": scope["method"],
+                    "route": route_path,
+                    "status": status["code"],
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+                }))
+
+
+async def monitor_event_loop(interval: float = EVENT_LOOP_SAMPLE_INTERVAL):
+    """
+    Measure event loop lag: how much later than requested a sleep wakes up.
+
+    Runs until cancelled. Lag means a callback held the loop, delaying every
+    request and WebSocket on this worker.
+
+    Args:
+        interval: Seconds between samples
+    """
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.perf_counter() - started - interval))
@@ -0,0 +1,230 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a fixed rate.
+
+    The bucket holds at most `capacity` tokens. A caller asking for more
+    than the capacity is admitted once the bucket is full and leaves it in
+    debt, so oversized requests are slowed down rather than blocked forever.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens the bucket holds
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Get how long to wait before `amount` tokens can be taken.
+
+        Args:
+            amount: The number of tokens wanted
+
+        Returns:
+            Seconds to wait; 0 if the tokens are available now
+        """
+        self._refill()
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float):
+        """
+        Remove tokens from the bucket, possibly leaving it in debt.
+
+        Args:
+            amount: The number of tokens to remove (negative to give tokens back)
+        """
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """
+    Client-side limiter for an upstream requests-per-minute and
+    tokens-per-minute quota.
+
+    Callers acquire one request and an estimate of the tokens they will use
+    before each upstream call, and reconcile the estimate with the actual
+    usage afterwards. Waiters are served in arrival order. When the upstream
+    reports a rate limit, pause() holds back every caller until the given
+    time, so the retries of concurrent requests do not arrive all at once.
+    """
+
+    # Seconds of quota the buckets may accumulate, bounding bursts
+    BURST_SECONDS = 10.0
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        """
+        Args:
+            requests_per_minute: The request quota, or None for no limit
+            tokens_per_minute: The token quota, or None for no limit
+        """
+        self.requests = self._bucket(requests_per_minute)
+        self.tokens = self._bucket(tokens_per_minute)
+        self._lock = asyncio.Lock()
+        self._paused_until = 0.0
+        self.stats = {
+            "acquired": 0,
+            "waited": 0,
+            "wait_seconds": 0.0,
+            "pauses": 0,
+        }
+
+    def _bucket(self, per_minute: Optional[int]) -> Optional[TokenBucket]:
+        if not per_minute:
+            return None
+        rate = per_minute / 60.0
+        return TokenBucket(rate, max(1.0, rate * self.BURST_SECONDS))
+
+    async def acquire(self, tokens: int = 0):
+        """
+        Wait until one request and `tokens` tokens fit in the quota, then take them.
+
+        Args:
+            tokens: The estimated number of tokens the request will use
+        """
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                delay = self._paused_until - time.monotonic()
+                if self.requests is not None:
+                    delay = max(delay, self.requests.wait_time(1))
+                if self.tokens is not None:
+                    delay = max(delay, self.tokens.wait_time(tokens))
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+
+        waited = time.monotonic() - started
+        self.stats["acquired"] += 1
+        if waited > 0.001:
+            self.stats["waited"] += 1
+            self.stats["wait_seconds"] += waited
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """
+        Correct the token bucket once the actual usage of a request is known.
+
+        Args:
+            estimated_tokens: The tokens taken by acquire()
+            actual_tokens: The tokens the upstream reported, if any
+        """
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.take(actual_tokens - estimated_tokens)
+
+    def pause(self, seconds: float):
+        """
+        Hold back every caller for the given time, e.g. after a 429.
+
+        Args:
+            seconds: How long to pause from now
+        """
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            self.stats["pauses"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the limiter counters and current bucket levels.
+
+        Returns:
+            A dictionary of counters, plus the available requests and
+            tokens (None where there is no limit)
+        """
+        return {
+            **self.stats,
+            "requests_available": self._level(self.requests),
+            "tokens_available": self._level(self.tokens),
+            "paused_for": max(0.0, self._paused_until - time.monotonic()),
+        }
+
+    @staticmethod
+    def _level(bucket: Optional[TokenBucket]) -> Optional[float]:
+        if bucket is None:
+            return None
+        bucket.wait_time(0)
+        return bucket.level
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float, retry_after: Optional[float] = None) -> float:
+    """
+    Compute how long to wait before retrying a failed upstream call.
+
+    Uses exponential backoff with full jitter, so that requests failing at
+    the same moment spread their retries out. A server-provided Retry-After
+    is honored as a lower bound, but the delay never exceeds max_delay;
+    callers that cannot retry sooner than asked should give up instead.
+
+    Args:
+        attempt: The number of the failed attempt, starting at 0
+        base_delay: The backoff for the first retry, in seconds
+        max_delay: The cap on the delay, in seconds
+        retry_after: The delay requested by the server, if any
+
+    Returns:
+        The delay in seconds
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    if retry_after is not None:
+        # Wait at least as long as asked, plus a little jitter
+        delay = max(delay, retry_after + random.uniform(0, base_delay))
+    return min(delay, max_delay)
+
+
+def parse_retry_after(headers: Any) -> Optional[float]:
+    """
+    Read the delay requested by a rate-limited response.
+
+    Understands 'retry-after-ms' (sent by OpenAI) and 'retry-after' in
+    seconds or as an HTTP date.
+
+    Args:
+        headers: The response headers
+
+    Returns:
+        The delay in seconds, or None if the response did not ask for one
+    """
+    if headers is None:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
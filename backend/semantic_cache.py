@@ -0,0 +1,214 @@
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+
+# Common function words, which say nothing about the topic unless written
+# as an acronym ("it" but "IT", "us" but "US", "who" but "WHO")
+FUNCTION_WORDS = frozenset("""
+a an the and or of on in at to for from with about into by as is are be
+this that these those it its some any all how what why when which who
+i me my we us our you your please can could would will should let lets
+""".split())
+
+# The ways people ask for a deck ("make slides on", "create a presentation about")
+REQUEST_WORDS = frozenset("""
+create make generate build write prepare produce put together give show need want
+presentation presentations slide slides deck decks powerpoint ppt talk
+overview introduction intro short brief quick simple basic
+""".split())
+
+# Common abbreviations, expanded so that "AI" and "artificial intelligence"
+# share terms
+ABBREVIATIONS = {
+    "ai": "artificial intelligence",
+    "ml": "machine learning",
+    "nlp": "natural language processing",
+    "llm": "large language model",
+    "llms": "large language models",
+    "iot": "internet of things",
+    "vr": "virtual reality",
+    "ar": "augmented reality",
+    "ev": "electric vehicle",
+    "evs": "electric vehicles",
+    "hr": "human resources",
+    "roi": "return on investment",
+    "kpi": "key performance indicator",
+    "kpis": "key performance indicators",
+    "ui": "user interface",
+    "ux": "user experience",
+    "seo": "search engine optimization",
+    "uk": "united kingdom",
+    "eu": "european union",
+}
+
+
+def _stem(word: str) -> str:
+    """
+    Reduce a plural to its singular form ("policies" -> "policy", "cars" -> "car").
+    """
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def prompt_terms(prompt: str) -> Dict[str, int]:
+    """
+    Reduce a prompt to the counts of its topic terms.
+
+    Words are lowercased, abbreviations expanded, stop words and request
+    phrasing dropped and plurals folded, so "Make slides on AI" and
+    "a presentation about artificial intelligence" give the same terms.
+    Words written in capitals in a prompt that is not all capitals are
+    acronyms and are kept even if they spell a function word, so "history
+    of the US" keeps "us" and "jobs in IT" keeps "it".
+
+    Args:
+        prompt: The raw user prompt
+
+    Returns:
+        A dictionary mapping each term to the number of times it occurs
+    """
+    terms: Dict[str, int] = {}
+    shouting = prompt.upper() == prompt
+    for word in re.findall(r"[A-Za-z0-9]+", prompt):
+        acronym = len(word) > 1 and word.isupper() and not shouting
+        word = word.lower()
+        for part in ABBREVIATIONS.get(word, word).split():
+            if part in REQUEST_WORDS or (part in FUNCTION_WORDS and not (acronym and part == word)):
+                continue
+            term = _stem(part)
+            terms[term] = terms.get(term, 0) + 1
+    return terms
+
+
+class _Entry:
+    __slots__ = ("terms", "value", "expires_at")
+
+    def __init__(self, terms: Dict[str, int], value: Any, expires_at: float):
+        self.terms = terms
+        self.value = value
+        self.expires_at = expires_at
+
+
+class SemanticIndex:
+    """
+    In-memory similarity index over past prompts and their generated decks,
+    used to answer prompts that differ from an earlier one only in wording.
+
+    Prompts are compared by the cosine similarity of their TF-IDF term
+    vectors, with document frequencies taken from the indexed prompts, so
+    terms shared by many prompts (e.g. "history") count for less than rare
+    ones. An inverted index limits scoring to entries sharing at least one
+    term with the query. Everything runs locally with the standard library.
+
+    Entries expire after ttl_seconds and the least recently used are
+    evicted beyond max_entries, which bounds memory.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._postings: Dict[str, Set[str]] = {}
+
+    def lookup(self, prompt: str) -> Optional[Tuple[str, Any, float]]:
+        """
+        Find the indexed prompt most similar to a prompt.
+
+        Args:
+            prompt: The raw user prompt
+
+        Returns:
+            A tuple of (key, value, similarity) for the best match, or None if
+            nothing shares a term with the prompt. The best match is returned
+            even below the threshold; see is_match.
+        """
+        query = prompt_terms(prompt)
+        if not query:
+            return None
+
+        candidates: Set[str] = set()
+        for term in query:
+            candidates.update(self._postings.get(term, ()))
+        if not candidates:
+            return None
+
+        now = time.monotonic()
+        query_weights = self._weights(query)
+        query_norm = math.sqrt(sum(weight * weight for weight in query_weights.values()))
+        best: Optional[Tuple[str, Any, float]] = None
+
+        for key in candidates:
+            entry = self._entries[key]
+            if entry.expires_at <= now:
+                self._remove(key)
+                continue
+
+            weights = self._weights(entry.terms)
+            norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+            dot = sum(weight * weights.get(term, 0.0) for term, weight in query_weights.items())
+            similarity = min(1.0, dot / (query_norm * norm))
+            if best is None or similarity > best[2]:
+                best = (key, entry.value, similarity)
+
+        if best is not None and self.is_match(best[2]):
+            self._entries.move_to_end(best[0])
+        return best
+
+    def is_match(self, similarity: float) -> bool:
+        """
+        Check whether a similarity is high enough to reuse a stored deck.
+        """
+        return similarity >= self.threshold
+
+    def add(self, key: str, prompt: str, value: Any):
+        """
+        Index a prompt and its value, evicting the least recently used entry if full.
+
+        Args:
+            key: The exact cache key of the prompt (see make_cache_key); a
+                later add with the same key replaces the entry
+            prompt: The raw user prompt
+            value: The value to return for similar prompts
+        """
+        terms = prompt_terms(prompt)
+        if not terms:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(terms, value, time.monotonic() + self.ttl_seconds)
+        for term in terms:
+            self._postings.setdefault(term, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _weights(self, terms: Dict[str, int]) -> Dict[str, float]:
+        """
+        Weight term counts by inverse document frequency (smoothed, so terms
+        not in the index get the highest weight).
+        """
+        documents = len(self._entries)
+        return {
+            term: count * (math.log((1 + documents) / (1 + len(self._postings.get(term, ())))) + 1.0)
+            for term, count in terms.items()
+        }
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        for term in entry.terms:
+            keys = self._postings.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[term]
+
+    def __len__(self) -> int:
+        return len(self._entries)
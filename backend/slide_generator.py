@@ -1,30 +1,32 @@
+import asyncio
 import json
 import os
-from openai import OpenAI
-from openai import APIError, RateLimitError, APIConnectionError, APITimeoutError, AuthenticationError
-from backend.config import get_openai_api_key
+import time
+from typing import List, Optional
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
+from openai import APIError, RateLimitError, APIConnectionError, APITimeoutError, AuthenticationError, InternalServerError
+from backend.config import (
+    get_openai_api_key,
+    get_openai_base_url,
+    get_max_concurrent_generations,
+    get_openai_max_connections,
+    get_openai_timeout,
+    get_openai_rpm_limit,
+    get_openai_tpm_limit,
+    get_openai_limit_workers,
+    get_openai_max_retries,
+    get_openai_retry_base_delay,
+    get_openai_retry_max_delay,
+)
+from backend.rate_limit import RateLimiter, backoff_delay, parse_retry_after
+from backend import metrics
 
 
-def generate_slides(prompt: str) -> dict:
-    """
-    Generate slides using OpenAI GPT-4o API based on the given prompt.
-    
-    Args:
-        prompt: A string describing what slides to generate
-        
-    Returns:
-        A dictionary containing a list of slides, where each slide has:
-        - title: string
-        - content: list of strings (bullet points)
-        - theme: string (e.g., 'professional', 'creative')
-        
-    Raises:
-        Exception: If the API call fails or response is invalid
-    """
-    api_key = get_openai_api_key()
-    client = OpenAI(api_key=api_key)
-    
-    system_prompt = """You are a presentation slide generator. Generate a JSON object containing a list of slides.
+MODEL = "gpt-4o"
+TEMPERATURE = 0.7
+
+SYSTEM_PROMPT = """You are a presentation slide generator. Generate a JSON object containing a list of slides.
 Each slide should have:
 - title: A concise title for the slide (string)
 - content: A list of bullet points as strings (list of strings)
@@ -42,71 +44,578 @@ Return ONLY valid JSON in this exact format:
 }
 
 Make sure the JSON is valid and properly formatted. Generate 3-8 slides based on the user's prompt."""
-    
+
+REGENERATE_SYSTEM_PROMPT = """You are a presentation slide editor. You are given the outline of an existing slide deck (the numbered titles of all its slides) and the full content of some of its slides. Rewrite only those slides, keeping them consistent with the rest of the deck and not repeating what the other slides cover.
+Each slide should have:
+- title: A concise title for the slide (string)
+- content: A list of bullet points as strings (list of strings)
+- theme: The slide's current theme unless the instructions ask for another (string)
+
+Return ONLY valid JSON in this exact format:
+{
+  "slides": [
+    {
+      "title": "Slide Title",
+      "content": ["Bullet point 1", "Bullet point 2", "Bullet point 3"],
+      "theme": "professional"
+    }
+  ]
+}
+
+Return exactly one slide for each slide you were asked to rewrite, in the same order."""
+
+# Completion tokens reserved against the token quota before a request is
+# sent; corrected with the reported usage once it completes
+ESTIMATED_COMPLETION_TOKENS = 1000
+
+
+# Long-lived async client, concurrency cap and quota limiter shared by every request
+_async_client: Optional[AsyncOpenAI] = None
+_generation_semaphore: Optional[asyncio.Semaphore] = None
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Get the shared async OpenAI client, creating it on first use.
+
+    The client owns a pooled HTTP connection pool so that concurrent
+    generations reuse keep-alive connections instead of opening a new
+    TLS session per request. Its built-in retries are disabled; failed
+    calls are retried by create_completion under the shared rate limiter.
+
+    Returns:
+        The shared AsyncOpenAI client
+
+    Raises:
+        ValueError: If the API key is not configured
+    """
+    global _async_client
+
+    if _async_client is None:
+        max_connections = get_openai_max_connections()
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        _async_client = AsyncOpenAI(
+            api_key=get_openai_api_key(),
+            base_url=get_openai_base_url(),
+            timeout=get_openai_timeout(),
+            max_retries=0,
+            http_client=http_client,
+        )
+
+    return _async_client
+
+
+def get_generation_semaphore() -> asyncio.Semaphore:
+    """
+    Get the semaphore that caps the number of in-flight generations.
+
+    Returns:
+        The shared semaphore sized by MAX_CONCURRENT_GENERATIONS
+    """
+    global _generation_semaphore
+
+    if _generation_semaphore is None:
+        _generation_semaphore = asyncio.Semaphore(get_max_concurrent_generations())
+
+    return _generation_semaphore
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Get the limiter that keeps upstream calls within the OpenAI quota.
+
+    The limiter only sees this process's requests, so it is sized to this
+    worker's share of the quota (see get_openai_limit_workers).
+
+    Returns:
+        The shared limiter sized by OPENAI_RPM_LIMIT and OPENAI_TPM_LIMIT,
+        divided by the number of workers
+    """
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        workers = get_openai_limit_workers()
+        rpm_limit = get_openai_rpm_limit()
+        tpm_limit = get_openai_tpm_limit()
+        _rate_limiter = RateLimiter(
+            max(1, rpm_limit // workers) if rpm_limit is not None else None,
+            max(1, tpm_limit // workers) if tpm_limit is not None else None,
+        )
+
+    return _rate_limiter
+
+
+async def close_async_client():
+    """
+    Close the shared async client and release its connection pool.
+    """
+    global _async_client, _generation_semaphore
+
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    _generation_semaphore = None
+
+
+def build_messages(prompt: str) -> list:
+    """
+    Build the chat messages sent to OpenAI for a slide generation prompt.
+
+    Args:
+        prompt: A string describing what slides to generate
+
+    Returns:
+        The list of chat messages (system prompt followed by the user prompt)
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def estimate_tokens(messages: list) -> int:
+    """
+    Estimate the tokens a chat completion will use, before sending it.
+
+    Uses the rough rule of four characters per prompt token, plus a fixed
+    allowance for the completion.
+
+    Args:
+        messages: The chat messages to send
+
+    Returns:
+        The estimated total token count
+    """
+    prompt_characters = sum(len(message["content"]) for message in messages)
+    return prompt_characters // 4 + ESTIMATED_COMPLETION_TOKENS
+
+
+def is_retryable(e: Exception) -> bool:
+    """
+    Check whether a failed OpenAI call is worth retrying.
+
+    Rate limits, timeouts, connection failures and server errors are
+    transient. A 429 caused by an exhausted quota is not.
+
+    Args:
+        e: The exception raised by the OpenAI client
+
+    Returns:
+        True if the call should be retried after a backoff
+    """
+    if isinstance(e, RateLimitError):
+        return getattr(e, "code", None) != "insufficient_quota"
+    return isinstance(e, (APIConnectionError, InternalServerError))
+
+
+def error_outcome(e: Exception) -> str:
+    """
+    Classify a failed OpenAI call for metrics labels.
+
+    Args:
+        e: The exception raised by the OpenAI client
+
+    Returns:
+        'rate_limited', 'timeout', 'connection_error', 'server_error' or 'error'
+    """
+    if isinstance(e, RateLimitError):
+        return "rate_limited"
+    if isinstance(e, APITimeoutError):
+        return "timeout"
+    if isinstance(e, APIConnectionError):
+        return "connection_error"
+    if isinstance(e, InternalServerError):
+        return "server_error"
+    return "error"
+
+
+def record_usage(usage) -> None:
+    """
+    Record the token usage reported for a completion.
+
+    Args:
+        usage: The completion's usage object, or None
+    """
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, kind, None)
+        if value is not None:
+            metrics.OPENAI_TOKENS.labels(kind[:-len("_tokens")]).observe(value)
+
+
+async def _timed_create(client: AsyncOpenAI, **kwargs):
+    """
+    Send one chat completion request, recording its round trip.
+    """
+    stream_label = "true" if kwargs.get("stream") else "false"
+    started = time.perf_counter()
+    try:
+        response = await client.chat.completions.create(**kwargs)
+    except Exception as e:
+        metrics.OPENAI_REQUEST_SECONDS.labels(stream_label, error_outcome(e)).observe(time.perf_counter() - started)
+        raise
+    elapsed = time.perf_counter() - started
+    metrics.OPENAI_REQUEST_SECONDS.labels(stream_label, "ok").observe(elapsed)
+    metrics.record_stage("openai", elapsed)
+    return response
+
+
+async def create_completion(hold_slot: bool = False, **kwargs):
+    """
+    Send a chat completion request within the quota, retrying transient failures.
+
+    Each attempt first takes one request and the estimated tokens from the
+    shared rate limiter, then waits for a generation semaphore slot.
+    Rate-limited, timed-out and failed attempts are retried up to
+    OPENAI_MAX_RETRIES times with jittered exponential backoff; a 429's
+    Retry-After is honored and pauses every other caller too, so that
+    concurrent requests do not retry in lockstep. A Retry-After longer than
+    OPENAI_RETRY_MAX_DELAY is not waited out: the 429 is raised at once. The semaphore slot is
+    only held during an attempt, not while waiting for the quota or
+    backing off.
+
+    Args:
+        hold_slot: Whether to keep the slot of the successful attempt after
+            returning, e.g. for the whole duration of a stream; the caller
+            must then release get_generation_semaphore() when done
+        **kwargs: Arguments for client.chat.completions.create
+
+    Returns:
+        The completion, or the stream when stream=True
+
+    Raises:
+        Exception: The OpenAI client error of the last attempt
+    """
+    client = get_async_client()
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(kwargs["messages"])
+    max_retries = get_openai_max_retries()
+
+    attempt = 0
+    while True:
+        started = time.perf_counter()
+        await limiter.acquire(estimated_tokens)
+        waited = time.perf_counter() - started
+        metrics.RATE_LIMIT_WAIT_SECONDS.observe(waited)
+        metrics.record_stage("rate_limit_wait", waited)
+        semaphore = get_generation_semaphore()
+        try:
+            started = time.perf_counter()
+            await semaphore.acquire()
+            try:
+                queued = time.perf_counter() - started
+                metrics.GENERATION_QUEUE_SECONDS.observe(queued)
+                metrics.record_stage("queue", queued)
+                response = await _timed_create(client, **kwargs)
+            except BaseException:
+                semaphore.release()
+                raise
+            if not hold_slot:
+                semaphore.release()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            response_headers = getattr(getattr(e, "response", None), "headers", None)
+            retry_after = parse_retry_after(response_headers)
+            max_delay = get_openai_retry_max_delay()
+            if retry_after is not None and retry_after > max_delay:
+                # Fail fast rather than hold the request longer than allowed,
+                # still holding back other callers for as long as we would wait
+                if isinstance(e, RateLimitError):
+                    limiter.pause(max_delay)
+                raise
+            delay = backoff_delay(
+                attempt,
+                get_openai_retry_base_delay(),
+                max_delay,
+                retry_after,
+            )
+            if isinstance(e, RateLimitError):
+                limiter.pause(retry_after if retry_after is not None else delay)
+            metrics.OPENAI_RETRIES.labels(error_outcome(e)).inc()
+            metrics.record_stage("backoff", delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+
+        usage = getattr(response, "usage", None)
+        record_usage(usage)
+        limiter.reconcile(estimated_tokens, getattr(usage, "total_tokens", None))
+        return response
+
+
+def build_regenerate_messages(slides: List[dict], indices: List[int], instructions: str = "") -> list:
+    """
+    Build the chat messages for rewriting some slides of a deck.
+
+    Only the titles of the whole deck are sent as context, plus the full
+    content of the slides being rewritten, so the prompt grows with the
+    number of target slides rather than the size of the deck.
+
+    Args:
+        slides: The current deck
+        indices: Indices of the slides to rewrite, in the order to return them
+        instructions: Optional guidance from the user, e.g. "make it shorter"
+
+    Returns:
+        The list of chat messages
+    """
+    outline = "\n".join(f"{index + 1}. {slide['title']}" for index, slide in enumerate(slides))
+    targets = "\n\n".join(
+        f"Slide {index + 1}:\n{json.dumps(slides[index])}" for index in indices
+    )
+    prompt = f"Deck outline:\n{outline}\n\nSlides to rewrite:\n{targets}"
+    if instructions and instructions.strip():
+        prompt += f"\n\nInstructions: {instructions.strip()}"
+
+    return [
+        {"role": "system", "content": REGENERATE_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def validate_slide(slide) -> None:
+    """
+    Validate the structure of a single slide.
+
+    Args:
+        slide: The slide object to validate
+
+    Raises:
+        ValueError: If the slide does not have the expected structure
+    """
+    if not isinstance(slide, dict):
+        raise ValueError("Each slide must be a dictionary")
+    if "title" not in slide or "content" not in slide or "theme" not in slide:
+        raise ValueError("Each slide must have 'title', 'content', and 'theme' keys")
+    if not isinstance(slide["title"], str):
+        raise ValueError("Slide title must be a string")
+    if not isinstance(slide["content"], list):
+        raise ValueError("Slide content must be a list")
+    if not isinstance(slide["theme"], str):
+        raise ValueError("Slide theme must be a string")
+
+
+def parse_slides_response(response) -> dict:
+    """
+    Extract, parse and validate the slides JSON from a chat completion.
+
+    Args:
+        response: The chat completion returned by the OpenAI API
+
+    Returns:
+        The validated slides dictionary
+
+    Raises:
+        ValueError: If the response structure is invalid
+        Exception: If the response is empty or not valid JSON
+    """
+    # Extract the JSON response
+    if not response.choices or len(response.choices) == 0:
+        raise Exception("OpenAI API returned an empty response")
+
+    content = response.choices[0].message.content
+
+    if not content:
+        raise Exception("OpenAI API returned empty content")
+
+    # Parse the JSON
+    try:
+        slides_data = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise Exception(f"Failed to parse JSON response from OpenAI: {str(e)}")
+
+    # Validate the structure
+    if "slides" not in slides_data:
+        raise ValueError("Response missing 'slides' key")
+
+    if not isinstance(slides_data["slides"], list):
+        raise ValueError("'slides' must be a list")
+
+    # Validate each slide
+    for slide in slides_data["slides"]:
+        validate_slide(slide)
+
+    return slides_data
+
+
+def translate_openai_error(e: Exception) -> Exception:
+    """
+    Convert an error raised while generating slides into a user-facing error.
+
+    Validation errors are returned unchanged so callers can map them to a
+    client error; everything else is wrapped with a descriptive message.
+
+    Args:
+        e: The exception raised during generation
+
+    Returns:
+        The exception that should be raised to the caller
+    """
+    if isinstance(e, AuthenticationError):
+        return Exception(f"OpenAI authentication failed. Please check your API key: {str(e)}")
+    if isinstance(e, RateLimitError):
+        return Exception(f"OpenAI API rate limit exceeded. Please try again later: {str(e)}")
+    if isinstance(e, APITimeoutError):
+        return Exception(f"OpenAI API request timed out. Please try again: {str(e)}")
+    if isinstance(e, APIConnectionError):
+        return Exception(f"Failed to connect to OpenAI API. Please check your internet connection: {str(e)}")
+    if isinstance(e, APIError):
+        return Exception(f"OpenAI API error occurred: {str(e)}")
+    if isinstance(e, ValueError):
+        # Validation errors are passed through as-is
+        return e
+    if isinstance(e, OSError):
+        return Exception(f"I/O error occurred while communicating with OpenAI API: {str(e)}")
+    # Any other unexpected errors
+    return Exception(f"Unexpected error generating slides: {str(e)}")
+
+
+def generate_slides(prompt: str) -> dict:
+    """
+    Generate slides using OpenAI GPT-4o API based on the given prompt.
+
+    This is the blocking variant, kept for scripts and other synchronous
+    callers. The API server uses generate_slides_async instead.
+
+    Args:
+        prompt: A string describing what slides to generate
+
+    Returns:
+        A dictionary containing a list of slides, where each slide has:
+        - title: string
+        - content: list of strings (bullet points)
+        - theme: string (e.g., 'professional', 'creative')
+
+    Raises:
+        Exception: If the API call fails or response is invalid
+    """
+    api_key = get_openai_api_key()
+    client = OpenAI(api_key=api_key, base_url=get_openai_base_url())
+
     try:
         response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            model=MODEL,
+            messages=build_messages(prompt),
             response_format={"type": "json_object"},
-            temperature=0.7
+            temperature=TEMPERATURE
         )
-        
-        # Extract the JSON response
-        if not response.choices or len(response.choices) == 0:
-            raise Exception("OpenAI API returned an empty response")
-        
-        content = response.choices[0].message.content
-        
-        if not content:
-            raise Exception("OpenAI API returned empty content")
-        
-        # Parse the JSON
-        try:
-            slides_data = json.loads(content)
-        except json.JSONDecodeError as e:
-            raise Exception(f"Failed to parse JSON response from OpenAI: {str(e)}")
-        
-        # Validate the structure
-        if "slides" not in slides_data:
-            raise ValueError("Response missing 'slides' key")
-        
-        if not isinstance(slides_data["slides"], list):
-            raise ValueError("'slides' must be a list")
-        
-        # Validate each slide
-        for slide in slides_data["slides"]:
-            if not isinstance(slide, dict):
-                raise ValueError("Each slide must be a dictionary")
-            if "title" not in slide or "content" not in slide or "theme" not in slide:
-                raise ValueError("Each slide must have 'title', 'content', and 'theme' keys")
-            if not isinstance(slide["title"], str):
-                raise ValueError("Slide title must be a string")
-            if not isinstance(slide["content"], list):
-                raise ValueError("Slide content must be a list")
-            if not isinstance(slide["theme"], str):
-                raise ValueError("Slide theme must be a string")
-        
-        return slides_data
-        
-    except AuthenticationError as e:
-        raise Exception(f"OpenAI authentication failed. Please check your API key: {str(e)}")
-    except RateLimitError as e:
-        raise Exception(f"OpenAI API rate limit exceeded. Please try again later: {str(e)}")
-    except APIConnectionError as e:
-        raise Exception(f"Failed to connect to OpenAI API. Please check your internet connection: {str(e)}")
-    except APITimeoutError as e:
-        raise Exception(f"OpenAI API request timed out. Please try again: {str(e)}")
-    except APIError as e:
-        raise Exception(f"OpenAI API error occurred: {str(e)}")
-    except ValueError as e:
+        return parse_slides_response(response)
+    except ValueError:
         # Re-raise validation errors as-is
         raise
-    except OSError as e:
-        raise Exception(f"I/O error occurred while communicating with OpenAI API: {str(e)}")
     except Exception as e:
-        # Catch any other unexpected errors
-        raise Exception(f"Unexpected error generating slides: {str(e)}")
+        raise translate_openai_error(e) from e
+
+
+async def generate_slides_async(prompt: str) -> dict:
+    """
+    Generate slides using OpenAI GPT-4o API without blocking the event loop.
+
+    Uses the shared async client through create_completion, so that no more
+    than MAX_CONCURRENT_GENERATIONS requests are sent upstream at once, the
+    configured quota is respected, and transient failures are retried.
+
+    Args:
+        prompt: A string describing what slides to generate
+
+    Returns:
+        A dictionary containing a list of slides (see generate_slides)
+
+    Raises:
+        ValueError: If the API key is missing or the response is invalid
+        Exception: If the API call fails
+    """
+    return await _generate(build_messages(prompt), "full")
 
+
+async def regenerate_slides_async(slides: List[dict], indices: List[int], instructions: str = "") -> List[dict]:
+    """
+    Rewrite some slides of a deck, leaving the others untouched.
+
+    The model sees the deck outline and the target slides only (see
+    build_regenerate_messages), which keeps token use and latency
+    proportional to the number of slides rewritten. The result is
+    validated with the same rules as a generated deck.
+
+    Args:
+        slides: The current deck
+        indices: Indices of the slides to rewrite
+        instructions: Optional guidance from the user
+
+    Returns:
+        The replacement slides, one per index and in the same order
+
+    Raises:
+        ValueError: If the deck or indices are invalid, the API key is
+            missing, or the response is invalid
+        Exception: If the API call fails
+    """
+    if not isinstance(slides, list) or not slides:
+        raise ValueError("'slides' must be a non-empty list")
+    for slide in slides:
+        validate_slide(slide)
+    if not indices:
+        raise ValueError("At least one slide index is required")
+    if len(set(indices)) != len(indices):
+        raise ValueError("Slide indices must not repeat")
+    for index in indices:
+        if not isinstance(index, int) or isinstance(index, bool) or index < 0 or index >= len(slides):
+            raise ValueError(f"Invalid slide index {index}")
+
+    slides_data = await _generate(build_regenerate_messages(slides, indices, instructions), "regenerate")
+    if len(slides_data["slides"]) != len(indices):
+        raise ValueError(
+            f"Expected {len(indices)} regenerated slides, got {len(slides_data['slides'])}"
+        )
+    return slides_data["slides"]
+
+
+async def _generate(messages: list, mode: str) -> dict:
+    """
+    Run a chat completion and parse the slides it returns, recording timings.
+
+    Args:
+        messages: The chat messages to send
+        mode: The metrics label for this kind of generation
+
+    Returns:
+        The validated slides dictionary
+
+    Raises:
+        ValueError: If the API key is missing or the response is invalid
+        Exception: If the API call fails
+    """
+    started = time.perf_counter()
+    outcome = "error"
+
+    try:
+        response = await create_completion(
+            model=MODEL,
+            messages=messages,
+            response_format={"type": "json_object"},
+            temperature=TEMPERATURE
+        )
+        parse_started = time.perf_counter()
+        slides_data = parse_slides_response(response)
+        parse_elapsed = time.perf_counter() - parse_started
+        metrics.PARSE_SECONDS.labels("full").observe(parse_elapsed)
+        metrics.record_stage("parse", parse_elapsed)
+        outcome = "ok"
+        return slides_data
+    except ValueError:
+        # Re-raise validation errors as-is
+        outcome = "invalid"
+        raise
+    except Exception as e:
+        outcome = error_outcome(e)
+        raise translate_openai_error(e) from e
+    finally:
+        metrics.GENERATION_SECONDS.labels(mode, outcome).observe(time.perf_counter() - started)
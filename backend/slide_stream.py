@@ -0,0 +1,256 @@
+import json
+import time
+from typing import AsyncIterator, List, Optional
+from backend.slide_generator import (
+    MODEL,
+    TEMPERATURE,
+    build_messages,
+    create_completion,
+    error_outcome,
+    estimate_tokens,
+    get_generation_semaphore,
+    get_rate_limiter,
+    record_usage,
+    translate_openai_error,
+    validate_slide,
+)
+from backend import metrics
+
+
+class IncrementalSlideParser:
+    """
+    Incremental parser for the streamed slides JSON document.
+
+    Text is fed in as it arrives from the model. Each object inside the
+    top-level "slides" array is parsed and validated as soon as its closing
+    brace is seen, so callers can emit slides before the document is done.
+    """
+
+    def __init__(self):
+        # Chunks fed so far, joined only once by close()
+        self._chunks: List[str] = []
+        # Stack of open containers ('{' or '[') outside of strings
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        # Text of the string being read directly inside the top-level object,
+        # from earlier chunks (None when not reading one)
+        self._string_parts: Optional[List[str]] = None
+        # Last string seen directly inside the top-level object, and the key
+        # it became once followed by ':'
+        self._last_top_level_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._in_slides_array = False
+        # Text of the slide object being read, from earlier chunks (None
+        # when not inside a slide)
+        self._slide_parts: Optional[List[str]] = None
+        self.slide_count = 0
+
+    def feed(self, chunk: str) -> List[dict]:
+        """
+        Feed the next piece of streamed text.
+
+        Only the new chunk is scanned; text of a slide or key spanning
+        several chunks is carried over in a list of parts.
+
+        Args:
+            chunk: The next piece of the model output
+
+        Returns:
+            The slides completed by this chunk, already validated
+
+        Raises:
+            ValueError: If a completed slide fails validation
+            Exception: If a completed slide is not valid JSON
+        """
+        self._chunks.append(chunk)
+        completed = []
+        # Where the current slide and top-level string start in this chunk
+        slide_start = 0 if self._slide_parts is not None else None
+        string_start = 0 if self._string_parts is not None else None
+
+        for index, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if string_start is not None:
+                        self._string_parts.append(chunk[string_start:index + 1])
+                        self._last_top_level_string = "".join(self._string_parts)
+                        self._string_parts = None
+                        string_start = None
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if len(self._stack) == 1:
+                    self._string_parts = []
+                    string_start = index
+            elif char == ":" and len(self._stack) == 1:
+                self._current_key = self._decode_key(self._last_top_level_string)
+            elif char in "{[":
+                self._stack.append(char)
+                if len(self._stack) == 2 and char == "[" and self._current_key == "slides":
+                    self._in_slides_array = True
+                elif len(self._stack) == 3 and char == "{" and self._in_slides_array:
+                    self._slide_parts = []
+                    slide_start = index
+            elif char in "}]":
+                if not self._stack:
+                    raise Exception("Failed to parse JSON response from OpenAI: unbalanced brackets")
+                self._stack.pop()
+                if len(self._stack) == 2 and char == "}" and slide_start is not None:
+                    self._slide_parts.append(chunk[slide_start:index + 1])
+                    completed.append(self._parse_slide("".join(self._slide_parts)))
+                    self._slide_parts = None
+                    slide_start = None
+                elif len(self._stack) == 1 and char == "]":
+                    self._in_slides_array = False
+
+        # Carry over the unfinished slide or key to the next chunk
+        if slide_start is not None:
+            self._slide_parts.append(chunk[slide_start:])
+        if string_start is not None:
+            self._string_parts.append(chunk[string_start:])
+        return completed
+
+    def close(self) -> dict:
+        """
+        Finish parsing and validate the complete document.
+
+        Every entry of the slides array is validated, including any that
+        were not emitted by feed (e.g. entries that are not objects), so the
+        stream accepts exactly what parse_slides_response accepts.
+
+        Returns:
+            The full slides dictionary
+
+        Raises:
+            ValueError: If the document structure or a slide is invalid
+            Exception: If the document is not valid JSON
+        """
+        text = "".join(self._chunks)
+
+        if not text:
+            raise Exception("OpenAI API returned empty content")
+
+        try:
+            slides_data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise Exception(f"Failed to parse JSON response from OpenAI: {str(e)}")
+
+        if not isinstance(slides_data, dict) or "slides" not in slides_data:
+            raise ValueError("Response missing 'slides' key")
+
+        if not isinstance(slides_data["slides"], list):
+            raise ValueError("'slides' must be a list")
+
+        for slide in slides_data["slides"]:
+            validate_slide(slide)
+
+        return slides_data
+
+    def _parse_slide(self, slide_text: str) -> dict:
+        """
+        Parse and validate one completed slide object.
+        """
+        try:
+            slide = json.loads(slide_text)
+        except json.JSONDecodeError as e:
+            raise Exception(f"Failed to parse JSON response from OpenAI: {str(e)}")
+
+        validate_slide(slide)
+        self.slide_count += 1
+        return slide
+
+    @staticmethod
+    def _decode_key(raw_key: Optional[str]) -> Optional[str]:
+        """
+        Decode a raw JSON string token into the key it names.
+        """
+        if raw_key is None:
+            return None
+        try:
+            return json.loads(raw_key)
+        except json.JSONDecodeError:
+            return None
+
+
+async def stream_slides_async(prompt: str) -> AsyncIterator[dict]:
+    """
+    Generate slides with a streamed completion, yielding each slide as soon
+    as it is complete.
+
+    Opening the stream goes through create_completion, so it respects the
+    quota and is retried like any other call, taking a generation semaphore
+    slot per attempt; the slot of the attempt that opened the stream is
+    held until the stream ends. Once slides have been yielded a failure is
+    final. When the stream ends the full document is
+    validated with parser.close() and the token usage reported in the last
+    chunk is reconciled with the rate limiter.
+
+    Args:
+        prompt: A string describing what slides to generate
+
+    Yields:
+        Validated slide dictionaries in deck order
+
+    Raises:
+        ValueError: If the API key is missing or a slide is invalid
+        Exception: If the API call fails or the output is not valid JSON
+    """
+    parser = IncrementalSlideParser()
+    messages = build_messages(prompt)
+    usage = None
+    started = time.perf_counter()
+    parse_elapsed = 0.0
+    # Stays 'incomplete' if the consumer stops reading before the end
+    outcome = "incomplete"
+
+    try:
+        stream = await create_completion(
+            hold_slot=True,
+            model=MODEL,
+            messages=messages,
+            response_format={"type": "json_object"},
+            temperature=TEMPERATURE,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            async with stream:
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parse_started = time.perf_counter()
+                        slides = parser.feed(delta)
+                        parse_elapsed += time.perf_counter() - parse_started
+                        for slide in slides:
+                            yield slide
+        finally:
+            get_generation_semaphore().release()
+        if usage is not None:
+            record_usage(usage)
+            get_rate_limiter().reconcile(estimate_tokens(messages), usage.total_tokens)
+        parse_started = time.perf_counter()
+        parser.close()
+        parse_elapsed += time.perf_counter() - parse_started
+        metrics.PARSE_SECONDS.labels("stream").observe(parse_elapsed)
+        metrics.record_stage("parse", parse_elapsed)
+        outcome = "ok"
+    except ValueError:
+        # Re-raise validation errors as-is
+        outcome = "invalid"
+        raise
+    except Exception as e:
+        outcome = error_outcome(e)
+        raise translate_openai_error(e) from e
+    finally:
+        metrics.GENERATION_SECONDS.labels("stream", outcome).observe(time.perf_counter() - started)
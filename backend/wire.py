@@ -0,0 +1,185 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:  # binary encoding is unavailable without msgpack (see requirements.txt)
+    msgpack = None
+
+logger = logging.getLogger("smartslides.wire")
+
+# Whether the missing msgpack package has been reported
+_msgpack_warned = False
+
+
+# Payload encodings a collaboration client can negotiate
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+# WebSocket subprotocols clients offer to select an encoding
+SUBPROTOCOL_MSGPACK = "smartslides.msgpack"
+SUBPROTOCOL_JSON = "smartslides.json"
+
+# Message types whose edit ops are rendered differently for delta clients
+_OP_CARRYING_TYPES = ("edit", "edit_batch", "ops")
+
+
+def negotiate_encoding(offered: Iterable[str]) -> Tuple[Optional[str], str]:
+    """
+    Pick the payload encoding for a connection from the subprotocols offered
+    by the client.
+
+    MessagePack is chosen only when the client offers it and msgpack is
+    installed; otherwise a warning is logged once and the connection falls
+    back to JSON. Clients that offer nothing get plain JSON, as before.
+
+    Args:
+        offered: The subprotocols listed in Sec-WebSocket-Protocol
+
+    Returns:
+        A tuple of (subprotocol to accept or None, encoding)
+    """
+    global _msgpack_warned
+    offered = list(offered)
+
+    if SUBPROTOCOL_MSGPACK in offered:
+        if msgpack is not None:
+            return SUBPROTOCOL_MSGPACK, ENCODING_MSGPACK
+        if not _msgpack_warned:
+            _msgpack_warned = True
+            logger.warning(
+                "A client offered the %s subprotocol but msgpack is not installed; "
+                "falling back to JSON (pip install -r requirements.txt)",
+                SUBPROTOCOL_MSGPACK,
+            )
+    if SUBPROTOCOL_JSON in offered:
+        return SUBPROTOCOL_JSON, ENCODING_JSON
+    return None, ENCODING_JSON
+
+
+def decode_binary(data: bytes) -> Any:
+    """
+    Decode a binary (MessagePack) message from a client.
+
+    Args:
+        data: The raw message bytes
+
+    Returns:
+        The decoded payload
+
+    Raises:
+        ValueError: If msgpack is not installed or the data cannot be decoded
+    """
+    if msgpack is None:
+        raise ValueError("Binary messages are not supported: msgpack is not installed")
+
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except Exception as e:
+        raise ValueError(f"Invalid MessagePack payload: {str(e)}")
+
+
+def render_op(op: Dict[str, Any], deltas: bool) -> Dict[str, Any]:
+    """
+    Render an edit op for a client.
+
+    Ops produced by a text delta carry both the full 'value' and the 'delta'.
+    Delta clients receive only the delta; everyone else the full value.
+
+    Args:
+        op: The versioned op
+        deltas: Whether the recipient opted into delta edits
+
+    Returns:
+        The op as the recipient should see it
+    """
+    if "delta" not in op:
+        return op
+    if deltas:
+        return {key: value for key, value in op.items() if key != "value"}
+    return {key: value for key, value in op.items() if key != "delta"}
+
+
+def render_payload(payload: Dict[str, Any], deltas: bool) -> Dict[str, Any]:
+    """
+    Render a server message for a client, adjusting any edit ops it carries.
+
+    Args:
+        payload: The message to send
+        deltas: Whether the recipient opted into delta edits
+
+    Returns:
+        The message as the recipient should see it
+    """
+    if not isinstance(payload, dict):
+        # Clients may relay any JSON value, e.g. a bare number
+        return payload
+
+    message_type = payload.get("type")
+
+    if message_type not in _OP_CARRYING_TYPES:
+        return payload
+    if message_type == "edit":
+        return render_op(payload, deltas)
+    return {**payload, "ops": [render_op(op, deltas) for op in payload.get("ops", [])]}
+
+
+class Frame:
+    """
+    A structured message queued for one or more connections.
+
+    Each (encoding, deltas) variant is encoded at most once and shared by
+    every recipient that needs it.
+    """
+
+    __slots__ = ("payload", "_encoded", "_has_deltas")
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.payload = payload
+        self._encoded: Dict[Tuple[str, bool], Union[str, bytes]] = {}
+        self._has_deltas: Optional[bool] = None
+
+    def encode(self, encoding: str, deltas: bool) -> Union[str, bytes]:
+        """
+        Encode the frame for a connection.
+
+        Args:
+            encoding: ENCODING_JSON or ENCODING_MSGPACK
+            deltas: Whether the recipient opted into delta edits
+
+        Returns:
+            A str for JSON clients, bytes for MessagePack clients
+        """
+        if deltas and not self._carries_deltas():
+            # Both renderings are identical; share the full-value encoding
+            deltas = False
+
+        key = (encoding, deltas)
+        encoded = self._encoded.get(key)
+
+        if encoded is None:
+            rendered = render_payload(self.payload, deltas)
+            if encoding == ENCODING_MSGPACK:
+                encoded = msgpack.packb(rendered, use_bin_type=True)
+            else:
+                encoded = json.dumps(rendered)
+            self._encoded[key] = encoded
+
+        return encoded
+
+    def _carries_deltas(self) -> bool:
+        """
+        Check whether any op in the frame carries a text delta.
+        """
+        if self._has_deltas is None:
+            payload = self.payload
+            if not isinstance(payload, dict):
+                self._has_deltas = False
+            elif payload.get("type") == "edit":
+                self._has_deltas = "delta" in payload
+            elif payload.get("type") in _OP_CARRYING_TYPES:
+                self._has_deltas = any("delta" in op for op in payload.get("ops", []))
+            else:
+                self._has_deltas = False
+        return self._has_deltas
@@ -1,5 +1,5 @@
 import { writable } from 'svelte/store';
-import { messages, getClientId } from './websocket.js';
+import { addMessageListener, sendMessage, getClientId, getRoomId } from './websocket.js';
 import { get } from 'svelte/store';
 
 // Create a writable store for slide data
@@ -11,139 +11,142 @@ export const isLoading = writable(false);
 // Store for error messages
 export const error = writable(null);
 
-// Track processed messages to avoid reprocessing
-const processedMessages = new Set();
-let lastMessageCount = 0;
-
 /**
- * Process incoming WebSocket edit payloads and update the slide data store.
- * This function listens for 'edit' type messages and applies them to the store.
+ * Apply a single versioned edit op to the slide data store.
  * 
- * @param {string} message - The raw message from WebSocket
- * @param {number} messageIndex - The index of the message in the messages array
+ * @param {Object} payload - The edit op (slide_index, field, value)
  */
-function processEditPayload(message, messageIndex) {
-  // Create a unique key for this message to track if we've processed it
-  const messageKey = `${messageIndex}_${message}`;
+function applyEdit(payload) {
+  // Validate the edit payload
+  if (
+    typeof payload.slide_index !== 'number' ||
+    !payload.field ||
+    payload.value === undefined
+  ) {
+    return;
+  }
+  
+  // Get current slide data
+  const currentData = get(slideData);
   
-  // Skip if we've already processed this message
-  if (processedMessages.has(messageKey)) {
+  if (!currentData || !currentData.slides) {
+    console.warn('Cannot apply edit: No slide data available');
     return;
   }
   
-  try {
-    // Try to parse as JSON
-    const payload = JSON.parse(message);
-    
-    // Check if it's an edit payload
-    if (payload && payload.type === 'edit') {
-      const currentClientId = getClientId();
-      
-      // Ignore edits from the current client to prevent feedback loops
-      // (we already applied our own edits locally)
-      if (payload.client_id === currentClientId) {
-        processedMessages.add(messageKey);
-        return;
+  const slideIndex = payload.slide_index;
+  
+  // Validate slide index
+  if (slideIndex < 0 || slideIndex >= currentData.slides.length) {
+    console.warn(`Cannot apply edit: Invalid slide index ${slideIndex}`);
+    return;
+  }
+  
+  // Create a copy of the slide data to update
+  const updatedData = {
+    ...currentData,
+    slides: currentData.slides.map((slide, index) => {
+      if (index !== slideIndex) {
+        return slide;
       }
       
-      // Validate the edit payload
-      if (
-        typeof payload.slide_index === 'number' &&
-        payload.field &&
-        payload.value !== undefined
-      ) {
-        // Get current slide data
-        const currentData = get(slideData);
-        
-        if (!currentData || !currentData.slides) {
-          console.warn('Cannot apply edit: No slide data available');
-          processedMessages.add(messageKey);
-          return;
-        }
-        
-        const slideIndex = payload.slide_index;
-        
-        // Validate slide index
-        if (slideIndex < 0 || slideIndex >= currentData.slides.length) {
-          console.warn(`Cannot apply edit: Invalid slide index ${slideIndex}`);
-          processedMessages.add(messageKey);
-          return;
+      // Create a new slide object with the updated field
+      const updatedSlide = { ...slide };
+      
+      if (payload.field === 'title') {
+        updatedSlide.title = payload.value;
+      } else if (payload.field === 'content') {
+        // For content, we need to handle it as an array
+        updatedSlide.content = Array.isArray(payload.value)
+          ? [...payload.value]
+          : payload.value;
+      } else if (payload.field === 'theme') {
+        updatedSlide.theme = payload.value;
+      } else {
+        // Handle nested field updates (e.g., 'content.0' for first bullet point)
+        const fieldParts = payload.field.split('.');
+        if (fieldParts.length === 2 && fieldParts[0] === 'content') {
+          const contentIndex = parseInt(fieldParts[1]);
+          if (!isNaN(contentIndex) && Array.isArray(updatedSlide.content)) {
+            updatedSlide.content = [...updatedSlide.content];
+            updatedSlide.content[contentIndex] = payload.value;
+          }
         }
-        
-        // Create a deep copy of the slide data to update
-        const updatedData = {
-          ...currentData,
-          slides: currentData.slides.map((slide, index) => {
-            if (index === slideIndex) {
-              // Create a new slide object with the updated field
-              const updatedSlide = { ...slide };
-              
-              if (payload.field === 'title') {
-                updatedSlide.title = payload.value;
-              } else if (payload.field === 'content') {
-                // For content, we need to handle it as an array
-                updatedSlide.content = Array.isArray(payload.value) 
-                  ? [...payload.value] 
-                  : payload.value;
-              } else if (payload.field === 'theme') {
-                updatedSlide.theme = payload.value;
-              } else {
-                // Handle nested field updates (e.g., 'content.0' for first bullet point)
-                const fieldParts = payload.field.split('.');
-                if (fieldParts.length === 2 && fieldParts[0] === 'content') {
-                  const contentIndex = parseInt(fieldParts[1]);
-                  if (!isNaN(contentIndex) && Array.isArray(updatedSlide.content)) {
-                    updatedSlide.content = [...updatedSlide.content];
-                    updatedSlide.content[contentIndex] = payload.value;
-                  }
-                }
-              }
-              
-              return updatedSlide;
-            }
-            return { ...slide };
-          })
-        };
-        
-        // Update the store
-        slideData.set(updatedData);
-        
-        // Mark this message as processed
-        processedMessages.add(messageKey);
       }
+      
+      return updatedSlide;
+    })
+  };
+  
+  // Update the store
+  slideData.set(updatedData);
+}
+
+/**
+ * Apply a versioned deck op ('edit' or 'deck') from the server.
+ * 
+ * @param {Object} op - The op to apply
+ */
+function applyOp(op) {
+  // Ignore ops from the current client to prevent feedback loops
+  // (we already applied our own changes locally)
+  if (op.client_id === getClientId()) {
+    return;
+  }
+  
+  if (op.type === 'edit') {
+    applyEdit(op);
+  } else if (op.type === 'deck' && Array.isArray(op.slides)) {
+    slideData.set({ slides: op.slides });
+  }
+}
+
+/**
+ * Handle a structured message from the WebSocket and update the slide data store.
+ * 
+ * Handles live 'edit' and 'deck' ops, batches of coalesced edits, the
+ * 'snapshot' sent to a client joining a room, and the 'ops' catch-up sent to
+ * a reconnecting client.
+ * 
+ * @param {Object} payload - The parsed JSON payload
+ */
+function handleDeckMessage(payload) {
+  if (payload.type === 'edit' || payload.type === 'deck') {
+    applyOp(payload);
+  } else if (payload.type === 'snapshot') {
+    if (Array.isArray(payload.slides)) {
+      slideData.set({ slides: payload.slides });
+    }
+  } else if ((payload.type === 'ops' || payload.type === 'edit_batch') && Array.isArray(payload.ops)) {
+    for (const op of payload.ops) {
+      applyOp(op);
     }
-  } catch (err) {
-    // Not JSON or invalid JSON, ignore (might be a chat message)
-    // This is expected for non-edit messages
-    // Mark as processed to avoid trying again
-    processedMessages.add(messageKey);
   }
 }
 
 /**
  * Initialize the WebSocket edit listener.
- * This sets up a subscription to the messages store to process edit payloads.
+ * This registers a listener that applies deck snapshots and edit ops to the store.
  * 
  * @returns {Function} Unsubscribe function to clean up the listener
  */
 export function initializeEditListener() {
-  // Subscribe to messages store and process new messages
-  const unsubscribe = messages.subscribe((msgs) => {
-    if (msgs && msgs.length > 0) {
-      // Only process new messages that we haven't seen before
-      const currentMessageCount = msgs.length;
-      
-      if (currentMessageCount > lastMessageCount) {
-        // Process only the new messages
-        for (let i = lastMessageCount; i < currentMessageCount; i++) {
-          processEditPayload(msgs[i], i);
-        }
-        lastMessageCount = currentMessageCount;
-      }
-    }
-  });
-  
-  return unsubscribe;
+  return addMessageListener(handleDeckMessage);
+}
+
+/**
+ * Share a newly generated deck with the other clients in the room, making it
+ * the room's authoritative deck on the server.
+ * 
+ * @param {Object} data - The slide data object containing the list of slides
+ */
+function shareDeck(data) {
+  try {
+    sendMessage(JSON.stringify({ type: 'set_deck', slides: data.slides }));
+  } catch (err) {
+    // Not connected; the deck stays local until the next generation
+    console.warn('Could not share deck:', err.message);
+  }
 }
 
 /**
@@ -190,6 +193,7 @@ export async function callGenerateAPI(prompt) {
     
     // Update the slide data store
     slideData.set(data);
+    shareDeck(data);
     
     return data;
   } catch (err) {
@@ -214,3 +218,239 @@ export async function callGenerateAPI(prompt) {
   }
 }
 
+
+/**
+ * Call the streaming generate-slides endpoint and append each slide to the
+ * slideData store as soon as the server emits it.
+ * 
+ * @param {string} prompt - The user's prompt/query for generating slides
+ * @returns {Promise<Object>} The complete slide data object
+ * @throws {Error} If the request fails or the server sends an error event
+ */
+export async function callGenerateStreamAPI(prompt) {
+  // Reset error and set loading state
+  error.set(null);
+  isLoading.set(true);
+  slideData.set(null);
+  
+  try {
+    const response = await fetch('/api/generate-slides/stream', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ query: prompt }),
+    });
+    
+    if (!response.ok) {
+      let errorMessage = `HTTP error! status: ${response.status}`;
+      try {
+        const errorData = await response.json();
+        errorMessage = errorData.detail || errorData.message || errorMessage;
+      } catch (e) {
+        // Use the status-based message
+      }
+      throw new Error(errorMessage);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const slides = [];
+    let buffer = '';
+    
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) {
+        break;
+      }
+      
+      buffer += decoder.decode(value, { stream: true });
+      
+      // SSE frames are separated by a blank line
+      let separatorIndex;
+      while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+        const frame = buffer.slice(0, separatorIndex);
+        buffer = buffer.slice(separatorIndex + 2);
+        
+        let eventName = 'message';
+        let eventData = '';
+        for (const line of frame.split('\n')) {
+          if (line.startsWith('event: ')) {
+            eventName = line.slice(7);
+          } else if (line.startsWith('data: ')) {
+            eventData += line.slice(6);
+          }
+        }
+        
+        const payload = eventData ? JSON.parse(eventData) : {};
+        
+        if (eventName === 'slide') {
+          slides[payload.index] = payload.slide;
+          slideData.set({ slides: [...slides] });
+        } else if (eventName === 'error') {
+          throw new Error(payload.detail || 'Failed to generate slides');
+        }
+      }
+    }
+    
+    const data = { slides };
+    shareDeck(data);
+    
+    return data;
+  } catch (err) {
+    console.error('Error generating slides:', err);
+    
+    let errorMsg = err.message || 'Failed to generate slides';
+    
+    // Check if it's a network error (backend not running)
+    if (err instanceof TypeError && err.message.includes('fetch')) {
+      errorMsg = 'Cannot connect to the server. Make sure the backend is running on http://localhost:8000';
+    }
+    
+    error.set(errorMsg);
+    // Clear slide data on error
+    slideData.set(null);
+    throw err;
+  } finally {
+    // Always set loading to false when done
+    isLoading.set(false);
+  }
+}
+
+/**
+ * Regenerate some slides of the current deck and replace them in the
+ * slideData store. When connected to a room, the server shares the new
+ * slides with the other clients as edits.
+ * 
+ * @param {number[]} indices - Zero-based indices of the slides to regenerate
+ * @param {string} instructions - Optional guidance for the rewrite
+ * @returns {Promise<Object[]>} The replacement slides, in the order of indices
+ * @throws {Error} If there is no deck or the request fails
+ */
+export async function callRegenerateAPI(indices, instructions = '') {
+  const currentData = get(slideData);
+  if (!currentData || !currentData.slides) {
+    throw new Error('No slides to regenerate');
+  }
+  
+  error.set(null);
+  
+  try {
+    const response = await fetch('/api/regenerate-slides', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        indices,
+        instructions,
+        slides: currentData.slides,
+        room_id: getRoomId(),
+        client_id: getClientId() || '',
+      }),
+    });
+    
+    if (!response.ok) {
+      let errorMessage = `HTTP error! status: ${response.status}`;
+      try {
+        const errorData = await response.json();
+        errorMessage = errorData.detail || errorData.message || errorMessage;
+      } catch (e) {
+        // Use the status-based message
+      }
+      throw new Error(errorMessage);
+    }
+    
+    const data = await response.json();
+    
+    // Replace the slides locally; the server's edits for them carry our
+    // client ID and are ignored by applyOp
+    const latest = get(slideData);
+    if (latest && latest.slides) {
+      const slides = [...latest.slides];
+      data.indices.forEach((slideIndex, position) => {
+        if (slideIndex < slides.length) {
+          slides[slideIndex] = data.slides[position];
+        }
+      });
+      slideData.set({ ...latest, slides });
+    }
+    
+    return data.slides;
+  } catch (err) {
+    console.error('Error regenerating slides:', err);
+    
+    let errorMsg = err.message || 'Failed to regenerate slides';
+    
+    // Check if it's a network error (backend not running)
+    if (err instanceof TypeError && err.message.includes('fetch')) {
+      errorMsg = 'Cannot connect to the server. Make sure the backend is running on http://localhost:8000';
+    }
+    
+    // Keep the current deck; only report the error
+    error.set(errorMsg);
+    throw err;
+  }
+}
+
+/**
+ * Export the current deck as a PPTX or PDF file and download it.
+ * 
+ * @param {string} format - 'pptx' or 'pdf'
+ * @throws {Error} If there is no deck or the export fails
+ */
+export async function exportDeck(format) {
+  const currentData = get(slideData);
+  if (!currentData || !currentData.slides) {
+    throw new Error('No slides to export');
+  }
+  
+  error.set(null);
+  
+  try {
+    const response = await fetch(`/api/export/${format}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ slides: currentData.slides }),
+    });
+    
+    if (!response.ok) {
+      let errorMessage = `HTTP error! status: ${response.status}`;
+      try {
+        const errorData = await response.json();
+        errorMessage = errorData.detail || errorData.message || errorMessage;
+      } catch (e) {
+        // Use the status-based message
+      }
+      throw new Error(errorMessage);
+    }
+    
+    const disposition = response.headers.get('Content-Disposition') || '';
+    const match = disposition.match(/filename="([^"]+)"/);
+    const filename = match ? match[1] : `presentation.${format}`;
+    
+    // Download through a temporary link to the file's blob
+    const url = URL.createObjectURL(await response.blob());
+    const link = document.createElement('a');
+    link.href = url;
+    link.download = filename;
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
+    URL.revokeObjectURL(url);
+  } catch (err) {
+    console.error('Error exporting slides:', err);
+    
+    let errorMsg = err.message || 'Failed to export slides';
+    
+    // Check if it's a network error (backend not running)
+    if (err instanceof TypeError && err.message.includes('fetch')) {
+      errorMsg = 'Cannot connect to the server. Make sure the backend is running on http://localhost:8000';
+    }
+    
+    error.set(errorMsg);
+    throw err;
+  }
+}
@@ -1,6 +1,6 @@
 import { writable } from 'svelte/store';
 
-// Store for incoming messages
+// Store for incoming chat messages (bounded to the most recent ones)
 export const messages = writable([]);
 
 // Store for connection state
@@ -9,28 +9,159 @@ export const isConnected = writable(false);
 // Store for connection errors
 export const connectionError = writable(null);
 
+// Maximum number of chat messages kept in the messages store
+const MAX_CHAT_MESSAGES = 200;
+
+// Delay before reconnecting after an unexpected disconnect
+const RECONNECT_DELAY_MS = 1000;
+
+// Close code the server sends when a newer connection with the same client ID replaced this one
+const REPLACED_CLOSE_CODE = 4000;
+
 // WebSocket instance
 let ws = null;
 let clientId = null;
+let currentRoomId = null;
+let reconnectTimer = null;
+
+// Last deck version applied, sent on reconnect so the server only replays missed ops
+let lastSeenVersion = null;
+
+// Whether a resync has been requested and not yet answered
+let syncPending = false;
+
+// Listeners for structured (JSON) messages such as edits and snapshots
+const messageListeners = new Set();
+
+/**
+ * Register a listener for structured (JSON) messages from the server.
+ * 
+ * @param {Function} listener - Called with each parsed JSON payload
+ * @returns {Function} Unsubscribe function to remove the listener
+ */
+export function addMessageListener(listener) {
+  messageListeners.add(listener);
+  return () => messageListeners.delete(listener);
+}
+
+/**
+ * Track the deck version carried by a server message and request a resync
+ * if versioned ops were skipped.
+ * 
+ * @param {Object} payload - The parsed JSON payload
+ * @returns {Object|null} The payload to dispatch (with already applied ops
+ *   removed from batches), or null if it should be dropped
+ */
+function trackVersion(payload) {
+  if (typeof payload.version !== 'number') {
+    return payload;
+  }
+  
+  const isOp = payload.type === 'edit' || payload.type === 'deck';
+  const isBatch = payload.type === 'edit_batch';
+  
+  if ((isOp || isBatch) && syncPending) {
+    // The pending resync reply covers this op
+    return null;
+  }
+  
+  if ((isOp || isBatch) && lastSeenVersion !== null) {
+    if (payload.version <= lastSeenVersion) {
+      // Already applied, e.g. included in the snapshot we received
+      return null;
+    }
+    
+    const fromVersion = isBatch ? payload.from_version : payload.version - 1;
+    if (fromVersion > lastSeenVersion) {
+      // Some ops were not delivered; ask for everything after the last one we saw
+      syncPending = true;
+      ws.send(JSON.stringify({ type: 'sync', since: lastSeenVersion }));
+      return null;
+    }
+    
+    if (isBatch && fromVersion < lastSeenVersion) {
+      // Drop the part of the batch we have already applied
+      const seen = lastSeenVersion;
+      payload = { ...payload, ops: payload.ops.filter(op => op.version > seen) };
+    }
+  }
+  
+  if (payload.type === 'ops' || payload.type === 'snapshot') {
+    syncPending = false;
+  }
+  
+  lastSeenVersion = payload.version;
+  return payload;
+}
+
+/**
+ * Handle a raw message from the server.
+ * 
+ * @param {string} data - The raw message text
+ */
+function handleMessage(data) {
+  let payload = null;
+  try {
+    payload = JSON.parse(data);
+  } catch (err) {
+    // Not JSON, this is a chat message
+  }
+  
+  if (payload && typeof payload === 'object') {
+    if (payload.type === 'ping') {
+      // Server heartbeat; answering keeps the connection from being closed as idle
+      ws.send(JSON.stringify({ type: 'pong' }));
+      return;
+    }
+    
+    payload = trackVersion(payload);
+    if (!payload) {
+      return;
+    }
+    for (const listener of messageListeners) {
+      listener(payload);
+    }
+    return;
+  }
+  
+  // Keep only the most recent chat messages
+  messages.update(msgs => [...msgs, data].slice(-MAX_CHAT_MESSAGES));
+}
 
 /**
  * Initialize the WebSocket connection to the chat endpoint.
  * 
  * @param {string} id - The client ID to use for the connection
+ * @param {string|null} roomId - The deck room to join, or null for the default room
  */
-export function initializeWebSocket(id) {
+export function initializeWebSocket(id, roomId = null) {
   // Close existing connection if any
   if (ws) {
+    ws.onclose = null;
     ws.close();
   }
   
+  if (id !== clientId || roomId !== currentRoomId) {
+    // New session, start from a full snapshot
+    lastSeenVersion = null;
+  }
+  
   clientId = id;
+  currentRoomId = roomId;
+  syncPending = false;
   connectionError.set(null);
   
   // Determine WebSocket URL based on current location
   const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
   const host = window.location.host;
-  const wsUrl = `${protocol}//${host}/ws/chat/${id}`;
+  const path = roomId
+    ? `/ws/chat/${encodeURIComponent(roomId)}/${id}`
+    : `/ws/chat/${id}`;
+  // Opt into application heartbeats; the server closes heartbeat clients that stop answering pings
+  const query = lastSeenVersion !== null
+    ? `?heartbeat=true&since=${lastSeenVersion}`
+    : '?heartbeat=true';
+  const wsUrl = `${protocol}//${host}${path}${query}`;
   
   try {
     ws = new WebSocket(wsUrl);
@@ -42,8 +173,7 @@ export function initializeWebSocket(id) {
     };
     
     ws.onmessage = (event) => {
-      // Add the new message to the messages store
-      messages.update(msgs => [...msgs, event.data]);
+      handleMessage(event.data);
     };
     
     ws.onerror = (error) => {
@@ -51,9 +181,21 @@ export function initializeWebSocket(id) {
       console.error('WebSocket error:', error);
     };
     
-    ws.onclose = () => {
+    ws.onclose = (event) => {
       isConnected.set(false);
       console.log('WebSocket disconnected');
+      
+      if (event.code === REPLACED_CLOSE_CODE) {
+        // Another connection took over this client ID; reconnecting would replace it in turn
+        connectionError.set('Connected from another window');
+        return;
+      }
+      
+      // Reconnect and catch up from the last version we saw
+      reconnectTimer = setTimeout(() => {
+        reconnectTimer = null;
+        initializeWebSocket(clientId, currentRoomId);
+      }, RECONNECT_DELAY_MS);
     };
     
   } catch (err) {
@@ -80,10 +222,18 @@ export function sendMessage(message) {
  * Close the WebSocket connection.
  */
 export function closeWebSocket() {
+  if (reconnectTimer) {
+    clearTimeout(reconnectTimer);
+    reconnectTimer = null;
+  }
+  
   if (ws) {
+    ws.onclose = null;
     ws.close();
     ws = null;
     clientId = null;
+    currentRoomId = null;
+    lastSeenVersion = null;
     isConnected.set(false);
     messages.set([]);
   }
@@ -98,3 +248,14 @@ export function getClientId() {
   return clientId;
 }
 
+/**
+ * Get the room the client is connected to.
+ * 
+ * @returns {string|null} The room ID ('default' when connected without one) or null if not connected
+ */
+export function getRoomId() {
+  if (!ws || ws.readyState !== WebSocket.OPEN) {
+    return null;
+  }
+  return currentRoomId || 'default';
+}
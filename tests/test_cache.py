@@ -0,0 +1,253 @@
+import asyncio
+import pytest
+from backend.cache import (
+    PromptCache,
+    CACHE_BYPASS,
+    CACHE_COALESCED,
+    CACHE_HIT,
+    CACHE_MISS,
+    CACHE_SEMANTIC,
+)
+from backend.semantic_cache import SemanticIndex, prompt_terms
+
+
+class _Generator:
+    """
+    Stands in for the OpenAI call, counting the calls and holding each one
+    until released.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {"slides": [self.calls]}
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_misses_share_one_call():
+    async def scenario():
+        cache = PromptCache(max_entries=10, ttl_seconds=60)
+        generate = _Generator()
+        tasks = [asyncio.ensure_future(cache.get_or_generate("k", generate)) for _ in range(3)]
+        await _settle()
+        generate.release.set()
+        results = await asyncio.gather(*tasks)
+        return results, generate.calls, cache.get_stats()
+
+    results, calls, stats = asyncio.run(scenario())
+
+    assert calls == 1
+    assert sorted(outcome for _, outcome, _ in results) == [CACHE_COALESCED, CACHE_COALESCED, CACHE_MISS]
+    assert all(result == {"slides": [1]} for result, _, _ in results)
+    assert stats["coalesced"] == 2
+    assert stats["inflight"] == 0
+
+
+def test_results_are_copies():
+    async def scenario():
+        cache = PromptCache(max_entries=10, ttl_seconds=60)
+        generate = _Generator()
+        generate.release.set()
+        first, _, _ = await cache.get_or_generate("k", generate)
+        first["slides"].append("mutated")
+        return await cache.get_or_generate("k", generate)
+
+    assert asyncio.run(scenario()) == ({"slides": [1]}, CACHE_HIT, 1.0)
+
+
+def test_bypass_generates_and_refreshes_the_cache():
+    async def scenario():
+        cache = PromptCache(max_entries=10, ttl_seconds=60)
+        generate = _Generator()
+        generate.release.set()
+        await cache.get_or_generate("k", generate)
+        bypassed = await cache.get_or_generate("k", generate, bypass=True)
+        return bypassed, await cache.get_or_generate("k", generate)
+
+    bypassed, cached = asyncio.run(scenario())
+
+    assert bypassed == ({"slides": [2]}, CACHE_BYPASS, None)
+    assert cached == ({"slides": [2]}, CACHE_HIT, 1.0)
+
+
+def test_errors_are_not_cached():
+    async def scenario():
+        cache = PromptCache(max_entries=10, ttl_seconds=60)
+
+        async def fail():
+            raise RuntimeError("upstream down")
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_generate("k", fail)
+        generate = _Generator()
+        generate.release.set()
+        return await cache.get_or_generate("k", generate), cache.get_stats()
+
+    (result, outcome, _), stats = asyncio.run(scenario())
+
+    assert outcome == CACHE_MISS
+    assert stats["errors"] == 1
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        cache = PromptCache(max_entries=10, ttl_seconds=60)
+        generate = _Generator()
+        leader = asyncio.ensure_future(cache.get_or_generate("k", generate))
+        await _settle()
+        follower = asyncio.ensure_future(cache.get_or_generate("k", generate))
+        await _settle()
+        leader.cancel()
+        await _settle()
+        generate.release.set()
+        return await follower, generate
+
+    (result, outcome, _), generate = asyncio.run(scenario())
+
+    assert outcome == CACHE_COALESCED
+    assert generate.calls == 1
+    assert generate.cancelled == 0
+
+
+def test_load_is_cancelled_with_its_last_waiter():
+    async def scenario():
+        cache = PromptCache(max_entries=10, ttl_seconds=60)
+        generate = _Generator()
+        waiters = [asyncio.ensure_future(cache.get_or_generate("k", generate)) for _ in range(2)]
+        await _settle()
+        for waiter in waiters:
+            waiter.cancel()
+        await _settle()
+        return generate, cache.get_stats()
+
+    generate, stats = asyncio.run(scenario())
+
+    assert generate.cancelled == 1
+    assert stats["abandoned"] == 1
+    assert stats["inflight"] == 0
+
+
+def test_request_after_abandoned_load_starts_a_fresh_one():
+    async def scenario():
+        cache = PromptCache(max_entries=10, ttl_seconds=60)
+        generate = _Generator()
+        abandoned = asyncio.ensure_future(cache.get_or_generate("k", generate))
+        await _settle()
+        abandoned.cancel()
+        # Arrives before the cancellation of the shared load has settled
+        fresh = asyncio.ensure_future(cache.get_or_generate("k", generate))
+        await _settle()
+        generate.release.set()
+        return await fresh, generate
+
+    (result, outcome, _), generate = asyncio.run(scenario())
+
+    assert outcome == CACHE_MISS
+    assert result == {"slides": [2]}
+    assert generate.calls == 2
+
+
+def test_waiter_of_a_load_cancelled_elsewhere_starts_a_fresh_one():
+    async def scenario():
+        cache = PromptCache(max_entries=10, ttl_seconds=60)
+        generate = _Generator()
+        leader = asyncio.ensure_future(cache.get_or_generate("k", generate))
+        await _settle()
+        follower = asyncio.ensure_future(cache.get_or_generate("k", generate))
+        await _settle()
+        # The shared load is cancelled from outside (e.g. on shutdown)
+        cache._inflight["k"].cancel()
+        await _settle()
+        generate.release.set()
+        return await asyncio.gather(leader, follower), generate
+
+    results, generate = asyncio.run(scenario())
+
+    assert all(result == {"slides": [2]} for result, _, _ in results)
+    assert generate.calls == 2
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    async def scenario():
+        db_path = str(tmp_path / "cache.db")
+        cache = PromptCache(max_entries=10, ttl_seconds=60, db_path=db_path)
+        generate = _Generator()
+        generate.release.set()
+        await cache.get_or_generate("k", generate)
+        cache.close()
+
+        restarted = PromptCache(max_entries=10, ttl_seconds=60, db_path=db_path)
+        try:
+            return await restarted.get_or_generate("k", generate), restarted.get_stats()
+        finally:
+            restarted.close()
+
+    result, stats = asyncio.run(scenario())
+
+    assert result == ({"slides": [1]}, CACHE_HIT, 1.0)
+    assert stats["disk_hits"] == 1
+
+
+def test_exact_key_on_disk_wins_over_similar_prompt(tmp_path):
+    async def scenario():
+        db_path = str(tmp_path / "cache.db")
+        cache = PromptCache(max_entries=10, ttl_seconds=60, db_path=db_path)
+        generate = _Generator()
+        generate.release.set()
+        await cache.get_or_generate("exact", generate, prompt="history of artificial intelligence")
+        cache.close()
+
+        # After a restart only the other prompt is in the semantic index
+        restarted = PromptCache(
+            max_entries=10,
+            ttl_seconds=60,
+            db_path=db_path,
+            semantic=SemanticIndex(max_entries=10, ttl_seconds=60, threshold=0.5),
+        )
+        try:
+            await restarted.get_or_generate("similar", generate, prompt="artificial intelligence history timeline")
+            return await restarted.get_or_generate("exact", generate, prompt="history of artificial intelligence")
+        finally:
+            restarted.close()
+
+    assert asyncio.run(scenario()) == ({"slides": [1]}, CACHE_HIT, 1.0)
+
+
+def test_reworded_prompt_is_a_semantic_hit():
+    async def scenario():
+        cache = PromptCache(
+            max_entries=10,
+            ttl_seconds=60,
+            semantic=SemanticIndex(max_entries=10, ttl_seconds=60, threshold=0.8),
+        )
+        generate = _Generator()
+        generate.release.set()
+        await cache.get_or_generate("a", generate, prompt="Make slides on AI")
+        return await cache.get_or_generate("b", generate, prompt="a presentation about artificial intelligence")
+
+    result, outcome, similarity = asyncio.run(scenario())
+
+    assert outcome == CACHE_SEMANTIC
+    assert similarity == pytest.approx(1.0)
+
+
+def test_acronyms_are_not_stop_words():
+    assert prompt_terms("jobs in IT") == {"job": 1, "it": 1}
+    assert prompt_terms("is it worth it") == {"worth": 1}
+    assert prompt_terms("history of the US") == {"history": 1, "us": 1}
+    assert prompt_terms("WHO pandemic response")["who"] == 1
+    # A prompt typed in capitals has no acronyms to tell apart
+    assert prompt_terms("SLIDES ON IT") == {}
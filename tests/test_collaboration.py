@@ -0,0 +1,188 @@
+import asyncio
+import socket
+from typing import Any, Dict, List
+from backend.backplane import RedisBackplane
+from backend.collaboration import CollaborationHub
+from backend.deck_state import DeckStore
+from tools.fake_redis import FakeRedisServer
+
+
+SLIDES = [
+    {"title": "One", "content": ["a"], "theme": "professional"},
+    {"title": "Two", "content": ["b"], "theme": "professional"},
+]
+
+
+class _Manager:
+    """
+    Stands in for a worker's ConnectionManager: rooms have a number of
+    connected clients, and everything sent to them is recorded.
+    """
+
+    def __init__(self):
+        self.room_sizes: Dict[str, int] = {}
+        self.sent: List[Any] = []
+        self.connections: Dict[Any, Any] = {}
+        self.on_room_empty = None
+
+    def get_room_size(self, room_id: str) -> int:
+        return self.room_sizes.get(room_id, 0)
+
+    def get_connection(self, connection_id):
+        return None
+
+    def send_json(self, websocket, payload):
+        self.sent.append(payload)
+
+    async def broadcast_json(self, payload, room_id):
+        self.sent.append(payload)
+
+    async def broadcast_to_others(self, message, sender, room_id):
+        self.sent.append(message)
+
+    def queue_edit(self, op, room_id):
+        self.sent.append(op)
+
+
+class _Worker:
+    """
+    One server process: its own deck store and hub, on a shared Redis.
+    """
+
+    def __init__(self, redis_port: int):
+        self.manager = _Manager()
+        self.decks = DeckStore(max_rooms=10, max_ops=50)
+        self.hub = CollaborationHub(self.manager, self.decks, RedisBackplane(f"redis://127.0.0.1:{redis_port}"))
+        self.hub.SNAPSHOT_TIMEOUT = 0.2
+
+    async def join(self, room_id: str):
+        self.manager.room_sizes[room_id] = self.manager.get_room_size(room_id) + 1
+        await self.hub.join(object(), room_id)
+
+    def leave(self, room_id: str):
+        self.manager.room_sizes[room_id] -= 1
+        if not self.manager.room_sizes[room_id]:
+            self.manager.on_room_empty(room_id)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _until(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def _run_with_workers(scenario):
+    """
+    Run scenario(worker_a, worker_b) against a fake Redis server.
+    """
+    async def main():
+        port = _free_port()
+        server = asyncio.ensure_future(FakeRedisServer().serve("127.0.0.1", port))
+        workers = []
+        try:
+            await _until(lambda: _accepts(port))
+            workers = [_Worker(port), _Worker(port)]
+            for worker in workers:
+                await worker.hub.start()
+            return await scenario(*workers)
+        finally:
+            for worker in workers:
+                await worker.hub.close()
+            server.cancel()
+
+    return asyncio.run(main())
+
+
+def _accepts(port: int) -> bool:
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+        return True
+    except OSError:
+        return False
+
+
+async def _wait_for_sync(worker: _Worker, room_id: str):
+    await _until(lambda: room_id not in worker.hub._syncing)
+
+
+def test_joining_worker_gets_the_deck_from_its_peer():
+    async def scenario(a, b):
+        await a.join("room")
+        await _wait_for_sync(a, "room")
+        await a.hub.publish_deck(None, "room", "alice", SLIDES)
+        await _until(lambda: a.decks.peek("room").version == 1)
+
+        await b.join("room")
+        await _wait_for_sync(b, "room")
+        return a.decks.peek("room"), b.decks.peek("room")
+
+    deck_a, deck_b = _run_with_workers(scenario)
+
+    assert deck_b.version == deck_a.version == 1
+    assert deck_b.slides == SLIDES
+
+
+def test_worker_that_left_the_room_does_not_serve_a_stale_deck():
+    async def scenario(a, b):
+        for worker in (a, b):
+            await worker.join("room")
+            await _wait_for_sync(worker, "room")
+        await a.hub.publish_deck(None, "room", "alice", SLIDES)
+        await _until(lambda: b.decks.peek("room") is not None and b.decks.peek("room").version == 1)
+
+        # b's last client leaves, then the room keeps being edited on a
+        b.leave("room")
+        assert b.decks.peek("room").stale
+        await _until(lambda: "room" not in b.hub._releasing)
+        await a.hub.publish_edit(None, "room", "alice", {"slide_index": 0, "field": "title", "value": "Edited"})
+        await _until(lambda: a.decks.peek("room").version == 2)
+        assert b.decks.peek("room").version == 1
+
+        # An HTTP request on b (e.g. an export) gets a's current deck
+        async with b.hub.use_room("room") as deck:
+            return deck.version, deck.slides[0]["title"], deck.stale
+
+    assert _run_with_workers(scenario) == (2, "Edited", False)
+
+
+def test_deck_is_stale_when_no_worker_follows_the_room():
+    async def scenario(a, b):
+        for worker in (a, b):
+            await worker.join("room")
+            await _wait_for_sync(worker, "room")
+        await a.hub.publish_deck(None, "room", "alice", SLIDES)
+        await _until(lambda: b.decks.peek("room") is not None and b.decks.peek("room").version == 1)
+
+        b.leave("room")
+        a.leave("room")
+
+        # Nobody can vouch for b's copy any more
+        async with b.hub.use_room("room") as deck:
+            return deck.stale
+
+    assert _run_with_workers(scenario) is True
+
+
+def test_server_edits_are_checked_against_the_current_deck():
+    async def scenario(a, b):
+        for worker in (a, b):
+            await worker.join("room")
+            await _wait_for_sync(worker, "room")
+        await a.hub.publish_deck(None, "room", "alice", SLIDES)
+        await _until(lambda: b.decks.peek("room") is not None and b.decks.peek("room").version == 1)
+
+        ops = await b.hub.submit_edits("room", "server", [{"slide_index": 1, "field": "title", "value": "New"}])
+        await _until(lambda: a.decks.peek("room").version == 2)
+        return ops, a.decks.peek("room").slides[1]["title"]
+
+    ops, title_on_a = _run_with_workers(scenario)
+
+    assert [op["version"] for op in ops] == [2]
+    assert title_on_a == "New"
@@ -0,0 +1,145 @@
+import pytest
+from backend.deck_state import DeckState, DeckStore
+
+
+SLIDES = [
+    {"title": "One", "content": ["a", "b"], "theme": "professional"},
+    {"title": "Two", "content": ["c"], "theme": "professional"},
+]
+
+
+def _deck(max_ops=4, edits=0):
+    """
+    A loaded deck followed by edits to the first title, at version 1 + edits.
+    """
+    deck = DeckState(max_ops)
+    deck.set_deck("alice", SLIDES)
+    for i in range(edits):
+        deck.apply_edit("alice", 0, "title", f"Title {i}")
+    return deck
+
+
+def test_sync_without_version_sends_snapshot():
+    deck = _deck(edits=2)
+
+    message = deck.sync_message()
+
+    assert message["type"] == "snapshot"
+    assert message["version"] == 3
+    assert message["slides"][0]["title"] == "Title 1"
+
+
+def test_sync_up_to_date_sends_no_ops():
+    deck = _deck(edits=2)
+
+    assert deck.sync_message(3) == {"type": "ops", "from_version": 3, "version": 3, "ops": []}
+
+
+def test_sync_sends_only_missed_ops():
+    deck = _deck(edits=3)
+
+    message = deck.sync_message(2)
+
+    assert message["type"] == "ops"
+    assert message["from_version"] == 2
+    assert [op["version"] for op in message["ops"]] == [3, 4]
+
+
+def test_sync_from_oldest_buffered_version():
+    # Versions 2 to 5 are buffered: a client at version 1 only misses buffered ops
+    deck = _deck(max_ops=4, edits=4)
+
+    message = deck.sync_message(1)
+
+    assert message["type"] == "ops"
+    assert [op["version"] for op in message["ops"]] == [2, 3, 4, 5]
+
+
+def test_sync_behind_the_ring_buffer_sends_snapshot():
+    # Version 1 has been dropped from the buffer, so a client at 0 cannot catch up with ops
+    deck = _deck(max_ops=4, edits=4)
+
+    assert deck.sync_message(0)["type"] == "snapshot"
+
+
+def test_sync_from_future_version_sends_snapshot():
+    deck = _deck(edits=1)
+
+    assert deck.sync_message(10)["type"] == "snapshot"
+
+
+def test_sync_from_negative_version_sends_snapshot():
+    deck = _deck(edits=1)
+
+    assert deck.sync_message(-1)["type"] == "snapshot"
+
+
+def test_sync_after_restore_sends_snapshot():
+    deck = _deck(edits=2)
+    deck.restore(SLIDES, 10)
+
+    # The buffer was cleared, so only the restored version needs no snapshot
+    assert deck.sync_message(9)["type"] == "snapshot"
+    assert deck.sync_message(10)["type"] == "ops"
+
+
+def test_sync_of_empty_deck():
+    deck = DeckState(4)
+
+    assert deck.sync_message(0) == {"type": "ops", "from_version": 0, "version": 0, "ops": []}
+    assert deck.sync_message()["slides"] is None
+
+
+def test_restore_clears_stale():
+    deck = _deck()
+    deck.stale = True
+
+    deck.restore(SLIDES, 5)
+
+    assert not deck.stale
+    assert deck.version == 5
+
+
+def test_delta_edit():
+    deck = _deck()
+
+    op = deck.apply_delta("bob", 1, "title", {"index": 3, "insert": "!"})
+
+    assert op["value"] == "Two!"
+    assert deck.slides[1]["title"] == "Two!"
+
+
+def test_bullet_edit_must_be_a_string():
+    deck = _deck()
+
+    with pytest.raises(ValueError):
+        deck.apply_edit("bob", 0, "content.0", ["not", "a", "string"])
+    assert deck.version == 1
+
+
+@pytest.mark.parametrize("slide_index, field", [
+    (2, "title"),
+    (-1, "title"),
+    (True, "title"),
+    (0, "subtitle"),
+    (0, "content.2"),
+    (0, "content.x"),
+])
+def test_invalid_edits_are_rejected(slide_index, field):
+    deck = _deck()
+
+    with pytest.raises(ValueError):
+        deck.apply_edit("bob", slide_index, field, "value")
+
+
+def test_store_evicts_least_recently_used_unpinned_room():
+    store = DeckStore(max_rooms=2, max_ops=4)
+    store.is_pinned = lambda room_id: room_id == "a"
+    store.get("a")
+    store.get("b")
+
+    store.get("c")
+
+    assert store.peek("a") is not None
+    assert store.peek("b") is None
+    assert store.peek("c") is not None
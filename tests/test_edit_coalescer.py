@@ -0,0 +1,156 @@
+import asyncio
+from backend.edit_coalescer import EditCoalescer, fields_overlap
+
+
+def _edit(version, slide_index, field, value="v", **extra):
+    return {
+        "type": "edit",
+        "client_id": "alice",
+        "slide_index": slide_index,
+        "field": field,
+        "value": value,
+        "version": version,
+        **extra,
+    }
+
+
+def _coalescer(flush_interval=60.0):
+    sent = []
+    coalescer = EditCoalescer(flush_interval, lambda room_id, frame: sent.append((room_id, frame.payload)) or 1)
+    return coalescer, sent
+
+
+def test_fields_overlap():
+    assert fields_overlap("title", "title")
+    assert fields_overlap("content", "content.1")
+    assert fields_overlap("content.1", "content")
+    assert not fields_overlap("content.0", "content.1")
+    assert not fields_overlap("title", "theme")
+
+
+def test_single_edit_is_sent_as_plain_edit():
+    async def scenario():
+        coalescer, sent = _coalescer()
+        coalescer.submit("r", _edit(5, 0, "title"))
+        coalescer.flush("r")
+        return sent
+
+    assert asyncio.run(scenario()) == [("r", _edit(5, 0, "title"))]
+
+
+def test_edits_are_batched_until_the_window_closes():
+    async def scenario():
+        coalescer, sent = _coalescer(flush_interval=0.05)
+        coalescer.submit("r", _edit(1, 0, "title"))
+        coalescer.submit("r", _edit(2, 1, "title"))
+        sent_before = list(sent)
+        await asyncio.sleep(0.1)
+        return sent_before, sent
+
+    sent_before, sent = asyncio.run(scenario())
+
+    assert sent_before == []
+    assert len(sent) == 1
+    room_id, payload = sent[0]
+    assert payload["type"] == "edit_batch"
+    assert (payload["from_version"], payload["version"]) == (0, 2)
+    assert [op["version"] for op in payload["ops"]] == [1, 2]
+
+
+def test_later_edit_supersedes_earlier_one():
+    async def scenario():
+        coalescer, sent = _coalescer()
+        coalescer.submit("r", _edit(1, 0, "title", "a"))
+        coalescer.submit("r", _edit(2, 1, "title", "x"))
+        coalescer.submit("r", _edit(3, 0, "title", "ab"))
+        coalescer.flush("r")
+        return sent, coalescer.get_stats()
+
+    sent, stats = asyncio.run(scenario())
+
+    payload = sent[0][1]
+    # The batch still covers every version, even those whose ops were dropped
+    assert (payload["from_version"], payload["version"]) == (0, 3)
+    assert [(op["slide_index"], op["value"]) for op in payload["ops"]] == [(1, "x"), (0, "ab")]
+    assert stats["edits_received"] == 3
+    assert stats["edits_coalesced"] == 1
+
+
+def test_superseded_single_edit_is_still_a_batch():
+    async def scenario():
+        coalescer, sent = _coalescer()
+        coalescer.submit("r", _edit(1, 0, "title", "a"))
+        coalescer.submit("r", _edit(2, 0, "title", "ab"))
+        coalescer.flush("r")
+        return sent
+
+    payload = asyncio.run(scenario())[0][1]
+
+    # One op left, but it covers two versions
+    assert payload["type"] == "edit_batch"
+    assert (payload["from_version"], payload["version"]) == (0, 2)
+    assert len(payload["ops"]) == 1
+
+
+def test_overlapping_edit_in_between_prevents_supersede():
+    async def scenario():
+        coalescer, sent = _coalescer()
+        coalescer.submit("r", _edit(1, 0, "content.0", "a"))
+        coalescer.submit("r", _edit(2, 0, "content", ["x", "y"]))
+        coalescer.submit("r", _edit(3, 0, "content.0", "b"))
+        coalescer.flush("r")
+        return sent
+
+    payload = asyncio.run(scenario())[0][1]
+
+    assert [op["version"] for op in payload["ops"]] == [1, 2, 3]
+
+
+def test_superseding_delta_is_sent_as_full_value():
+    async def scenario():
+        coalescer, sent = _coalescer()
+        coalescer.submit("r", _edit(1, 0, "title", "ab", delta={"index": 1, "delete": 0, "insert": "b"}))
+        coalescer.submit("r", _edit(2, 0, "title", "abc", delta={"index": 2, "delete": 0, "insert": "c"}))
+        coalescer.flush("r")
+        return sent
+
+    op = asyncio.run(scenario())[0][1]["ops"][0]
+
+    assert op["value"] == "abc"
+    assert "delta" not in op
+
+
+def test_rooms_are_batched_separately():
+    async def scenario():
+        coalescer, sent = _coalescer()
+        coalescer.submit("r1", _edit(1, 0, "title"))
+        coalescer.submit("r2", _edit(7, 0, "title"))
+        coalescer.flush("r1")
+        return sent, coalescer.get_stats()
+
+    sent, stats = asyncio.run(scenario())
+
+    assert [room_id for room_id, _ in sent] == ["r1"]
+    assert stats["pending_rooms"] == 1
+
+
+def test_discard_drops_pending_edits():
+    async def scenario():
+        coalescer, sent = _coalescer(flush_interval=0.02)
+        coalescer.submit("r", _edit(1, 0, "title"))
+        coalescer.discard("r")
+        await asyncio.sleep(0.05)
+        coalescer.flush("r")
+        return sent
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_zero_interval_flushes_every_edit():
+    async def scenario():
+        coalescer, sent = _coalescer(flush_interval=0)
+        coalescer.submit("r", _edit(1, 0, "title"))
+        coalescer.submit("r", _edit(2, 0, "title"))
+        return sent
+
+    assert [payload["type"] for _, payload in asyncio.run(scenario())] == ["edit", "edit"]
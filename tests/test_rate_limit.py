@@ -0,0 +1,127 @@
+import asyncio
+import random
+import time
+from email.utils import formatdate
+import pytest
+from backend.rate_limit import RateLimiter, backoff_delay, parse_retry_after
+
+
+def test_backoff_grows_exponentially_within_the_cap():
+    random.seed(0)
+    for attempt in range(8):
+        ceiling = min(10.0, 0.5 * 2 ** attempt)
+        delays = [backoff_delay(attempt, 0.5, 10.0) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        # Full jitter spreads the retries over the whole window
+        assert max(delays) > ceiling * 0.8
+
+
+def test_backoff_honors_retry_after():
+    random.seed(0)
+    for attempt in range(4):
+        delay = backoff_delay(attempt, 0.5, 10.0, retry_after=3.0)
+        assert 3.0 <= delay <= 3.5
+
+
+def test_backoff_never_exceeds_max_delay():
+    assert backoff_delay(20, 1.0, 5.0) <= 5.0
+    assert backoff_delay(0, 1.0, 5.0, retry_after=60.0) == 5.0
+
+
+@pytest.mark.parametrize("headers, expected", [
+    (None, None),
+    ({}, None),
+    ({"retry-after": "2"}, 2.0),
+    ({"retry-after": "1.5"}, 1.5),
+    ({"retry-after": "-3"}, 0.0),
+    ({"retry-after-ms": "250"}, 0.25),
+    # The millisecond header wins over the seconds header
+    ({"retry-after-ms": "250", "retry-after": "9"}, 0.25),
+    ({"retry-after-ms": "soon", "retry-after": "9"}, 9.0),
+    ({"retry-after": "not a date"}, None),
+])
+def test_parse_retry_after(headers, expected):
+    assert parse_retry_after(headers) == expected
+
+
+def test_parse_retry_after_http_date():
+    delay = parse_retry_after({"retry-after": formatdate(time.time() + 30, usegmt=True)})
+    assert 28 <= delay <= 30
+
+    assert parse_retry_after({"retry-after": formatdate(time.time() - 30, usegmt=True)}) == 0.0
+
+
+def test_waiters_are_served_in_arrival_order():
+    async def scenario():
+        # One request per 50 ms, and no burst budget left
+        limiter = RateLimiter(requests_per_minute=1200)
+        limiter.requests.level = 0
+        order = []
+
+        async def call(name):
+            await limiter.acquire()
+            order.append(name)
+
+        tasks = []
+        for name in range(5):
+            tasks.append(asyncio.ensure_future(call(name)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order, limiter.get_stats()
+
+    order, stats = asyncio.run(scenario())
+
+    assert order == [0, 1, 2, 3, 4]
+    assert stats["acquired"] == 5
+    assert stats["waited"] == 5
+
+
+def test_token_quota_paces_requests():
+    async def scenario():
+        # 60 tokens per second, bucket emptied
+        limiter = RateLimiter(tokens_per_minute=3600)
+        limiter.tokens.level = 0
+        started = time.monotonic()
+        await limiter.acquire(tokens=6)
+        return time.monotonic() - started
+
+    assert 0.08 <= asyncio.run(scenario()) < 0.5
+
+
+def test_reconcile_returns_unused_tokens():
+    limiter = RateLimiter(tokens_per_minute=600)
+    limiter.tokens.level = 50
+
+    limiter.reconcile(estimated_tokens=40, actual_tokens=10)
+
+    assert limiter.tokens.level == pytest.approx(80, abs=1)
+
+
+def test_pause_holds_back_every_caller():
+    async def scenario():
+        limiter = RateLimiter()
+        limiter.pause(0.2)
+        # A shorter pause does not cut the current one short
+        limiter.pause(0.05)
+        started = time.monotonic()
+        await asyncio.gather(limiter.acquire(), limiter.acquire())
+        return time.monotonic() - started, limiter.get_stats()
+
+    elapsed, stats = asyncio.run(scenario())
+
+    assert elapsed >= 0.19
+    assert stats["pauses"] == 1
+
+
+def test_no_limits_never_wait():
+    async def scenario():
+        limiter = RateLimiter()
+        for _ in range(100):
+            await limiter.acquire(tokens=10000)
+        return limiter.get_stats()
+
+    stats = asyncio.run(scenario())
+
+    assert stats["acquired"] == 100
+    assert stats["waited"] == 0
+    assert stats["requests_available"] is None
@@ -0,0 +1,112 @@
+import json
+import random
+import pytest
+from backend.slide_stream import IncrementalSlideParser
+
+
+def _document():
+    # Strings full of brackets, quotes and escapes, plus a decoy "slides" key
+    # inside a nested object that must not be mistaken for the real array
+    return json.dumps({
+        "note": "a \"}{[ \\\\ ]",
+        "meta": {"slides": [{"title": "decoy"}]},
+        "slides": [
+            {
+                "title": f"Slide {i} {{\"[",
+                "content": ["bullet }", "quote \\\" ]", "unicode é"],
+                "theme": "professional",
+            }
+            for i in range(4)
+        ],
+    })
+
+
+def _feed_all(parser, parts):
+    slides = []
+    for part in parts:
+        slides.extend(parser.feed(part))
+    return slides
+
+
+def test_whole_document_in_one_chunk():
+    document = _document()
+    parser = IncrementalSlideParser()
+
+    slides = parser.feed(document)
+
+    assert slides == json.loads(document)["slides"]
+    assert parser.close() == json.loads(document)
+
+
+@pytest.mark.parametrize("cut", range(1, len(_document())))
+def test_every_split_point(cut):
+    document = _document()
+    parser = IncrementalSlideParser()
+
+    slides = _feed_all(parser, [document[:cut], document[cut:]])
+
+    assert slides == json.loads(document)["slides"]
+    assert parser.close() == json.loads(document)
+
+
+def test_one_character_chunks():
+    document = _document()
+    parser = IncrementalSlideParser()
+
+    slides = _feed_all(parser, list(document))
+
+    assert slides == json.loads(document)["slides"]
+
+
+def test_random_chunking():
+    document = _document()
+    rng = random.Random(0)
+    for _ in range(200):
+        cuts = sorted(rng.sample(range(1, len(document)), rng.randint(1, 30)))
+        parts = [document[start:end] for start, end in zip([0] + cuts, cuts + [len(document)])]
+        parser = IncrementalSlideParser()
+
+        assert _feed_all(parser, parts) == json.loads(document)["slides"]
+
+
+def test_slides_are_emitted_as_soon_as_they_close():
+    first = {"title": "One", "content": ["a"], "theme": "professional"}
+    second = {"title": "Two", "content": ["b"], "theme": "professional"}
+    parser = IncrementalSlideParser()
+
+    assert parser.feed('{"slides": [' + json.dumps(first)[:-1]) == []
+    assert parser.feed('}, ' + json.dumps(second)) == [first, second]
+    assert parser.feed(']}') == []
+
+
+def test_escaped_key_is_decoded():
+    # "slides" is the key "slides" written with an escape
+    document = '{"slid\\u0065s": [{"title": "T", "content": [], "theme": "professional"}]}'
+    parser = IncrementalSlideParser()
+
+    slides = _feed_all(parser, [document[:5], document[5:9], document[9:]])
+
+    assert slides == [{"title": "T", "content": [], "theme": "professional"}]
+
+
+def test_invalid_slide_is_rejected_when_it_closes():
+    parser = IncrementalSlideParser()
+
+    with pytest.raises(ValueError):
+        parser.feed('{"slides": [{"title": "T", "content": "not a list", "theme": "professional"}')
+
+
+def test_non_object_entries_are_rejected_on_close():
+    parser = IncrementalSlideParser()
+    parser.feed('{"slides": ["not a slide"]}')
+
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_truncated_document_fails_on_close():
+    parser = IncrementalSlideParser()
+    parser.feed('{"slides": [{"title": "T"')
+
+    with pytest.raises(Exception):
+        parser.close()
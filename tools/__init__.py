@@ -0,0 +1,2 @@
+# Backend package for Smart Slides
+
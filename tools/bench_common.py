@@ -0,0 +1,271 @@
+"""
+Helpers shared by the benchmark scripts: starting servers, sampling their
+CPU and memory, summarizing latencies and writing JSON results.
+"""
+
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; /proc is read directly on Linux without it
+    psutil = None
+
+
+# Repository root, used as the working directory of spawned servers
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """
+    Get a percentile of already sorted values, by linear interpolation.
+
+    Args:
+        sorted_values: The values, in ascending order
+        fraction: The percentile as a fraction, e.g. 0.95
+
+    Returns:
+        The percentile, or None if there are no values
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize_latencies(seconds: List[float]) -> Dict[str, Any]:
+    """
+    Summarize latencies measured in seconds.
+
+    Args:
+        seconds: The measured latencies
+
+    Returns:
+        The count and the mean, min, p50, p95, p99 and max in milliseconds
+    """
+    values = sorted(seconds)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "min_ms": ms(values[0]) if values else None,
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(values[-1]) if values else None,
+    }
+
+
+def free_port() -> int:
+    """
+    Pick a free local TCP port.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def raise_open_file_limit():
+    """
+    Raise the soft open-file limit to the hard limit, so that thousands of
+    client sockets can be opened. Does nothing where unsupported.
+    """
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def start_process(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """
+    Start a server process from the repository root.
+
+    Args:
+        args: The command line, without the interpreter
+        env: Extra environment variables
+
+    Returns:
+        The started process
+    """
+    return subprocess.Popen(
+        [sys.executable] + args,
+        cwd=REPO_ROOT,
+        env={**os.environ, **(env or {})},
+    )
+
+
+def stop_process(process: Optional[subprocess.Popen]):
+    """
+    Stop a process started with start_process.
+    """
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def wait_for_http(url: str, timeout: float = 20.0):
+    """
+    Wait until a server answers HTTP requests.
+
+    Args:
+        url: A URL that answers once the server is up
+        timeout: How long to wait, in seconds
+
+    Raises:
+        RuntimeError: If the server is not up in time
+    """
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not start within {timeout} seconds")
+
+
+class ProcessSampler:
+    """
+    Samples the CPU and memory use of a server process while a benchmark runs.
+
+    Uses psutil when installed, otherwise reads /proc (Linux only). Without
+    either, the summary is empty.
+    """
+
+    def __init__(self, pid: Optional[int], interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_percent: List[float] = []
+        self.rss_bytes: List[int] = []
+        self._task: Optional["asyncio.Task"] = None
+
+    def start(self):
+        if self.pid is not None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> Dict[str, Any]:
+        """
+        Stop sampling.
+
+        Returns:
+            Average and peak CPU (percent of one core) and resident memory (MB)
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        return self.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.cpu_percent and not self.rss_bytes:
+            return {"available": False}
+        return {
+            "available": True,
+            "samples": len(self.rss_bytes),
+            "cpu_percent_avg": round(sum(self.cpu_percent) / len(self.cpu_percent), 1) if self.cpu_percent else None,
+            "cpu_percent_max": round(max(self.cpu_percent), 1) if self.cpu_percent else None,
+            "rss_mb_avg": round(sum(self.rss_bytes) / len(self.rss_bytes) / 2 ** 20, 1),
+            "rss_mb_max": round(max(self.rss_bytes) / 2 ** 20, 1),
+        }
+
+    async def _run(self):
+        previous = self._read()
+        while True:
+            await asyncio.sleep(self.interval)
+            current = self._read()
+            if current is None or previous is None:
+                return
+            cpu_seconds = current[0] - previous[0]
+            elapsed = current[2] - previous[2]
+            if elapsed > 0:
+                self.cpu_percent.append(100.0 * cpu_seconds / elapsed)
+            self.rss_bytes.append(current[1])
+            previous = current
+
+    def _read(self):
+        """
+        Read (cpu seconds, rss bytes, wall time) of the process, or None.
+        """
+        now = time.monotonic()
+        try:
+            if psutil is not None:
+                process = psutil.Process(self.pid)
+                times = process.cpu_times()
+                return times.user + times.system, process.memory_info().rss, now
+            with open(f"/proc/{self.pid}/stat") as stat_file:
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+            ticks = os.sysconf("SC_CLK_TCK")
+            page_size = os.sysconf("SC_PAGE_SIZE")
+            # utime and stime are fields 14 and 15, rss is field 24
+            return (int(fields[11]) + int(fields[12])) / ticks, int(fields[21]) * page_size, now
+        except Exception:
+            return None
+
+
+def git_revision() -> Optional[str]:
+    """
+    Get the current git commit of the repository, if available.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(scenario: str, settings: Dict[str, Any], results: Dict[str, Any], output: Optional[str]):
+    """
+    Write the benchmark results as JSON, with enough context to compare runs.
+
+    Args:
+        scenario: Name of the benchmark
+        settings: The parameters the benchmark ran with
+        results: The measurements
+        output: File to write to, or None for stdout
+    """
+    document = {
+        "scenario": scenario,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": settings,
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+    if output:
+        with open(output, "w") as output_file:
+            output_file.write(text + "\n")
+    else:
+        print(text)
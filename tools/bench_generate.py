@@ -0,0 +1,276 @@
+"""
+Load test for the slide generation endpoints.
+
+By default starts the fake OpenAI server and a backend pointed at it, then
+sends generation requests from a fixed number of concurrent clients and
+reports throughput and latency percentiles as JSON.
+
+Usage:
+    python -m tools.bench_generate --concurrency 32 --requests 500 --latency 0.8
+    python -m tools.bench_generate --endpoint stream --rate-limit-rate 0.1 --output run.json
+    python -m tools.bench_generate --url http://127.0.0.1:8000 --server-pid 1234
+
+Each request uses a distinct prompt so it reaches the upstream; pass
+--repeat-prompts to measure the prompt cache instead, or
+--paraphrase-prompts to ask about a few topics in varying wording and
+measure the semantic cache (start the backend with SEMANTIC_CACHE_ENABLED=true).
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from tools.bench_common import (
+    ProcessSampler,
+    free_port,
+    start_process,
+    stop_process,
+    summarize_latencies,
+    wait_for_http,
+    write_results,
+)
+from tools.fake_openai import add_config_arguments
+
+
+ENDPOINTS = {
+    "generate": "/api/generate-slides",
+    "stream": "/api/generate-slides/stream",
+}
+
+# Topics asked about with --paraphrase-prompts, each with equivalent wordings
+PARAPHRASE_TOPICS = [
+    ("artificial intelligence", "AI"),
+    ("the history of the Roman Empire", "Roman Empire history"),
+    ("machine learning in healthcare", "ML in healthcare"),
+    ("renewable energy trends", "trends in renewable energy"),
+    ("remote team management", "the management of remote teams"),
+]
+
+# Ways of asking for a deck, combined with the topics above
+PARAPHRASE_TEMPLATES = [
+    "Create a presentation about {}",
+    "make slides on {}",
+    "{}: an overview",
+    "Please build a deck about {}.",
+    "Quick intro to {}",
+]
+
+
+class GenerateBenchmark:
+    """
+    Drives one generation endpoint from concurrent clients.
+    """
+
+    def __init__(self, base_url: str, endpoint: str, concurrency: int, requests: int,
+                 duration: Optional[float], repeat_prompts: bool, timeout: float,
+                 paraphrase_prompts: bool = False):
+        self.base_url = base_url
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.requests = requests
+        self.duration = duration
+        self.repeat_prompts = repeat_prompts
+        self.paraphrase_prompts = paraphrase_prompts
+        self.timeout = timeout
+        self.latencies: List[float] = []
+        self.first_slide_latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.cache_outcomes: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._issued = 0
+        self._deadline: Optional[float] = None
+
+    def _next_prompt(self) -> Optional[str]:
+        if self._deadline is not None:
+            if time.monotonic() >= self._deadline:
+                return None
+        elif self._issued >= self.requests:
+            return None
+        self._issued += 1
+        if self.repeat_prompts:
+            return "Quarterly results for the benchmark team"
+        if self.paraphrase_prompts:
+            # Cycle through the topics, varying the wording on every pass
+            index = self._issued - 1
+            wordings = PARAPHRASE_TOPICS[index % len(PARAPHRASE_TOPICS)]
+            variant = index // len(PARAPHRASE_TOPICS)
+            template = PARAPHRASE_TEMPLATES[variant % len(PARAPHRASE_TEMPLATES)]
+            return template.format(wordings[variant % len(wordings)])
+        return f"Benchmark deck number {self._issued} about distributed systems"
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.timeout) as client:
+            started = time.monotonic()
+            if self.duration is not None:
+                self._deadline = started + self.duration
+            await asyncio.gather(*[self._worker(client) for _ in range(self.concurrency)])
+            elapsed = time.monotonic() - started
+
+        succeeded = self.statuses.get("200", 0)
+        results = {
+            "requests": sum(self.statuses.values()),
+            "succeeded": succeeded,
+            "status_counts": dict(self.statuses),
+            "cache_outcomes": dict(self.cache_outcomes),
+            "errors": dict(self.errors.most_common(10)),
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_rps": round(sum(self.statuses.values()) / elapsed, 3) if elapsed else None,
+            "success_rps": round(succeeded / elapsed, 3) if elapsed else None,
+            "latency": summarize_latencies(self.latencies),
+        }
+        if self.endpoint == "stream":
+            results["first_slide_latency"] = summarize_latencies(self.first_slide_latencies)
+        return results
+
+    async def _worker(self, client: httpx.AsyncClient):
+        while True:
+            prompt = self._next_prompt()
+            if prompt is None:
+                return
+            started = time.monotonic()
+            try:
+                if self.endpoint == "stream":
+                    status = await self._stream_request(client, prompt, started)
+                else:
+                    response = await client.post(ENDPOINTS["generate"], json={"query": prompt})
+                    status = str(response.status_code)
+                    if response.status_code == 200:
+                        self.cache_outcomes[response.headers.get("x-cache", "NONE")] += 1
+                    else:
+                        self.errors[response.text[:120]] += 1
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+                self.errors[str(e)[:120] or status] += 1
+            self.latencies.append(time.monotonic() - started)
+            self.statuses[status] += 1
+
+    async def _stream_request(self, client: httpx.AsyncClient, prompt: str, started: float) -> str:
+        """
+        Read one SSE response to the end, recording the time to the first slide.
+
+        Returns:
+            '200' if the stream ended with 'done', otherwise the HTTP status
+            or the status carried by the 'error' event
+        """
+        async with client.stream("POST", ENDPOINTS["stream"], json={"query": prompt}) as response:
+            if response.status_code != 200:
+                await response.aread()
+                self.errors[response.text[:120]] += 1
+                return str(response.status_code)
+
+            event = None
+            first_slide = True
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "slide" and first_slide:
+                        self.first_slide_latencies.append(time.monotonic() - started)
+                        first_slide = False
+                    elif event == "done":
+                        self.cache_outcomes[data.get("cache", "NONE")] += 1
+                        return "200"
+                    elif event == "error":
+                        self.errors[str(data.get("detail"))[:120]] += 1
+                        return str(data.get("status", "error"))
+            return "incomplete"
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    fake_process = None
+    backend_process = None
+    base_url = args.url
+    server_pid = args.server_pid
+    fake_url = None
+
+    try:
+        if base_url is None:
+            fake_port = free_port()
+            fake_url = f"http://127.0.0.1:{fake_port}"
+            fake_args = ["-m", "tools.fake_openai", "--port", str(fake_port)]
+            for name in ("latency", "jitter", "chunk_delay", "chunk_size", "slides",
+                         "error_rate", "rate_limit_rate", "rpm", "retry_after"):
+                value = getattr(args, name)
+                if value is not None:
+                    fake_args += [f"--{name.replace('_', '-')}", str(value)]
+            fake_process = start_process(fake_args)
+            await wait_for_http(f"{fake_url}/stats")
+
+            backend_port = free_port()
+            base_url = f"http://127.0.0.1:{backend_port}"
+            backend_env = {"OPENAI_API_KEY": "sk-benchmark", "OPENAI_BASE_URL": f"{fake_url}/v1"}
+            for setting in args.backend_env:
+                name, _, value = setting.partition("=")
+                backend_env[name] = value
+            backend_process = start_process(
+                ["-m", "uvicorn", "backend.main:app", "--port", str(backend_port), "--log-level", "warning"],
+                backend_env,
+            )
+            server_pid = backend_process.pid
+            await wait_for_http(f"{base_url}/api/status")
+
+        benchmark = GenerateBenchmark(
+            base_url,
+            args.endpoint,
+            args.concurrency,
+            args.requests,
+            args.duration,
+            args.repeat_prompts,
+            args.timeout,
+            args.paraphrase_prompts,
+        )
+        sampler = ProcessSampler(server_pid)
+        sampler.start()
+        results = await benchmark.run()
+        results["server"] = await sampler.stop()
+
+        async with httpx.AsyncClient(base_url=base_url, timeout=5.0) as client:
+            for name, path in (("rate_limit", "/api/rate-limit/stats"), ("cache", "/api/cache/stats")):
+                try:
+                    response = await client.get(path)
+                    if response.status_code == 200:
+                        results[name] = response.json()
+                except httpx.HTTPError:
+                    pass
+            if fake_url is not None:
+                results["upstream"] = (await client.get(f"{fake_url}/stats")).json()
+
+        return results
+    finally:
+        stop_process(backend_process)
+        stop_process(fake_process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the slide generation endpoints")
+    parser.add_argument("--url", default=None, help="Backend to test; by default a backend and fake OpenAI server are started")
+    parser.add_argument("--server-pid", type=int, default=None, help="PID of the backend given by --url, to sample its CPU and memory")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="generate", help="Endpoint to load")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests to send")
+    parser.add_argument("--duration", type=float, default=None, help="Send requests for this many seconds instead of a fixed count")
+    prompts = parser.add_mutually_exclusive_group()
+    prompts.add_argument("--repeat-prompts", action="store_true", help="Send the same prompt every time, exercising the prompt cache")
+    prompts.add_argument("--paraphrase-prompts", action="store_true",
+                         help="Ask about a few topics in varying wording, exercising the semantic cache")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--backend-env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Environment variable for the started backend, e.g. MAX_CONCURRENT_GENERATIONS=32")
+    parser.add_argument("--output", default=None, help="Write the JSON results to this file instead of stdout")
+    add_config_arguments(parser.add_argument_group("fake OpenAI server (when --url is not given)"))
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    settings = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results(f"generate-{args.endpoint}", settings, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Load test for collaboration WebSocket fan-out.
+
+By default starts a backend, opens many /ws/chat/{room_id}/{client_id}
+clients spread over several rooms, has a share of them send edits and chat
+messages at a fixed rate, and reports fan-out latency (send to receipt by
+each other client in the room), delivery counts and the server's CPU and
+memory as JSON.
+
+Usage:
+    python -m tools.bench_websocket --clients 1000 --rooms 20 --duration 15
+    python -m tools.bench_websocket --mix chat --senders-per-room 5 --rate 10 --output ws.json
+    python -m tools.bench_websocket --url http://127.0.0.1:8000 --server-pid 1234
+
+Every client runs in this one process, so opening thousands of them needs
+a high open-file limit (ulimit -n); the soft limit is raised automatically
+where allowed. Edits are coalesced by the server (EDIT_FLUSH_INTERVAL_MS),
+so fewer edit deliveries than edits sent is expected.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import websockets
+
+from tools.bench_common import (
+    ProcessSampler,
+    free_port,
+    raise_open_file_limit,
+    start_process,
+    stop_process,
+    summarize_latencies,
+    wait_for_http,
+    write_results,
+)
+
+
+# Marker prefixed to every timestamped payload sent by the benchmark
+MARKER = "bench@"
+
+BENCH_DECK = [
+    {"title": f"Slide {index + 1}", "content": ["First point", "Second point"], "theme": "professional"}
+    for index in range(5)
+]
+
+
+class BenchClient:
+    """
+    One WebSocket client: records the latency of every timestamped message it receives.
+    """
+
+    def __init__(self, benchmark: "WebSocketBenchmark", room_id: str, client_id: str):
+        self.benchmark = benchmark
+        self.room_id = room_id
+        self.client_id = client_id
+        self.websocket = None
+        self.reader_task: Optional["asyncio.Task"] = None
+
+    async def connect(self, ws_url: str):
+        self.websocket = await websockets.connect(
+            f"{ws_url}/ws/chat/{self.room_id}/{self.client_id}",
+            max_queue=None,
+            open_timeout=self.benchmark.timeout,
+        )
+        # The first message is the deck sync
+        await self.websocket.recv()
+        self.reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def _read_loop(self):
+        try:
+            async for message in self.websocket:
+                self._record(message, time.monotonic())
+        except websockets.ConnectionClosed:
+            if not self.benchmark.stopping:
+                self.benchmark.disconnects += 1
+
+    def _record(self, message: str, received: float):
+        benchmark = self.benchmark
+        if MARKER not in message:
+            return
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            # Chat lines arrive as "client_id: text"
+            sent = _sent_time(message.split(": ", 1)[-1])
+            if sent is not None:
+                benchmark.record("chat", received - sent)
+            return
+
+        if not isinstance(payload, dict):
+            return
+        if payload.get("type") == "edit":
+            ops = [payload]
+        elif payload.get("type") == "edit_batch":
+            ops = payload.get("ops", [])
+        else:
+            return
+        for op in ops:
+            sent = _sent_time(op.get("value"))
+            if sent is not None:
+                benchmark.record("edit", received - sent)
+
+    async def send_edit(self):
+        await self.websocket.send(json.dumps({
+            "type": "edit",
+            "slide_index": random.randrange(len(BENCH_DECK)),
+            "field": "title",
+            "value": f"{MARKER}{time.monotonic():.6f}",
+        }))
+
+    async def send_chat(self):
+        await self.websocket.send(f"{MARKER}{time.monotonic():.6f}")
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+        if self.reader_task is not None:
+            try:
+                await asyncio.wait_for(self.reader_task, 5)
+            except (asyncio.TimeoutError, Exception):
+                self.reader_task.cancel()
+
+
+def _sent_time(text: Any) -> Optional[float]:
+    if not isinstance(text, str) or not text.startswith(MARKER):
+        return None
+    try:
+        return float(text[len(MARKER):])
+    except ValueError:
+        return None
+
+
+class WebSocketBenchmark:
+    """
+    Opens the clients, drives the traffic and collects the measurements.
+    """
+
+    def __init__(self, args: argparse.Namespace, ws_url: str):
+        self.args = args
+        self.ws_url = ws_url
+        self.timeout = args.timeout
+        self.latencies: Dict[str, List[float]] = {"edit": [], "chat": []}
+        self.sent: Dict[str, int] = {"edit": 0, "chat": 0}
+        self.sent_by_room: Dict[str, Dict[str, int]] = {}
+        self.connect_latencies: List[float] = []
+        self.connect_failures = 0
+        self.disconnects = 0
+        self.send_failures = 0
+        self.stopping = False
+        self.measuring = False
+        self.clients: List[BenchClient] = []
+
+    def record(self, kind: str, latency: float):
+        if self.measuring:
+            self.latencies[kind].append(latency)
+
+    async def run(self) -> Dict[str, Any]:
+        args = self.args
+        rooms = [f"bench-room-{index}" for index in range(args.rooms)]
+        clients = [
+            BenchClient(self, rooms[index % len(rooms)], f"client-{index}")
+            for index in range(args.clients)
+        ]
+
+        # Connect with bounded concurrency so the server is not hit by a SYN flood
+        semaphore = asyncio.Semaphore(args.connect_concurrency)
+
+        async def connect(client: BenchClient):
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    await client.connect(self.ws_url)
+                except Exception:
+                    self.connect_failures += 1
+                    return
+                self.connect_latencies.append(time.monotonic() - started)
+                self.clients.append(client)
+
+        connect_started = time.monotonic()
+        await asyncio.gather(*[connect(client) for client in clients])
+        connect_elapsed = time.monotonic() - connect_started
+
+        # Load a deck into every room so that edits apply
+        by_room: Dict[str, List[BenchClient]] = {}
+        for client in self.clients:
+            by_room.setdefault(client.room_id, []).append(client)
+        for room_clients in by_room.values():
+            await room_clients[0].websocket.send(json.dumps({"type": "set_deck", "slides": BENCH_DECK}))
+        await asyncio.sleep(1.0)
+
+        senders = [
+            client
+            for room_clients in by_room.values()
+            for client in room_clients[:args.senders_per_room]
+        ]
+
+        self.measuring = True
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*[self._send_loop(sender, deadline) for sender in senders])
+        # Let in-flight messages arrive
+        await asyncio.sleep(args.drain)
+        self.measuring = False
+        elapsed = time.monotonic() - started
+
+        expected = {"edit": 0, "chat": 0}
+        for room_id, room_sent in self.sent_by_room.items():
+            room_size = len(by_room[room_id])
+            # Edits reach every client in the room, chat everyone but the sender
+            expected["edit"] += room_sent["edit"] * room_size
+            expected["chat"] += room_sent["chat"] * (room_size - 1)
+
+        return {
+            "clients_connected": len(self.clients),
+            "connect_failures": self.connect_failures,
+            "connect_seconds": round(connect_elapsed, 3),
+            "connect_latency": summarize_latencies(self.connect_latencies),
+            "senders": len(senders),
+            "elapsed_seconds": round(elapsed, 3),
+            "messages_sent": dict(self.sent),
+            "send_failures": self.send_failures,
+            "deliveries": {kind: len(values) for kind, values in self.latencies.items()},
+            "expected_deliveries_without_coalescing": expected,
+            "deliveries_per_second": round(sum(len(values) for values in self.latencies.values()) / elapsed, 1),
+            "unexpected_disconnects": self.disconnects,
+            "fanout_latency": {kind: summarize_latencies(values) for kind, values in self.latencies.items()},
+        }
+
+    async def _send_loop(self, sender: BenchClient, deadline: float):
+        args = self.args
+        interval = 1.0 / args.rate
+        # Spread the senders over the first interval
+        await asyncio.sleep(random.uniform(0, interval))
+        next_send = time.monotonic()
+        room_sent = self.sent_by_room.setdefault(sender.room_id, {"edit": 0, "chat": 0})
+        while time.monotonic() < deadline:
+            kind = args.mix if args.mix != "both" else random.choice(("edit", "chat"))
+            try:
+                if kind == "edit":
+                    await sender.send_edit()
+                else:
+                    await sender.send_chat()
+                self.sent[kind] += 1
+                room_sent[kind] += 1
+            except websockets.ConnectionClosed:
+                self.send_failures += 1
+                return
+            next_send += interval
+            await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+
+    async def close(self):
+        self.stopping = True
+        await asyncio.gather(*[client.close() for client in self.clients], return_exceptions=True)
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    raise_open_file_limit()
+    backend_process = None
+    base_url = args.url
+    server_pid = args.server_pid
+
+    try:
+        if base_url is None:
+            backend_port = free_port()
+            base_url = f"http://127.0.0.1:{backend_port}"
+            backend_env = {"OPENAI_API_KEY": "sk-benchmark"}
+            for setting in args.backend_env:
+                name, _, value = setting.partition("=")
+                backend_env[name] = value
+            backend_process = start_process(
+                ["-m", "uvicorn", "backend.main:app", "--port", str(backend_port),
+                 "--log-level", "warning", "--backlog", "4096"],
+                backend_env,
+            )
+            server_pid = backend_process.pid
+            await wait_for_http(f"{base_url}/api/status")
+
+        ws_url = "ws" + base_url[len("http"):]
+        benchmark = WebSocketBenchmark(args, ws_url)
+        sampler = ProcessSampler(server_pid)
+        sampler.start()
+        try:
+            results = await benchmark.run()
+        finally:
+            results_server = await sampler.stop()
+            await benchmark.close()
+        results["server"] = results_server
+
+        async with httpx.AsyncClient(base_url=base_url, timeout=5.0) as client:
+            try:
+                response = await client.get("/api/collaboration/stats")
+                if response.status_code == 200:
+                    results["collaboration"] = response.json()
+            except httpx.HTTPError:
+                pass
+
+        return results
+    finally:
+        stop_process(backend_process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test collaboration WebSocket fan-out")
+    parser.add_argument("--url", default=None, help="Backend to test; by default a backend is started")
+    parser.add_argument("--server-pid", type=int, default=None, help="PID of the backend given by --url, to sample its CPU and memory")
+    parser.add_argument("--clients", type=int, default=500, help="Total WebSocket clients")
+    parser.add_argument("--rooms", type=int, default=10, help="Rooms the clients are spread over")
+    parser.add_argument("--senders-per-room", type=int, default=2, help="Clients per room that send messages")
+    parser.add_argument("--rate", type=float, default=5.0, help="Messages per second per sender")
+    parser.add_argument("--mix", choices=("edit", "chat", "both"), default="both", help="Kind of messages to send")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to send messages for")
+    parser.add_argument("--drain", type=float, default=2.0, help="Seconds to wait for in-flight messages after sending stops")
+    parser.add_argument("--connect-concurrency", type=int, default=100, help="Clients connecting at once")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Connection timeout in seconds")
+    parser.add_argument("--backend-env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Environment variable for the started backend, e.g. EDIT_FLUSH_INTERVAL_MS=0")
+    parser.add_argument("--output", default=None, help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    settings = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results("websocket-fanout", settings, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load-testing the
+backend without spending API credit.
+
+Answers POST /v1/chat/completions with a valid slides document, streamed or
+not, after a configurable latency. Slide regeneration requests get one
+slide per "Slide N:" section of the prompt. Upstream failures can be injected: a
+fraction of requests fail with 500, a fraction are rate limited with 429,
+and an optional requests-per-minute quota rate limits everything above it.
+
+Usage:
+    python -m tools.fake_openai --port 8199 --latency 0.8 --rate-limit-rate 0.05
+
+Then start the backend with OPENAI_BASE_URL=http://127.0.0.1:8199/v1.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeOpenAIConfig:
+    # Seconds before the response (or its first chunk) is sent
+    latency: float = 0.5
+    # Random extra latency, uniformly distributed in [0, jitter]
+    jitter: float = 0.0
+    # Delay between streamed chunks, in seconds
+    chunk_delay: float = 0.01
+    # Characters of the document per streamed chunk
+    chunk_size: int = 20
+    # Number of slides in every generated deck
+    slides: int = 5
+    # Fraction of requests answered with a 500
+    error_rate: float = 0.0
+    # Fraction of requests answered with a 429
+    rate_limit_rate: float = 0.0
+    # Requests per minute above which every request gets a 429 (None for no quota)
+    rpm: Optional[int] = None
+    # Retry-After sent with every 429, in seconds
+    retry_after: float = 1.0
+
+
+def build_document(prompt: str, slide_count: int) -> str:
+    """
+    Build the slides JSON document returned for a prompt.
+
+    Args:
+        prompt: The user prompt
+        slide_count: Number of slides to generate
+
+    Returns:
+        The document as a JSON string
+    """
+    topic = prompt[:60]
+    slides = [
+        {
+            "title": f"{topic} - part {index + 1}",
+            "content": [f"Point {point + 1} about {topic}" for point in range(4)],
+            "theme": "professional",
+        }
+        for index in range(slide_count)
+    ]
+    return json.dumps({"slides": slides})
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def create_app(config: FakeOpenAIConfig) -> FastAPI:
+    """
+    Create the fake API application.
+
+    Args:
+        config: Latency and failure injection settings
+
+    Returns:
+        The FastAPI application
+    """
+    app = FastAPI(title="Fake OpenAI API")
+    recent_requests: "deque[float]" = deque()
+    stats = {"requests": 0, "completed": 0, "errors": 0, "rate_limited": 0}
+
+    def rate_limited_response() -> JSONResponse:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={
+                "retry-after": str(max(1, round(config.retry_after))),
+                "retry-after-ms": str(int(config.retry_after * 1000)),
+            },
+        )
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+
+        if config.rpm is not None:
+            now = time.monotonic()
+            while recent_requests and now - recent_requests[0] > 60:
+                recent_requests.popleft()
+            if len(recent_requests) >= config.rpm:
+                return rate_limited_response()
+            recent_requests.append(now)
+
+        if random.random() < config.rate_limit_rate:
+            return rate_limited_response()
+        if random.random() < config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "Injected server error (fake)", "type": "server_error", "code": None}},
+                status_code=500,
+            )
+
+        messages = body.get("messages", [])
+        prompt = messages[-1]["content"] if messages else ""
+        # Regeneration prompts list each slide to rewrite as "Slide N:"
+        rewrite_count = len(re.findall(r"^Slide \d+:$", prompt, re.MULTILINE))
+        document = build_document("Rewritten slide" if rewrite_count else prompt, rewrite_count or config.slides)
+        usage = {
+            "prompt_tokens": estimate_tokens("".join(message.get("content", "") for message in messages)),
+            "completion_tokens": estimate_tokens(document),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = body.get("model", "gpt-4o")
+
+        await asyncio.sleep(config.latency + random.uniform(0, config.jitter))
+
+        if not body.get("stream"):
+            stats["completed"] += 1
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": document},
+                }],
+                "usage": usage,
+            }
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None) -> str:
+            payload = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def event_stream():
+            yield chunk({"role": "assistant", "content": ""})
+            for start in range(0, len(document), config.chunk_size):
+                yield chunk({"content": document[start:start + config.chunk_size]})
+                if config.chunk_delay:
+                    await asyncio.sleep(config.chunk_delay)
+            yield chunk({}, "stop")
+            if include_usage:
+                payload = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+            stats["completed"] += 1
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """
+    Add the FakeOpenAIConfig settings as command line options.
+
+    Args:
+        parser: The parser to extend
+    """
+    defaults = FakeOpenAIConfig()
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="Seconds before each response")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="Random extra latency, up to this many seconds")
+    parser.add_argument("--chunk-delay", type=float, default=defaults.chunk_delay, help="Seconds between streamed chunks")
+    parser.add_argument("--chunk-size", type=int, default=defaults.chunk_size, help="Characters per streamed chunk")
+    parser.add_argument("--slides", type=int, default=defaults.slides, help="Slides per generated deck")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="Fraction of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate, help="Fraction of requests failing with 429")
+    parser.add_argument("--rpm", type=int, default=None, help="Requests per minute above which requests get 429")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after, help="Retry-After seconds sent with 429s")
+
+
+def config_from_arguments(args: argparse.Namespace) -> FakeOpenAIConfig:
+    return FakeOpenAIConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        chunk_delay=args.chunk_delay,
+        chunk_size=args.chunk_size,
+        slides=args.slides,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        rpm=args.rpm,
+        retry_after=args.retry_after,
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8199, help="Port to listen on")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(config_from_arguments(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Local stand-in for a Redis server, for testing the collaboration backplane
+without installing Redis.
+
+Speaks enough of the Redis protocol (RESP2) for the backplane: PING, AUTH,
+PUBLISH, SUBSCRIBE and UNSUBSCRIBE. Messages are delivered to subscribers in
+publish order, as Redis does.
+
+Usage:
+    python -m tools.fake_redis --port 6379
+
+Then start each worker with BACKPLANE_URL=redis://127.0.0.1:6379.
+"""
+
+import argparse
+import asyncio
+from typing import Dict, List, Optional, Set
+
+
+class FakeRedisServer:
+    """
+    In-memory pub/sub server speaking the Redis protocol.
+    """
+
+    def __init__(self, password: Optional[str] = None):
+        self.password = password
+        self.channels: Dict[bytes, Set["_Client"]] = {}
+
+    async def serve(self, host: str, port: int):
+        """
+        Serve clients until cancelled.
+
+        Args:
+            host: The interface to listen on
+            port: The port to listen on
+        """
+        server = await asyncio.start_server(self._handle_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Client(writer, authenticated=self.password is None)
+        try:
+            while True:
+                command = await _read_command(reader)
+                if command is None:
+                    break
+                self._execute(client, command)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            for subscribers in self.channels.values():
+                subscribers.discard(client)
+            writer.close()
+
+    def _execute(self, client: "_Client", command: List[bytes]):
+        name = command[0].upper()
+        args = command[1:]
+
+        if name == b"AUTH":
+            if self.password is None or args[-1:] == [self.password.encode("utf-8")]:
+                client.authenticated = True
+                client.write_simple("OK")
+            else:
+                client.write_error("WRONGPASS invalid username-password pair")
+            return
+
+        if not client.authenticated:
+            client.write_error("NOAUTH Authentication required.")
+            return
+
+        if name == b"PING":
+            client.write_simple("PONG")
+        elif name == b"PUBLISH" and len(args) == 2:
+            channel, data = args
+            subscribers = self.channels.get(channel, set())
+            for subscriber in subscribers:
+                subscriber.write_array([b"message", channel, data])
+            client.write_integer(len(subscribers))
+        elif name == b"SUBSCRIBE" and args:
+            for channel in args:
+                self.channels.setdefault(channel, set()).add(client)
+                client.channels.add(channel)
+                client.write_array([b"subscribe", channel, len(client.channels)])
+        elif name == b"UNSUBSCRIBE":
+            for channel in args or list(client.channels):
+                self.channels.get(channel, set()).discard(client)
+                client.channels.discard(channel)
+                client.write_array([b"unsubscribe", channel, len(client.channels)])
+        else:
+            client.write_error(f"ERR unknown command '{name.decode('utf-8', 'replace')}'")
+
+
+class _Client:
+    """
+    One connected client and the channels it subscribed to.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, authenticated: bool):
+        self.writer = writer
+        self.authenticated = authenticated
+        self.channels: Set[bytes] = set()
+
+    def write_simple(self, value: str):
+        self.writer.write(f"+{value}\r\n".encode("utf-8"))
+
+    def write_error(self, message: str):
+        self.writer.write(f"-{message}\r\n".encode("utf-8"))
+
+    def write_integer(self, value: int):
+        self.writer.write(f":{value}\r\n".encode("utf-8"))
+
+    def write_array(self, items: list):
+        parts = [f"*{len(items)}\r\n".encode("utf-8")]
+        for item in items:
+            if isinstance(item, int):
+                parts.append(f":{item}\r\n".encode("utf-8"))
+            else:
+                parts.append(f"${len(item)}\r\n".encode("utf-8") + item + b"\r\n")
+        self.writer.write(b"".join(parts))
+
+
+async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    """
+    Read one command sent as a RESP array of bulk strings.
+
+    Returns:
+        The command and its arguments, or None if the client disconnected
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # Inline command, e.g. typed into telnet
+        return line.strip().split() or None
+
+    command = []
+    for _ in range(int(line[1:-2])):
+        header = await reader.readline()
+        if not header.startswith(b"$"):
+            raise ValueError("Expected a bulk string")
+        data = await reader.readexactly(int(header[1:-2]) + 2)
+        command.append(data[:-2])
+    return command
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Redis pub/sub stand-in for the collaboration backplane")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=6379, help="Port to listen on")
+    parser.add_argument("--password", default=None, help="Require AUTH with this password")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(FakeRedisServer(args.password).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()